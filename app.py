@@ -1,11 +1,95 @@
-from flask import Flask, flash, redirect, url_for, render_template, request, send_file, session
+from flask import Flask, Response, flash, redirect, url_for, render_template, request, session, jsonify
+from flask import get_flashed_messages, stream_template
+from markupsafe import Markup
 import os
+import secrets
+from functools import wraps
 from werkzeug.utils import secure_filename
-import shutil
+import sqlite3
+import atexit
+import mimetypes
+import threading
+import time
+from tempfile import SpooledTemporaryFile
+from listing import ChunkedRows, Listing, InvalidCursor, SORT_KEYS, decode_cursor, encode_cursor, sort_key
+from listing_cache import ListingCache
+from metadata_index import MetadataIndex, INTERNAL_DIR_NAME
+from search_index import TrigramIndex
+from fulltext import FullTextIndex, supervise_indexer
+from background import exclusive_lock, start_singleton_thread
+from chunked_upload import ChunkedUploadStore, UploadError
+from streaming_upload import StreamedUpload, StreamingUploadRequest, UploadStats
+from blob_store import BlobStore
+from file_responses import send_file_ranged
+from thumbnails import ThumbnailCache
+from zip_stream import stream_zip
+from trash import Trash, TrashError
+from assets import AssetPipeline
+from transfers import TransferError, TransferStore
+from text_viewer import LineIndexCache
+import fsops
+from metrics import Metrics, MetricsMiddleware
+from profiler import ProfilerError, ProfilerMiddleware, RequestProfiler
+from batch import ChangeSet, OperationError, check_operation, clean_path, parse_operations
 
 app = Flask(__name__)
+app.request_class = StreamingUploadRequest
 app.secret_key = "mysecretkey123"
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['LISTING_CACHE_MAX_BYTES'] = 64 * 1024 * 1024  # memory cap for cached directory listings
+app.config['LISTING_PAGE_SIZE'] = 100  # rows rendered per page of a folder listing
+app.config['LISTING_PAGE_SIZE_MAX'] = 500  # upper bound for the limit parameter of /api/files
+app.config['STREAMED_LISTINGS'] = True  # send folder pages while their rows are read and rendered
+app.config['STREAMED_LISTING_PAGE_SIZE'] = 5000  # rows of a streamed folder page, the rest load on scroll
+app.config['STREAMED_LISTING_CHUNK_SIZE'] = 250  # rows read, rendered and sent at a time
+
+# Filely's own state lives in a hidden folder inside uploads (same filesystem)
+STATE_DIR = os.path.join('uploads', INTERNAL_DIR_NAME)
+app.config['METADATA_INDEX_PATH'] = os.path.join(STATE_DIR, 'index.sqlite3')
+app.config['SEARCH_INDEX_PATH'] = None  # set to a file path to persist the search index across restarts
+app.config['SEARCH_PAGE_SIZE_MAX'] = 100
+app.config['FULLTEXT_INDEX_PATH'] = os.path.join(STATE_DIR, 'fulltext.sqlite3')
+app.config['FULLTEXT_WORKERS'] = 2  # processes extracting and tokenizing documents
+app.config['FULLTEXT_MAX_DOC_BYTES'] = 32 * 1024 * 1024  # bytes of a document read for indexing
+app.config['CHUNKED_UPLOAD_DIR'] = os.path.join(STATE_DIR, 'chunked')
+app.config['CHUNKED_UPLOAD_CHUNK_SIZE'] = 8 * 1024 * 1024  # default chunk size, must fit MAX_CONTENT_LENGTH
+app.config['CHUNKED_UPLOAD_MAX_SIZE'] = 64 * 1024 * 1024 * 1024  # 64GB max file size for chunked uploads
+app.config['STREAMING_UPLOADS'] = True  # write form uploads straight to disk instead of spooling then copying
+app.config['STREAMING_UPLOAD_DIR'] = os.path.join(STATE_DIR, 'incoming')
+app.config['DEDUP_STORAGE'] = False  # store identical files once, as hard links to a content-addressed blob
+app.config['BLOB_STORE_DIR'] = os.path.join(STATE_DIR, 'blobs')
+app.config['THUMBNAIL_CACHE_DIR'] = os.path.join(STATE_DIR, 'thumbs')
+app.config['THUMBNAIL_CACHE_MAX_BYTES'] = 256 * 1024 * 1024  # least recently used thumbnails are evicted past this
+app.config['THUMBNAIL_SIZE'] = 256  # longest side of a thumbnail in pixels
+app.config['THUMBNAIL_WORKERS'] = 2  # processes rendering thumbnails
+app.config['TRASH_DIR'] = os.path.join(STATE_DIR, 'trash')
+app.config['TRASH_RETENTION'] = 3600  # seconds deleted items can be restored before they are purged
+app.config['TRASH_PURGE_RATE'] = 2000  # files per second the background purger deletes
+app.config['ASSET_BUILD_DIR'] = os.path.join(app.static_folder, 'build')  # fingerprinted static files
+app.config['ASSET_MAX_AGE'] = 365 * 24 * 3600
+app.config['BATCH_MAX_OPERATIONS'] = 1000  # operations accepted by one /api/batch request
+app.config['TRANSFER_DIR'] = os.path.join(STATE_DIR, 'transfers')
+app.config['TRANSFER_SYNC_MAX_BYTES'] = 64 * 1024 * 1024  # larger copies run in the background
+app.config['TRANSFER_SYNC_MAX_FILES'] = 1000  # and so do copies of more files
+app.config['TEXT_VIEWER_MAX_LINES'] = 1000  # lines returned by one /api/text request
+app.config['TEXT_VIEWER_MAX_LINE_BYTES'] = 16 * 1024  # longer lines are cut
+app.config['TEXT_VIEWER_CACHE_ENTRIES'] = 64  # line indexes kept in memory
+app.config['METRICS_DIR'] = os.path.join(STATE_DIR, 'metrics')  # one shard per worker process
+app.config['FS_OPS_HEADERS'] = True  # report each response's filesystem calls in X-Filely-Fs-Ops and Server-Timing
+app.config['PROFILER_DIR'] = os.path.join(STATE_DIR, 'profiles')  # profiler settings and one shard per process
+app.config['ADMIN_USERS'] = {'hadjhassinejawher'}  # users allowed to profile the server
+app.config['ADMIN_TOKEN'] = os.environ.get('FILELY_ADMIN_TOKEN')  # X-Admin-Token for scripts, unset to disable
+
+metrics = Metrics(app.config['METRICS_DIR'])
+listing_cache = ListingCache(
+    app.config['LISTING_CACHE_MAX_BYTES'],
+    on_change=lambda name, delta: metrics.inc(
+        f"filely_listing_cache_{name}{'' if name in ('entries', 'bytes') else '_total'}", delta))
+line_index_cache = LineIndexCache(app.config['TEXT_VIEWER_CACHE_ENTRIES'])
+profiler = RequestProfiler(app.config['PROFILER_DIR'])
+app.wsgi_app = MetricsMiddleware(ProfilerMiddleware(app.wsgi_app, profiler, app.url_map), metrics)
+asset_pipeline = AssetPipeline(app.static_folder, app.config['ASSET_BUILD_DIR'])
+asset_pipeline.build()
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {
@@ -27,76 +111,443 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Extension and category lookups, built once: extension -> category -> icon.
+# Icons are symbol ids in static/icons.svg, rendered with <use>.
+EXTENSION_CATEGORIES = {ext: category for category, extensions in FILE_CATEGORIES.items()
+                        for ext in extensions}
+CATEGORY_ICONS = {
+    'image': 'icon-image',
+    'document': 'icon-document',
+    'archive': 'icon-archive',
+    'video': 'icon-video',
+    'audio': 'icon-audio'
+}
+FOLDER_ICON = 'icon-folder'
+
 def get_file_category(filename):
     ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-    for category, extensions in FILE_CATEGORIES.items():
-        if ext in extensions:
-            return category
-    return 'other'
+    return EXTENSION_CATEGORIES.get(ext, 'other')
 
 def get_file_icon(filename):
-    category = get_file_category(filename)
-    icons = {
-        'image': '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><rect x="3" y="3" width="18" height="18" rx="2" ry="2"/><circle cx="9" cy="9" r="2"/><path d="m21 15-3.086-3.086a2 2 0 0 0-2.828 0L6 21"/></svg>',
-        'document': '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M14 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V8z"/><path d="M14 2v6h6"/><path d="M16 13H8"/><path d="M16 17H8"/><path d="M10 9H8"/></svg>',
-        'archive': '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><polyline points="21,8 21,21 3,21 3,8"/><rect x="1" y="3" width="22" height="5"/><line x1="10" y1="12" x2="14" y2="12"/></svg>',
-        'video': '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><polygon points="23,7 16,12 23,17 23,7"/><rect x="1" y="5" width="15" height="14" rx="2" ry="2"/></svg>',
-        'audio': '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M9 18V5l12-2v13"/><circle cx="6" cy="18" r="3"/><circle cx="18" cy="16" r="3"/></svg>'
-    }
-    return icons.get(category, '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M14 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V8z"/><path d="M14 2v6h6"/><path d="M16 13H8"/><path d="M16 17H8"/><path d="M10 9H8"/></svg>')
+    return CATEGORY_ICONS.get(get_file_category(filename), 'icon-document')
 
-def get_folder_contents(path):
-    """Get files and folders in a given path"""
+def scan_folder(path):
+    """Read the files and folders in a given path from disk
+
+    The listing is built in a single os.scandir pass and reuses the type
+    information returned with each DirEntry. Syscall budget per listed entry:
+
+    - file:   1 stat (size and mtime; free on Windows where scandir caches it)
+    - folder: 1 stat (mtime); recursive size, file count and child count come
+              from metadata_index, they are left out for folders it does not
+              know yet rather than reading them
+
+    plus one open/getdents/close for the directory itself and one indexed
+    query for the folder aggregates.
+    """
     items = []
-    
-    try:
-        # Ensure path exists
-        if not os.path.exists(path):
-            os.makedirs(path, exist_ok=True)
-            
-        for item in os.listdir(path):
-            item_path = os.path.join(path, item)
-            is_directory = os.path.isdir(item_path)
-            
+    aggregates = metadata_index.folder_aggregates(index_path(path))
+
+    with fsops.scandir(path) as it:
+        for entry in it:
+            if entry.name == INTERNAL_DIR_NAME:
+                continue
+
+            try:
+                is_directory = entry.is_dir()
+            except OSError:
+                is_directory = False
+
+            try:
+                stat = fsops.entry_stat(entry)
+                mtime = stat.st_mtime
+            except OSError:
+                stat = None
+                mtime = 0
+
             if is_directory:
                 # It's a folder
-                try:
-                    item_count = len(os.listdir(item_path))
-                except:
-                    item_count = 0
-                    
+                size, file_count, item_count = aggregates.get(entry.name, (0, 0, None))
                 items.append({
-                    'name': item,
+                    'name': entry.name,
                     'type': 'folder',
-                    'icon': '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M22 19a2 2 0 0 1-2 2H4a2 2 0 0 1-2-2V5a2 2 0 0 1 2-2h5l2 3h9a2 2 0 0 1 2 2z"/></svg>',
-                    'size': '-',
-                    'item_count': item_count,
-                    'path': item_path
+                    'icon': FOLDER_ICON,
+                    'size': size,
+                    'file_count': file_count,
+                    'item_count': item_count,  # None until the index knows the folder
+                    'mtime': mtime,
+                    'path': entry.path
                 })
             else:
                 # It's a file
-                try:
-                    file_size = os.path.getsize(item_path)
-                except:
-                    file_size = 0
-                    
-                file_category = get_file_category(item)
-                file_icon = get_file_icon(item)
-                
                 items.append({
-                    'name': item,
+                    'name': entry.name,
                     'type': 'file',
-                    'icon': file_icon,
-                    'size': file_size,
-                    'category': file_category,
-                    'path': item_path
+                    'icon': get_file_icon(entry.name),
+                    'size': stat.st_size if stat is not None else 0,
+                    'category': get_file_category(entry.name),
+                    'mtime': mtime,
+                    'path': entry.path
                 })
+
+    # Sort: folders first, then files
+    items.sort(key=lambda x: (x['type'] != 'folder', x['name'].lower(), x['name']))
+    return Listing(items)
+
+def get_folder_contents(path):
+    """Get files and folders in a given path
+
+    Listings are served from listing_cache when the directory's inode and
+    mtime are unchanged, so a hot folder costs a single stat plus a look at
+    the change log for what other workers changed below it. Used for the
+    folders the metadata index does not know yet, and for every folder
+    page when STREAMED_LISTINGS is off.
+    """
+    try:
+        sync_listing_cache()
+        try:
+            validator = ListingCache.validator(fsops.stat(path))
+        except FileNotFoundError:
+            # Ensure path exists
+            make_folders(path)
+            validator = ListingCache.validator(fsops.stat(path))
+
+        items = listing_cache.get(path, validator)
+        if items is None:
+            items = scan_folder(path)
+            listing_cache.put(path, validator, items)
+        return items
     except Exception as e:
         flash(f'Error reading directory: {str(e)}', 'error')
-    
-    # Sort: folders first, then files
-    items.sort(key=lambda x: (x['type'] != 'folder', x['name'].lower()))
-    return items
+        return Listing([])
+
+def invalidate_listing(path, recursive=False):
+    """Drop cached listings after path was modified
+
+    The listings of every ancestor are dropped too since they show the
+    recursive size and item counts of the folder leading to path. Pass
+    recursive=True when a folder was removed or renamed so that the
+    listings of everything below it go as well.
+    """
+    path = os.path.normpath(path)
+    listing_cache.invalidate(path, recursive=recursive)
+    root = os.path.normpath('uploads')
+    while path != root and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+        listing_cache.invalidate(path)
+
+def refresh_indexed_folder(parent):
+    """Rescan an indexed folder before listing it if it changed outside Filely
+
+    The metadata index is authoritative for the listings it serves (folder
+    pages with STREAMED_LISTINGS and /api/files); a folder whose mtime on
+    disk no longer matches the index is rescanned first.
+    """
+    if metadata_index.refresh_folder(parent):
+        metrics.inc('filely_listing_rescans_total')
+        invalidate_listing(metadata_index.disk_path(parent))
+
+def index_path(path):
+    """Path of a file or folder under uploads as used by metadata_index"""
+    return MetadataIndex.relative(path, 'uploads')
+
+def top_missing_folder(path):
+    """Highest folder of path and its ancestors under uploads that does not exist, or None"""
+    top = None
+    folder = os.path.normpath(path)
+    while folder.startswith('uploads' + os.sep) and not fsops.isdir(folder):
+        top, folder = folder, os.path.dirname(folder)
+    return top
+
+def make_folders(path):
+    """Create a folder under uploads with its missing parents and record them"""
+    top = top_missing_folder(path)
+    fsops.makedirs(path, exist_ok=True)
+    if top is not None:
+        record_changes(created=[top])
+
+def uploads_path(path):
+    """Disk path of a path below uploads taken from a request
+
+    Raises OperationError for '..', empty parts, the internal folder and
+    for paths a symlink takes outside of uploads.
+    """
+    full_path = os.path.join('uploads', clean_path(path))
+    root = os.path.realpath('uploads')
+    if os.path.commonpath([root, os.path.realpath(full_path)]) != root:
+        raise OperationError('Invalid path!')
+    return full_path
+
+def request_path(path):
+    """uploads_path() for the page routes, None when path is invalid"""
+    try:
+        return uploads_path(path)
+    except OperationError:
+        return None
+
+def item_from_row(row):
+    """Build a listing item from a metadata_index row"""
+    if row['type'] == 'folder':
+        return {
+            'name': row['name'],
+            'type': 'folder',
+            'icon': FOLDER_ICON,
+            'size': row['size'],
+            'file_count': row['file_count'],
+            'item_count': row['item_count'],
+            'mtime': row['mtime'],
+            'path': metadata_index.disk_path(row['path'])
+        }
+    return {
+        'name': row['name'],
+        'type': 'file',
+        'icon': get_file_icon(row['name']),
+        'size': row['size'],
+        'category': row['category'],
+        'mtime': row['mtime'],
+        'path': metadata_index.disk_path(row['path'])
+    }
+
+def record_changes(created=(), removed=(), moved=(), content_hashes=None):
+    """Propagate changes a route made under uploads
+
+    The metadata index and its change log are updated in a single
+    transaction, which the search index replays before the next search,
+    then the listing cache and the other indexes follow; thumbnails are
+    queued for a background thread. Removing a folder costs the same
+    whatever its size: the rows below it are pruned in the background.
+
+    Paths are disk paths (uploads/...); moved holds (old_path, new_path)
+    pairs and content_hashes the sha256 of created files, or files in
+    created folders, that are already known so they are not read again.
+
+    With deduplicating storage, created files become references to their
+    blob before they are indexed and blobs left unreferenced are released.
+    """
+    content_hashes = dict(content_hashes or {})
+    released_hashes = set()
+    if blob_store is not None:
+        for path in created:
+            if fsops.isfile(path):
+                replaced = metadata_index.get(index_path(path))
+                if replaced is not None and replaced['content_hash']:
+                    released_hashes.add(replaced['content_hash'])
+                content_hashes[path] = blob_store.add(path, content_hashes.get(path))
+            else:
+                for dirpath, _, filenames in fsops.walk(path):
+                    for name in filenames:
+                        file_path = os.path.join(dirpath, name)
+                        content_hashes[file_path] = blob_store.add(file_path, content_hashes.get(file_path))
+        for path in removed:
+            released_hashes.update(metadata_index.content_hashes(index_path(path)))
+
+    # The change log gets one entry per path, a folder standing for its whole subtree
+    added = []
+    removed_entries = []
+    created_files = []
+    indexed_hashes = {index_path(path): content_hash for path, content_hash in content_hashes.items()}
+    with metadata_index.transaction() as tx:
+        for path in created:
+            if fsops.isdir(path):
+                tx.insert_tree(index_path(path), indexed_hashes)
+                created_files.extend(entry for entry, is_folder in metadata_index.subtree(index_path(path))
+                                     if not is_folder)
+                added.append((index_path(path), True))
+            else:
+                tx.upsert_file(index_path(path), content_hashes.get(path))
+                created_files.append(index_path(path))
+                added.append((index_path(path), False))
+        for path in removed:
+            row = metadata_index.get(index_path(path))
+            removed_entries.append((index_path(path), row is None or not row['is_file']))
+            tx.remove(index_path(path))
+        for old_path, new_path in moved:
+            is_folder = fsops.isdir(new_path)
+            removed_entries.append((index_path(old_path), is_folder))
+            tx.move(index_path(old_path), index_path(new_path))
+            added.append((index_path(new_path), is_folder))
+        tx.log_changes(added=added, removed=removed_entries)
+
+    if released_hashes:
+        blob_store.release(released_hashes)
+
+    for path in created:
+        invalidate_listing(path)
+    for path in removed:
+        invalidate_listing(path, recursive=True)
+    for old_path, new_path in moved:
+        invalidate_listing(old_path, recursive=True)
+        invalidate_listing(new_path)
+
+    for path in created_files:
+        fulltext_index.enqueue(path)
+        thumbnail_cache.enqueue(metadata_index.disk_path(path))
+    for path in removed:
+        fulltext_index.remove(index_path(path))
+    for old_path, new_path in moved:
+        fulltext_index.move(index_path(old_path), index_path(new_path))
+
+def save_upload(file, file_path):
+    """Save a form upload to file_path and record it in upload_stats
+
+    Streamed parts are already on disk and only get renamed. Returns the
+    sha256 of the file when it was computed on the way, else None.
+    """
+    if isinstance(file.stream, StreamedUpload):
+        size, content_hash, seconds = file.stream.commit(file_path)
+        upload_stats.record(size, size, seconds)
+        app.logger.info('Streamed upload %s: %d bytes in %.3fs', file_path, size, seconds)
+        return content_hash
+
+    started = time.perf_counter()
+    if blob_store is not None and fsops.isfile(file_path):
+        fsops.remove(file_path)  # may be a shared blob, never overwrite it in place
+    file.save(file_path)
+    seconds = time.perf_counter() - started
+    size = fsops.getsize(file_path)
+    # Werkzeug spools parts over 500KB to a temporary file before this copy
+    spooled = isinstance(file.stream, SpooledTemporaryFile) and file.stream._rolled
+    upload_stats.record(size, size * 2 if spooled else size, seconds)
+    return None
+
+def serve_file(full_path, **kwargs):
+    """Send a file with range and conditional request support
+
+    The indexed content hash is used as ETag while the index row still
+    matches the file on disk, so identical files share cache entries.
+    """
+    stat = fsops.stat(full_path)
+    row = metadata_index.get(index_path(full_path))
+    etag = None
+    if row is not None and row['content_hash'] and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime:
+        etag = row['content_hash']
+    return send_file_ranged(full_path, etag=etag, **kwargs)
+
+# Marks where a streamed page is flushed to the client, see stream_page
+STREAM_FLUSH = Markup('<!-- flush -->')
+
+def stream_page(template_name, **context):
+    """Render a template as a streamed response
+
+    The output is sent in pieces, one wherever the template renders
+    {{ stream_flush }}, instead of once the whole page is rendered.
+    """
+    # The session is saved before the body is sent, flashed messages have
+    # to be taken out of it now
+    get_flashed_messages(with_categories=True)
+    pieces = stream_template(template_name, stream_flush=STREAM_FLUSH, **context)
+
+    def generate():
+        buffered = []
+        for piece in pieces:
+            if piece == STREAM_FLUSH:
+                yield ''.join(buffered)
+                buffered = []
+            else:
+                buffered.append(piece)
+        yield ''.join(buffered)
+
+    return Response(generate(), mimetype='text/html')
+
+def load_search_index():
+    """Build the filename search index from the metadata index
+
+    When SEARCH_INDEX_PATH is set, a saved index is loaded and synced
+    instead of being rebuilt, and it is saved again on exit.
+    """
+    global search_index_seq
+    search_index_seq = metadata_index.last_change()
+    persist_path = app.config['SEARCH_INDEX_PATH']
+    index = TrigramIndex.load(persist_path) if persist_path else None
+    if index is None:
+        index = TrigramIndex()
+        for path, is_folder in metadata_index.iter_paths():
+            index.add(path, is_folder)
+    else:
+        index.sync(metadata_index.iter_paths())
+    if persist_path:
+        atexit.register(index.save, persist_path)
+    return index
+
+def sync_search_index():
+    """Replay the metadata change log into this process's search index
+
+    Every process keeps its own in-memory search index, so changes made by
+    other workers reach it through the log, before each search. A folder's
+    entry stands for its whole subtree, whose paths are read back from the
+    metadata index when it was added.
+    """
+    global search_index_seq
+    with search_sync_lock:
+        changes, seq = metadata_index.changes_since(search_index_seq)
+        if changes is None:
+            search_index.sync(metadata_index.iter_paths())
+        else:
+            for path, is_folder, removed in changes:
+                if removed and is_folder:
+                    search_index.remove_tree(path)
+                elif removed:
+                    search_index.remove(path)
+                elif is_folder:
+                    for entry, entry_is_folder in metadata_index.subtree(path):
+                        search_index.add(entry, entry_is_folder)
+                else:
+                    search_index.add(path, is_folder)
+        search_index_seq = seq
+
+def sync_listing_cache():
+    """Drop the cached listings other processes changed since the last call
+
+    The directory mtime validating a cached listing misses changes deeper
+    down, such as the recursive sizes shown for subfolders. Workers drop
+    their own on the spot, those of the others come through the change log.
+    """
+    global listing_cache_seq
+    with listing_sync_lock:
+        changes, seq = metadata_index.changes_since(listing_cache_seq)
+        if changes is None:
+            listing_cache.clear()
+        else:
+            for path, is_folder, removed in changes:
+                invalidate_listing(metadata_index.disk_path(path), recursive=removed and is_folder)
+        listing_cache_seq = seq
+
+def reconcile_on_startup():
+    """Bring the indexes in line with the disk once per server start
+
+    gunicorn's master names each server start in FILELY_SERVER_ID (see
+    gunicorn.conf.py), which the marker records: the first worker to get
+    the lock reconciles and the others, including those a HUP reload
+    starts later, find it done. Without a name, as with the development
+    server, a process reconciles unless the marker is newer than its start.
+    """
+    server_id = os.environ.get('FILELY_SERVER_ID', '')
+    started = time.time()
+    marker_path = os.path.join(STATE_DIR, 'reconciled')
+    with exclusive_lock(os.path.join(STATE_DIR, 'reconcile.lock')):
+        try:
+            with open(marker_path) as f:
+                marker = f.read()
+            if marker == server_id if server_id else os.stat(marker_path).st_mtime >= started:
+                return
+        except FileNotFoundError:
+            pass
+        metadata_index.reconcile()
+        fulltext_index.sync(metadata_index.iter_files())
+        with open(marker_path, 'w') as f:
+            f.write(server_id)
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file under its fingerprinted, immutable name"""
+    fingerprinted = asset_pipeline.url_name(filename)
+    if fingerprinted is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=fingerprinted)
+
+@app.context_processor
+def inject_thumbnails():
+    return {'thumbnails_enabled': thumbnail_cache.available}
 
 def get_breadcrumbs(current_path):
     """Generate breadcrumb navigation"""
@@ -120,6 +571,153 @@ def get_breadcrumbs(current_path):
 if not os.path.exists('uploads'):
     os.makedirs('uploads')
 
+# Mirror the uploads tree in the metadata index, catching up with any change
+# made while the app was not running
+metadata_index = MetadataIndex(app.config['METADATA_INDEX_PATH'], 'uploads', get_file_category)
+fulltext_index = FullTextIndex(app.config['FULLTEXT_INDEX_PATH'], 'uploads',
+                               workers=app.config['FULLTEXT_WORKERS'],
+                               max_doc_bytes=app.config['FULLTEXT_MAX_DOC_BYTES'])
+reconcile_on_startup()
+search_sync_lock = threading.Lock()
+listing_sync_lock = threading.Lock()
+listing_cache_seq = metadata_index.last_change()
+search_index = load_search_index()
+upload_store = ChunkedUploadStore(app.config['CHUNKED_UPLOAD_DIR'])
+upload_stats = UploadStats()
+blob_store = BlobStore(app.config['BLOB_STORE_DIR']) if app.config['DEDUP_STORAGE'] else None
+thumbnail_cache = ThumbnailCache(app.config['THUMBNAIL_CACHE_DIR'],
+                                 app.config['THUMBNAIL_CACHE_MAX_BYTES'],
+                                 max_size=app.config['THUMBNAIL_SIZE'],
+                                 workers=app.config['THUMBNAIL_WORKERS'])
+trash = Trash(app.config['TRASH_DIR'],
+              retention=app.config['TRASH_RETENTION'],
+              rate=app.config['TRASH_PURGE_RATE'],
+              on_purged=blob_store.release if blob_store is not None else None)
+transfer_store = TransferStore(app.config['TRANSFER_DIR'])
+
+# Background services run in threads, which do not survive a fork, so they
+# are started by the first request each process serves
+background_services_pid = None
+
+@app.before_request
+def start_background_services():
+    global background_services_pid
+    if background_services_pid == os.getpid():
+        return
+    background_services_pid = os.getpid()
+    start_singleton_thread(os.path.join(STATE_DIR, 'trash.lock'), trash.run_forever, 'trash-purger')
+    start_singleton_thread(os.path.join(STATE_DIR, 'prune.lock'), metadata_index.prune_forever, 'index-pruner')
+    # Only one process runs the indexer, it resumes from the pending documents
+    start_singleton_thread(os.path.join(STATE_DIR, 'fulltext.lock'),
+                           lambda: supervise_indexer(os.path.abspath(app.config['FULLTEXT_INDEX_PATH']),
+                                                     os.path.abspath('uploads'),
+                                                     app.config['FULLTEXT_WORKERS'],
+                                                     app.config['FULLTEXT_MAX_DOC_BYTES']),
+                           'fulltext-indexer')
+
+@app.before_request
+def track_request():
+    # Labels the request in MetricsMiddleware, which sees it before routing
+    endpoint = request.endpoint or 'unmatched'
+    request.environ['filely.endpoint'] = endpoint
+    request.environ['filely.fs_ops'] = fsops.track()
+    metrics.inc('filely_http_requests_in_flight', endpoint=endpoint)
+
+@app.after_request
+def add_fs_ops_headers(response):
+    # Calls made while a streamed body is sent come after the headers, they only reach the metrics
+    fs_ops = request.environ.get('filely.fs_ops')
+    if fs_ops is not None and app.config['FS_OPS_HEADERS']:
+        response.headers['X-Filely-Fs-Ops'] = fs_ops.header()
+        if any(fs_ops.counts.values()):
+            response.headers['Server-Timing'] = fs_ops.server_timing()
+    return response
+
+# Set once this process has warmed up, see warm_up() and /readyz
+worker_ready = False
+
+def warm_up():
+    """Get this process ready to serve before it takes traffic
+
+    Called by each gunicorn worker after it loads the app (see
+    gunicorn.conf.py) and before the development server starts.
+    """
+    global worker_ready
+    sync_search_index()
+    with app.test_request_context('/files'):
+        get_folder_contents('uploads')
+    for template in ('files.html', 'item_rows.html', 'login.html'):
+        app.jinja_env.get_template(template)
+    worker_ready = True
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and answering requests"""
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics of every worker process in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def admin_required(view):
+    """Only let through users in ADMIN_USERS, or requests carrying ADMIN_TOKEN"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = app.config['ADMIN_TOKEN']
+        if session.get('username') not in app.config['ADMIN_USERS'] and not (
+                token and secrets.compare_digest(request.headers.get('X-Admin-Token', ''), token)):
+            return jsonify({'error': 'Admin access required!'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.errorhandler(ProfilerError)
+def handle_profiler_error(e):
+    return jsonify({'error': str(e)}), e.status
+
+@app.route('/admin/profiler', methods=['GET', 'POST', 'DELETE'])
+@admin_required
+def profiler_settings():
+    """Show (GET), change (POST, JSON settings) or clear (DELETE) the request profiler"""
+    if request.method == 'POST':
+        changes = request.get_json(silent=True)
+        if not isinstance(changes, dict):
+            raise ProfilerError('Expected a JSON object of settings!')
+        if changes.get('endpoint') and changes['endpoint'] not in app.view_functions:
+            raise ProfilerError(f"Unknown endpoint: {changes['endpoint']}")
+        settings = profiler.update(**changes)
+    elif request.method == 'DELETE':
+        settings = profiler.clear()
+    else:
+        settings = profiler.settings()
+    return jsonify({'settings': settings, 'pid': os.getpid(), 'profiled_requests': profiler.profiled_requests})
+
+@app.route('/admin/profiler/profile.pstats')
+@admin_required
+def profiler_pstats():
+    """cProfile statistics of the profiled requests, load with pstats.Stats(path)"""
+    return Response(profiler.pstats_dump(), mimetype='application/octet-stream',
+                    headers={'Content-Disposition': 'attachment; filename=filely.pstats'})
+
+@app.route('/admin/profiler/profile.collapsed')
+@admin_required
+def profiler_collapsed():
+    """Sampled stacks of the profiled requests, the input of flamegraph.pl"""
+    return Response(profiler.collapsed_stacks(), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=filely.collapsed'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: warmed up, with the metadata index and uploads folder usable"""
+    checks = {'warmed_up': worker_ready, 'uploads': os.access('uploads', os.R_OK | os.W_OK)}
+    try:
+        metadata_index.conn.execute('SELECT 1')
+        checks['metadata_index'] = True
+    except sqlite3.Error:
+        checks['metadata_index'] = False
+    ready = all(checks.values())
+    return jsonify({'ready': ready, 'pid': os.getpid(), 'checks': checks}), 200 if ready else 503
+
 # Simple user database
 users = {
     "hadjhassinejawher": "ChangeIt"
@@ -151,25 +749,28 @@ def login():
 @app.route('/files/<path:folder_path>', methods=['GET', 'POST'])
 def files(folder_path):
     # Build current path safely
-    current_path = os.path.join('uploads', folder_path)
-    
-    # Ensure path is within uploads directory and exists
-    if not os.path.exists(current_path):
-        try:
-            os.makedirs(current_path, exist_ok=True)
-        except Exception as e:
-            flash(f'Error creating directory!', 'error')
-            return redirect(url_for('files'))
+    current_path = request_path(folder_path)
+    if current_path is None:
+        flash('Folder not found!', 'error')
+        return redirect(url_for('files'))
     
     # Handle POST requests (file uploads and folder creation)
     if request.method == 'POST':
+        # Ensure path is within uploads directory and exists
+        if not fsops.exists(current_path):
+            try:
+                make_folders(current_path)
+            except Exception as e:
+                flash(f'Error creating directory!', 'error')
+                return redirect(url_for('files'))
+
         # Handle folder creation
         if 'new_folder_name' in request.form:
             new_folder_name = secure_filename(request.form['new_folder_name'].strip())
             if new_folder_name:
                 new_folder_path = os.path.join(current_path, new_folder_name)
                 try:
-                    os.makedirs(new_folder_path, exist_ok=True)
+                    make_folders(new_folder_path)
                     flash(f'Folder created successfully!', 'success')
                 except Exception as e:
                     flash(f'Error creating folder!', 'error')
@@ -180,7 +781,8 @@ def files(folder_path):
         # Handle file upload
         elif 'files' in request.files:
             files = request.files.getlist('files')
-            uploaded_count = 0
+            uploaded_paths = []
+            content_hashes = {}
             
             for file in files:
                 if file.filename == '':
@@ -189,29 +791,495 @@ def files(folder_path):
                 if file and allowed_file(file.filename):
                     filename = secure_filename(file.filename)
                     try:
-                        file.save(os.path.join(current_path, filename))
-                        uploaded_count += 1
+                        file_path = os.path.join(current_path, filename)
+                        content_hashes[file_path] = save_upload(file, file_path)
+                        uploaded_paths.append(file_path)
                     except Exception as e:
                         flash(f'Error saving file!', 'error')
                 else:
                     flash('Type not supported!', 'error')
             
-            if uploaded_count > 0:
+            if uploaded_paths:
+                record_changes(created=uploaded_paths, content_hashes=content_hashes)
                 flash(f'Files uploaded successfully!', 'success')
             return redirect(url_for('files', folder_path=folder_path))
     
-    # Get items in current directory
-    items = get_folder_contents(current_path)
+    # Get items in current directory, further pages are fetched from /api/files
+    parent = index_path(current_path)
     breadcrumbs = get_breadcrumbs(folder_path)
-    
     username = session.get('username')
-    
-    return render_template('files.html', 
-                         items=items, 
-                         current_path=folder_path,
-                         breadcrumbs=breadcrumbs,
-                         username=username,
-                         allowed_extensions=list(ALLOWED_EXTENSIONS))
+    context = dict(total_size=metadata_index.total_size(parent),
+                   current_path=folder_path,
+                   breadcrumbs=breadcrumbs,
+                   username=username,
+                   allowed_extensions=list(ALLOWED_EXTENSIONS),
+                   chunked_upload_threshold=app.config['CHUNKED_UPLOAD_CHUNK_SIZE'])
+
+    refresh_indexed_folder(parent)
+    if app.config['STREAMED_LISTINGS'] and (not parent or metadata_index.get(parent) is not None):
+        # Rows are read from the metadata index one chunk at a time while
+        # the head of the page is already on its way
+        def fetch(after, limit):
+            return [item_from_row(row) for row in metadata_index.list_children(parent, after=after, limit=limit)]
+
+        folder_count, file_count = metadata_index.count_children(parent)
+        metrics.observe('filely_listing_entries', folder_count + file_count, endpoint='files')
+        rows = ChunkedRows(fetch, limit=app.config['STREAMED_LISTING_PAGE_SIZE'],
+                           chunk_size=app.config['STREAMED_LISTING_CHUNK_SIZE'])
+        return stream_page('files.html', rows=rows, folder_count=folder_count, file_count=file_count, **context)
+
+    listing = get_folder_contents(current_path)
+    metrics.observe('filely_listing_entries', len(listing), endpoint='files')
+
+    def fetch(after, limit):
+        return listing.page(cursor=encode_cursor(after) if after else None, limit=limit)[0]
+
+    rows = ChunkedRows(fetch, limit=app.config['LISTING_PAGE_SIZE'], chunk_size=app.config['LISTING_PAGE_SIZE'])
+    return render_template('files.html', rows=rows, folder_count=listing.folder_count,
+                           file_count=listing.file_count, **context)
+
+@app.route('/api/files', defaults={'folder_path': ''})
+@app.route('/api/files/<path:folder_path>')
+def api_list_files(folder_path):
+    """Return one page of a folder listing as JSON
+
+    Query parameters: sort (name, size, mtime, type), order (asc, desc),
+    limit (capped at LISTING_PAGE_SIZE_MAX), cursor (next_cursor of the
+    previous page) and format=html to also get the rendered table rows.
+    """
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    if sort not in SORT_KEYS or order not in ('asc', 'desc'):
+        return jsonify({'error': 'Invalid sort or order!'}), 400
+    try:
+        limit = int(request.args.get('limit', app.config['LISTING_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit!'}), 400
+    limit = max(1, min(limit, app.config['LISTING_PAGE_SIZE_MAX']))
+
+    parent = folder_path.strip('/')
+    refresh_indexed_folder(parent)
+    if parent and metadata_index.get(parent) is None:
+        return jsonify({'error': 'Folder not found!'}), 404
+
+    # Served from the metadata index: one keyset query per page
+    try:
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+        rows = metadata_index.list_children(parent, sort, order, after, limit + 1)
+    except (InvalidCursor, sqlite3.Error):
+        return jsonify({'error': 'Malformed cursor'}), 400
+
+    items = [item_from_row(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(sort_key(items[-1], sort)) if len(rows) > limit else None
+    folder_count, file_count = metadata_index.count_children(parent)
+    metrics.observe('filely_listing_entries', folder_count + file_count, endpoint='api_list_files')
+
+    result = {
+        'path': folder_path,
+        'items': [{
+            'name': item['name'],
+            'type': item['type'],
+            'size': item['size'],
+            'item_count': item.get('item_count'),
+            'file_count': item.get('file_count'),
+            'category': item.get('category', 'folder'),
+            'mtime': item['mtime'],
+            'path': f'{folder_path}/{item["name"]}' if folder_path else item['name']
+        } for item in items],
+        'next_cursor': next_cursor,
+        'total': folder_count + file_count,
+        'folder_count': folder_count,
+        'file_count': file_count
+    }
+    if request.args.get('format') == 'html':
+        result['html'] = render_template('item_rows.html', items=items, current_path=folder_path)
+    return jsonify(result)
+
+@app.route('/api/search')
+def api_search():
+    """Search file and folder paths
+
+    Query parameters: q (case-insensitive substring), ext (only files with
+    that extension), offset and limit (capped at SEARCH_PAGE_SIZE_MAX).
+    """
+    query = request.args.get('q', '').strip()
+    extension = request.args.get('ext', '').strip() or None
+    if not query and not extension:
+        return jsonify({'error': 'Please enter a search term!'}), 400
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'Invalid offset or limit!'}), 400
+    limit = max(1, min(limit, app.config['SEARCH_PAGE_SIZE_MAX']))
+
+    sync_search_index()
+    total, results = search_index.search(query, extension, offset, limit)
+    next_offset = offset + len(results)
+    return jsonify({
+        'query': query,
+        'ext': extension,
+        'total': total,
+        'results': results,
+        'next_offset': next_offset if next_offset < total else None
+    })
+
+@app.route('/api/fulltext')
+def api_fulltext_search():
+    """Search the contents of text and PDF documents
+
+    Query parameters: q (all words must match), offset and limit. Each
+    result lists [offset, length] pairs of matches in the document text.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Please enter a search term!'}), 400
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'Invalid offset or limit!'}), 400
+    limit = max(1, min(limit, app.config['SEARCH_PAGE_SIZE_MAX']))
+
+    total, results = fulltext_index.search(query, offset, limit)
+    next_offset = offset + len(results)
+    return jsonify({
+        'query': query,
+        'total': total,
+        'results': results,
+        'pending': fulltext_index.pending_count(),
+        'next_offset': next_offset if next_offset < total else None
+    })
+
+# Chunked uploads: create a session, PUT numbered chunks (in any order, in
+# parallel, retrying as needed), GET the session for missing chunks, then
+# POST .../complete to move the file into its folder.
+
+def upload_session_info(session):
+    missing = upload_store.missing_chunks(session)
+    return {
+        'id': session['id'],
+        'folder': session['folder'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'chunk_size': session['chunk_size'],
+        'chunk_count': session['chunk_count'],
+        'received_count': session['chunk_count'] - len(missing),
+        'missing': missing
+    }
+
+@app.errorhandler(UploadError)
+def handle_upload_error(e):
+    return jsonify({'error': str(e)}), e.status
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    try:
+        folder = index_path(uploads_path(str(data.get('folder', ''))))
+    except OperationError as e:
+        return jsonify({'error': str(e)}), e.status
+    filename = secure_filename(str(data.get('filename', '')))
+    try:
+        size = int(data.get('size'))
+        chunk_size = int(data.get('chunk_size', app.config['CHUNKED_UPLOAD_CHUNK_SIZE']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Please provide the file size!'}), 400
+
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Type not supported!'}), 400
+    if not 0 <= size <= app.config['CHUNKED_UPLOAD_MAX_SIZE']:
+        return jsonify({'error': 'File is too large!'}), 413
+    if not 0 < chunk_size <= app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'error': 'Invalid chunk size!'}), 400
+    if not fsops.isdir(os.path.join('uploads', folder)):
+        return jsonify({'error': 'Folder not found!'}), 404
+
+    session = upload_store.create(folder, filename, size, chunk_size)
+    return jsonify(upload_session_info(session)), 201
+
+@app.route('/api/uploads/stats')
+def get_upload_stats():
+    stats = upload_stats.stats()
+    stats['streaming'] = app.config['STREAMING_UPLOADS']
+    return jsonify(stats)
+
+@app.errorhandler(TrashError)
+def handle_trash_error(e):
+    return jsonify({'error': str(e)}), e.status
+
+@app.route('/api/trash')
+def list_trash():
+    """Items waiting in the trash, with their purge status and progress"""
+    return jsonify({'items': trash.entries(), 'retention': app.config['TRASH_RETENTION']})
+
+@app.route('/api/trash/<item_id>/restore', methods=['POST'])
+def restore_from_trash(item_id):
+    info = trash.get(item_id)
+    target_path = metadata_index.disk_path(info['original_path'])
+    # Restoring recreates the folders the item was in if they are gone
+    created = top_missing_folder(os.path.dirname(target_path)) or target_path
+    trash.restore(item_id, target_path)
+    record_changes(created=[created])
+    return jsonify({'path': info['original_path'], 'restored': True})
+
+@app.errorhandler(TransferError)
+def handle_transfer_error(e):
+    return jsonify({'error': str(e)}), e.status
+
+def transfer_info(transfer):
+    """Transfer progress as returned by the copy and move APIs"""
+    info = dict(transfer)
+    info['source'] = index_path(transfer['source'])
+    info['target'] = index_path(transfer['target'])
+    info['url'] = url_for('get_transfer', transfer_id=transfer['id'])
+    return info
+
+def count_tree(path, max_bytes, max_files):
+    """Return (total bytes, file count) below a folder, None past either bound
+
+    For folders the metadata index does not know yet: counting stops as
+    soon as the folder is too large to be copied before answering, so it
+    costs at most max_files stats.
+    """
+    size = files = 0
+    stack = [path]
+    while stack:
+        with fsops.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                files += 1
+                size += fsops.entry_stat(entry, follow_symlinks=False).st_size
+                if size > max_bytes or files > max_files:
+                    return None
+    return size, files
+
+def complete_transfer(transfer, known_hashes):
+    """Run a transfer and record what it changed under uploads
+
+    known_hashes is metadata_index.file_hashes of the source, taken before
+    the copy: copied files keep their mtime, so a file still matching its
+    row gets that content hash instead of being read again.
+    """
+    # With deduplicating storage files are never rewritten in place and a
+    # copy can share its inode with the source
+    transfer_store.run(transfer, link=blob_store is not None)
+    if transfer['status'] != 'done':
+        return
+    source, target = transfer['source'], transfer['target']
+    if 'rename' in transfer['methods']:
+        record_changes(moved=[(source, target)])
+        return
+
+    source_index_path = index_path(source)
+    content_hashes = {}
+    for path, (size, mtime, content_hash) in known_hashes.items():
+        copied_path = target + path[len(source_index_path):].replace('/', os.sep)
+        try:
+            stat = fsops.stat(copied_path)
+        except OSError:
+            continue
+        if stat.st_size == size and stat.st_mtime == mtime:
+            content_hashes[copied_path] = content_hash
+    record_changes(created=[target], removed=[source] if transfer['kind'] == 'move' else (),
+                   content_hashes=content_hashes)
+
+def start_transfer(kind):
+    data = request.get_json(silent=True) or {}
+    try:
+        path = clean_path(data.get('path'))
+        destination = clean_path(data.get('destination', ''))
+    except OperationError as e:
+        raise TransferError(str(e))
+
+    full_path = os.path.join('uploads', path)
+    destination_path = os.path.join('uploads', destination)
+    if not path or not fsops.exists(full_path):
+        raise TransferError('Item not found!', 404)
+    if not fsops.isdir(destination_path):
+        raise TransferError('Destination folder not found!', 404)
+    name = os.path.basename(full_path)
+    if data.get('name'):
+        name = secure_filename(str(data['name']).strip())
+        if not name:
+            raise TransferError('Please enter a valid name!')
+    target = os.path.join(destination_path, name)
+    if fsops.isdir(full_path) and (target + os.sep).startswith(full_path + os.sep):
+        raise TransferError('Cannot copy or move a folder into itself!')
+    if fsops.lexists(target):
+        raise TransferError('An item with that name already exists!', 409)
+
+    max_bytes, max_files = app.config['TRANSFER_SYNC_MAX_BYTES'], app.config['TRANSFER_SYNC_MAX_FILES']
+    if not fsops.isdir(full_path):
+        size, file_count = fsops.getsize(full_path), 1
+    elif metadata_index.get(index_path(full_path)) is not None:
+        size, file_count = metadata_index.folder_totals(index_path(full_path))
+    else:
+        # Unknown totals are None, the folder is large enough to go to the background
+        size, file_count = count_tree(full_path, max_bytes, max_files) or (None, None)
+    known_hashes = metadata_index.file_hashes(index_path(full_path))
+    transfer = transfer_store.create(kind, full_path, target, size, file_count)
+
+    # Renames and small copies are done before answering
+    same_device = fsops.stat(full_path).st_dev == fsops.stat(destination_path).st_dev
+    small = size is not None and size <= max_bytes and file_count <= max_files
+    if (kind == 'move' and same_device) or small:
+        complete_transfer(transfer, known_hashes)
+        return jsonify(transfer_info(transfer)), 201 if transfer['status'] == 'done' else 500
+    threading.Thread(target=complete_transfer, args=(transfer, known_hashes), daemon=True).start()
+    return jsonify(transfer_info(transfer)), 202
+
+@app.route('/api/copy', methods=['POST'])
+def copy_item():
+    """Copy a file or folder into another folder
+
+    Body: {"path": ..., "destination": <folder>, "name": <optional new name>}.
+    Copies up to TRANSFER_SYNC_MAX_BYTES and TRANSFER_SYNC_MAX_FILES are done
+    when the response comes (201), larger ones continue in the background
+    (202) and report their progress at the returned url. The totals of a
+    large folder not indexed yet are null.
+    """
+    return start_transfer('copy')
+
+@app.route('/api/move', methods=['POST'])
+def move_item():
+    """Move a file or folder into another folder, same body as /api/copy
+
+    A rename when both are on the same device, otherwise a copy followed
+    by removing the source.
+    """
+    return start_transfer('move')
+
+@app.route('/api/transfers/<transfer_id>')
+def get_transfer(transfer_id):
+    return jsonify(transfer_info(transfer_store.get(transfer_id)))
+
+@app.route('/api/storage/stats')
+def get_storage_stats():
+    logical_bytes, unique_bytes = metadata_index.content_stats()
+    stats = {
+        'dedup_storage': blob_store is not None,
+        'logical_bytes': logical_bytes,
+        'unique_bytes': unique_bytes,
+        'dedup_ratio': logical_bytes / unique_bytes if unique_bytes else None
+    }
+    if blob_store is not None:
+        stats.update(blob_store.stats())
+    return jsonify(stats)
+
+@app.route('/api/uploads/<session_id>', methods=['GET'])
+def get_upload(session_id):
+    return jsonify(upload_session_info(upload_store.get(session_id)))
+
+@app.route('/api/uploads/<session_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(session_id, index):
+    session = upload_store.get(session_id)
+    written = upload_store.write_chunk(session, index, request.stream)
+    return jsonify({'index': index, 'size': written})
+
+@app.route('/api/uploads/<session_id>/complete', methods=['POST'])
+def complete_upload(session_id):
+    session = upload_store.get(session_id)
+    try:
+        # Checked again, the folder may have been replaced by a symlink since
+        target_path = os.path.join(uploads_path(session['folder']), secure_filename(session['filename']))
+    except OperationError as e:
+        raise UploadError(str(e), e.status)
+    upload_store.finish(session, target_path)
+    record_changes(created=[target_path])
+    return jsonify({'path': index_path(target_path), 'size': session['size']})
+
+@app.route('/api/uploads/<session_id>', methods=['DELETE'])
+def abort_upload(session_id):
+    upload_store.get(session_id)
+    upload_store.discard(session_id)
+    return jsonify({'id': session_id, 'aborted': True})
+
+def run_operation(operation, changes):
+    """Carry out one operation of a batch on disk and add it to changes
+
+    Returns the path of the item after the operation, relative to uploads.
+    """
+    op = check_operation(operation)
+    path = clean_path(operation['path'])
+    full_path = os.path.join('uploads', path)
+
+    if op == 'create_folder':
+        name = secure_filename(operation['name'].strip())
+        if not name:
+            raise OperationError('Please enter a valid folder name!')
+        if not fsops.isdir(full_path):
+            raise OperationError('Folder not found!', 404)
+        new_path = os.path.join(full_path, name)
+        changes.check(new_path)
+        if fsops.exists(new_path):
+            raise OperationError('An item with that name already exists!', 409)
+        fsops.mkdir(new_path)
+        changes.create(new_path)
+        return index_path(new_path)
+
+    if not path or not fsops.exists(full_path):
+        raise OperationError('Item not found!', 404)
+
+    if op == 'delete':
+        changes.check(full_path)
+        move_to_trash(full_path)
+        changes.remove(full_path)
+        return path
+
+    if op == 'rename':
+        new_path = renamed_path(full_path, operation['name'].strip())
+        if not os.path.basename(new_path):
+            raise OperationError('Please enter a valid name!')
+    else:
+        destination = os.path.join('uploads', clean_path(operation['destination']))
+        if not fsops.isdir(destination):
+            raise OperationError('Destination folder not found!', 404)
+        new_path = os.path.join(destination, os.path.basename(full_path))
+        if fsops.isdir(full_path) and (new_path + os.sep).startswith(full_path + os.sep):
+            raise OperationError('Cannot move a folder into itself!')
+    changes.check(full_path, new_path)
+    if fsops.exists(new_path):
+        raise OperationError('An item with that name already exists!', 409)
+    fsops.move(full_path, new_path)
+    changes.move(full_path, new_path)
+    return index_path(new_path)
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """Run a list of delete, rename, move and create_folder operations
+
+    Body: {"operations": [{"op": "delete", "path": ...},
+    {"op": "rename", "path": ..., "name": ...}, {"op": "move", "path": ...,
+    "destination": <folder>}, {"op": "create_folder", "path": <folder>,
+    "name": ...}]}. Operations run in order and each one succeeds or fails
+    on its own; the indexes and caches are updated once for all of them.
+    The response holds one result per operation.
+    """
+    try:
+        operations = parse_operations(request.get_json(silent=True), app.config['BATCH_MAX_OPERATIONS'])
+    except OperationError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    changes = ChangeSet()
+    results = []
+    try:
+        for operation in operations:
+            try:
+                path = run_operation(operation, changes)
+                results.append({'ok': True, 'path': path})
+            except OperationError as e:
+                results.append({'ok': False, 'error': str(e), 'status': e.status})
+            except OSError:
+                results.append({'ok': False, 'error': 'Error changing item!', 'status': 500})
+    finally:
+        record_changes(created=changes.created, removed=changes.removed, moved=changes.moved)
+
+    succeeded = sum(1 for result in results if result['ok'])
+    return jsonify({'results': results, 'succeeded': succeeded, 'failed': len(results) - succeeded})
 
 @app.route('/create_folder', methods=['POST'])
 def create_folder():
@@ -222,11 +1290,14 @@ def create_folder():
         flash('Please enter a folder name!', 'error')
         return redirect(url_for('files', folder_path=folder_path))
     
-    current_path = os.path.join('uploads', folder_path)
+    current_path = request_path(folder_path)
+    if current_path is None:
+        flash('Folder not found!', 'error')
+        return redirect(url_for('files'))
     new_folder_path = os.path.join(current_path, new_folder_name)
     
     try:
-        os.makedirs(new_folder_path, exist_ok=True)
+        make_folders(new_folder_path)
         flash(f'Folder created successfully!', 'success')
     except Exception as e:
         flash(f'Error creating folder!', 'error')
@@ -235,33 +1306,125 @@ def create_folder():
 
 @app.route('/preview/<path:file_path>')
 def preview_file(file_path):
-    full_path = os.path.join('uploads', file_path)
-    if os.path.exists(full_path) and os.path.isfile(full_path):
+    full_path = request_path(file_path)
+    if full_path is not None and fsops.isfile(full_path):
         # Get file extension to determine content type
         _, ext = os.path.splitext(full_path)
         ext = ext.lower()
         
         # Set appropriate MIME type for text files
         if ext in ['.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.xml']:
-            return send_file(full_path, as_attachment=False, mimetype='text/plain')
+            return serve_file(full_path, mimetype='text/plain')
         else:
-            return send_file(full_path, as_attachment=False)
+            return serve_file(full_path)
     flash('File not found!', 'error')
     return redirect(url_for('files'))
 
+@app.route('/view/<path:file_path>')
+def view_text(file_path):
+    """Page scrolling through a text file of any size, lines come from /api/text"""
+    full_path = request_path(file_path)
+    if full_path is None or not fsops.isfile(full_path):
+        flash('File not found!', 'error')
+        return redirect(url_for('files'))
+    parent = os.path.dirname(file_path)
+    return render_template('text_viewer.html',
+                           file_path=file_path,
+                           file_name=os.path.basename(file_path),
+                           parent_path=parent,
+                           page_size=app.config['TEXT_VIEWER_MAX_LINES'])
+
+@app.route('/api/text/<path:file_path>')
+def api_text(file_path):
+    """Return a window of lines of a text file as JSON
+
+    Query parameters: start (first line, 0-based) or tail (return the last
+    lines), and limit (capped at TEXT_VIEWER_MAX_LINES).
+    """
+    full_path = request_path(file_path)
+    if full_path is None or not fsops.isfile(full_path):
+        return jsonify({'error': 'File not found!'}), 404
+    try:
+        limit = int(request.args.get('limit', app.config['TEXT_VIEWER_MAX_LINES']))
+        start = int(request.args.get('start', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid start or limit!'}), 400
+    limit = max(1, min(limit, app.config['TEXT_VIEWER_MAX_LINES']))
+
+    try:
+        index = line_index_cache.get(full_path)
+        if request.args.get('tail') is not None:
+            start = max(0, index.line_count - limit)
+        start = max(0, start)
+        lines, truncated = index.read(start, limit, app.config['TEXT_VIEWER_MAX_LINE_BYTES'])
+    except (OSError, ValueError):
+        return jsonify({'error': 'Error reading file!'}), 500
+
+    return jsonify({
+        'path': file_path,
+        'encoding': index.encoding,
+        'size': index.size,
+        'line_count': index.line_count,
+        'start': start,
+        'lines': lines,
+        'truncated': truncated
+    })
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    resolved = asset_pipeline.resolve(filename, request.accept_encodings)
+    if resolved is None:
+        return jsonify({'error': 'Asset not found!'}), 404
+    path, encoding = resolved
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_file_ranged(path, mimetype=mimetype, download_name=os.path.basename(filename),
+                                etag=f'{filename}-{encoding or "identity"}')
+    # Fingerprinted names never change content, so they are never revalidated
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['ASSET_MAX_AGE']
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.content_encoding = encoding
+    return response
+
+@app.route('/thumbnail/<path:file_path>')
+def thumbnail(file_path):
+    full_path = request_path(file_path)
+    if (full_path is not None and thumbnail_cache.available and thumbnail_cache.supports(full_path)
+            and fsops.isfile(full_path)):
+        cached = thumbnail_cache.get(full_path)
+        if cached is not None:
+            thumbnail_path, key = cached
+            return send_file_ranged(thumbnail_path, mimetype='image/jpeg', etag=key)
+    return jsonify({'error': 'No thumbnail available!'}), 404
+
 @app.route('/download/<path:file_path>')
 def download_file(file_path):
-    full_path = os.path.join('uploads', file_path)
-    if os.path.exists(full_path) and os.path.isfile(full_path):
+    full_path = request_path(file_path)
+    if full_path is not None and fsops.isfile(full_path):
         filename = os.path.basename(file_path)
-        return send_file(full_path, as_attachment=True, download_name=filename)
+        return serve_file(full_path, as_attachment=True, download_name=filename)
     flash('File not found!', 'error')
     return redirect(url_for('files'))
 
+@app.route('/download_folder', defaults={'folder_path': ''})
+@app.route('/download_folder/<path:folder_path>')
+def download_folder(folder_path):
+    full_path = request_path(folder_path)
+    if full_path is not None and fsops.isdir(full_path):
+        response = Response(stream_zip(full_path), mimetype='application/zip', direct_passthrough=True)
+        archive_name = (os.path.basename(os.path.normpath(folder_path)) or 'uploads') + '.zip'
+        response.headers.set('Content-Disposition', 'attachment', filename=archive_name)
+        return response
+    flash('Folder not found!', 'error')
+    return redirect(url_for('files'))
+
 @app.route('/stream/<path:file_path>')
 def stream_file(file_path):
-    full_path = os.path.join('uploads', file_path)
-    if os.path.exists(full_path) and os.path.isfile(full_path):
+    full_path = request_path(file_path)
+    if full_path is not None and fsops.isfile(full_path):
         # Get file extension to determine content type
         _, ext = os.path.splitext(full_path)
         ext = ext.lower()
@@ -285,13 +1448,34 @@ def stream_file(file_path):
         elif ext == '.m4v':
             mime_type = 'video/x-m4v'
 
-        return send_file(full_path, as_attachment=False, mimetype=mime_type)
+        return serve_file(full_path, mimetype=mime_type)
     flash('File not found!', 'error')
     return redirect(url_for('files'))
 
+def move_to_trash(full_path):
+    """Delete an item: a rename into the trash, the background purger frees the space"""
+    size, file_count = metadata_index.folder_totals(index_path(full_path))
+    if fsops.isfile(full_path):
+        size, file_count = fsops.getsize(full_path), 1
+    content_hashes = metadata_index.content_hashes(index_path(full_path)) if blob_store is not None else ()
+    trash.move_in(full_path, index_path(full_path), size, file_count, content_hashes)
+
+def renamed_path(full_old_path, new_name):
+    """Path an item is renamed to, files keep their extension if new_name has none"""
+    if fsops.isfile(full_old_path):
+        old_name = os.path.basename(full_old_path)
+        if '.' in old_name and '.' not in new_name:
+            # Get the extension from the old name
+            _, ext = os.path.splitext(old_name)
+            new_name = new_name + ext
+    return os.path.join(os.path.dirname(full_old_path), secure_filename(new_name))
+
 @app.route('/delete_item/<path:item_path>')
 def delete_item(item_path):
-    full_path = os.path.join('uploads', item_path)
+    full_path = request_path(item_path)
+    if full_path is None or full_path == os.path.join('uploads', ''):
+        flash('Item not found!', 'error')
+        return redirect(url_for('files'))
     
     # Calculate parent path for redirection
     parent_dir = os.path.dirname(full_path)
@@ -300,13 +1484,10 @@ def delete_item(item_path):
         relative_parent = ''
     
     try:
-        if os.path.exists(full_path):
-            if os.path.isdir(full_path):
-                shutil.rmtree(full_path)
-                flash(f'Item deleted successfully!', 'delete')
-            else:
-                os.remove(full_path)
-                flash(f'Item deleted successfully!', 'delete')
+        if fsops.exists(full_path):
+            move_to_trash(full_path)
+            record_changes(removed=[full_path])
+            flash(f'Item deleted successfully!', 'delete')
         else:
             flash('Item not found!', 'error')
     except Exception as e:
@@ -323,7 +1504,10 @@ def rename_item():
         flash('Please provide both item path and new name!', 'error')
         return redirect(url_for('files'))
     
-    full_old_path = os.path.join('uploads', item_path)
+    full_old_path = request_path(item_path)
+    if full_old_path is None or full_old_path == os.path.join('uploads', ''):
+        flash('Item not found!', 'error')
+        return redirect(url_for('files'))
     
     # Calculate parent path for redirection
     parent_dir = os.path.dirname(full_old_path)
@@ -331,33 +1515,24 @@ def rename_item():
     if relative_parent == '.':
         relative_parent = ''
     
-    if not os.path.exists(full_old_path):
+    if not fsops.exists(full_old_path):
         flash('Item not found!', 'error')
         return redirect(url_for('files', folder_path=relative_parent))
     
-    # For files, preserve the extension if not provided in new name
-    if os.path.isfile(full_old_path):
-        old_name = os.path.basename(full_old_path)
-        if '.' in old_name and '.' not in new_name:
-            # Get the extension from the old name
-            _, ext = os.path.splitext(old_name)
-            new_name = new_name + ext
-    
-    # Secure the filename
-    new_filename = secure_filename(new_name)
-    full_new_path = os.path.join(parent_dir, new_filename)
+    full_new_path = renamed_path(full_old_path, new_name)
     
     # Determine item type before rename
-    item_type = 'folder' if os.path.isdir(full_old_path) else 'file'
+    item_type = 'folder' if fsops.isdir(full_old_path) else 'file'
     
     try:
         # Check if new name already exists
-        if os.path.exists(full_new_path):
+        if fsops.exists(full_new_path):
             flash('An item with that name already exists !', 'error')
             return redirect(url_for('files', folder_path=relative_parent))
         
         # Rename the item
-        shutil.move(full_old_path, full_new_path)
+        fsops.move(full_old_path, full_new_path)
+        record_changes(moved=[(full_old_path, full_new_path)])
         
         flash(f'Item renamed successfully!', 'success')
         
@@ -378,4 +1553,6 @@ def logout():
     return redirect(url_for('login'))
 
 if __name__ == '__main__':
+    # Development server, production runs gunicorn with gunicorn.conf.py
+    warm_up()
     app.run(host='0.0.0.0', port=5000, use_reloader=False)
\ No newline at end of file
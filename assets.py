@@ -0,0 +1,100 @@
+"""Fingerprinted, precompressed copies of the static files
+
+Run `python assets.py` to build them ahead of time (the dockerfile does);
+the app also builds whatever is missing at startup.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+try:
+    import brotli
+except ImportError:  # only gzip variants without it
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+MANIFEST_NAME = 'manifest.json'
+# Content-Encoding values mapped to the suffix of their variant, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _write_atomic(path, data):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class AssetPipeline:
+    """Static files copied under their content hash, with compressed variants
+
+    style.css becomes style.<hash>.css in build_dir, next to .gz and, with
+    the brotli package, .br variants that are kept when smaller. A new
+    build only writes files whose content changed, and manifest maps each
+    source name to its fingerprinted name.
+    """
+
+    def __init__(self, source_dir, build_dir):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.manifest = {}
+
+    def build(self):
+        os.makedirs(self.build_dir, exist_ok=True)
+        manifest = {}
+        for dirpath, dirnames, filenames in os.walk(self.source_dir):
+            dirnames[:] = [d for d in dirnames
+                           if os.path.abspath(os.path.join(dirpath, d)) != os.path.abspath(self.build_dir)]
+            for name in filenames:
+                source_path = os.path.join(dirpath, name)
+                logical_name = os.path.relpath(source_path, self.source_dir).replace(os.sep, '/')
+                manifest[logical_name] = self._build_file(source_path, logical_name)
+        _write_atomic(os.path.join(self.build_dir, MANIFEST_NAME), json.dumps(manifest, indent=2).encode())
+        self.manifest = manifest
+        return manifest
+
+    def _build_file(self, source_path, logical_name):
+        with open(source_path, 'rb') as f:
+            data = f.read()
+        stem, extension = os.path.splitext(logical_name)
+        fingerprinted = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+        target_path = os.path.join(self.build_dir, *fingerprinted.split('/'))
+        if os.path.exists(target_path):
+            return fingerprinted
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if extension.lower() in COMPRESSIBLE_EXTENSIONS:
+            variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['.br'] = brotli.compress(data, quality=11)
+            for suffix, compressed in variants.items():
+                if len(compressed) < len(data):
+                    _write_atomic(target_path + suffix, compressed)
+        _write_atomic(target_path, data)  # last, so its presence means the build is complete
+        return fingerprinted
+
+    def url_name(self, logical_name):
+        """Fingerprinted name of a static file, or None if it was not built"""
+        return self.manifest.get(logical_name)
+
+    def resolve(self, fingerprinted, accept_encoding):
+        """Return (path, content encoding or None) of the best variant to send
+
+        accept_encoding is the request's Accept-Encoding header object.
+        Returns None for names the pipeline did not produce.
+        """
+        if fingerprinted == MANIFEST_NAME or fingerprinted not in self.manifest.values():
+            return None
+        path = os.path.join(self.build_dir, *fingerprinted.split('/'))
+        for encoding, suffix in ENCODINGS:
+            if accept_encoding[encoding] and os.path.exists(path + suffix):
+                return path + suffix, encoding
+        return path, None
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    pipeline = AssetPipeline(os.path.join(here, 'static'), os.path.join(here, 'static', 'build'))
+    for logical, built in pipeline.build().items():
+        print(f'{logical} -> {built}')
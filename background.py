@@ -0,0 +1,80 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Lock files held for the lifetime of the process, keyed by path
+_held_locks = {}
+
+
+def acquire_process_lock(lock_path):
+    """Try to become the single process allowed to run a background job
+
+    Uses a non-blocking flock on lock_path, released when the process exits.
+    Always succeeds where flock is unavailable.
+    """
+    if lock_path in _held_locks:
+        return True
+    if fcntl is None:
+        _held_locks[lock_path] = None
+        return True
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    f = open(lock_path, 'a')
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _held_locks[lock_path] = f
+    return True
+
+
+def lock_is_held(lock_path):
+    """Whether a process holds lock_path with acquire_process_lock
+
+    Always True where flock is unavailable, since nothing can be known.
+    """
+    if fcntl is None:
+        return True
+    try:
+        f = open(lock_path, 'a')
+    except OSError:
+        return False
+    with f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return False
+
+
+@contextmanager
+def exclusive_lock(lock_path):
+    """Hold a blocking flock on lock_path, serializing processes (no-op without flock)"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def start_singleton_thread(lock_path, target, name):
+    """Run target in a daemon thread unless another process already runs it
+
+    Returns the thread, or None when another worker holds the lock.
+    """
+    if not acquire_process_lock(lock_path):
+        return None
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,104 @@
+"""Validation and bookkeeping of /api/batch requests"""
+import os
+
+from metadata_index import INTERNAL_DIR_NAME
+
+# Fields each operation needs besides op
+OPERATIONS = {
+    'delete': ('path',),
+    'rename': ('path', 'name'),
+    'move': ('path', 'destination'),
+    'create_folder': ('path', 'name')
+}
+
+
+class OperationError(Exception):
+    """A batch, or one of its operations, that cannot be carried out"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def clean_path(value):
+    """Path below uploads from an operation field, '' being uploads itself"""
+    if not isinstance(value, str):
+        raise OperationError('Invalid path!')
+    path = value.strip('/')
+    parts = path.split('/') if path else []
+    if any(part in ('', '.', '..', INTERNAL_DIR_NAME) for part in parts):
+        raise OperationError('Invalid path!')
+    return path
+
+
+def parse_operations(payload, max_operations):
+    """Return the operations of a batch request body
+
+    Only the shape of the batch is checked here, fields of the operations
+    are validated one by one as they run so a bad one fails on its own.
+    """
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise OperationError('Please provide a list of operations!')
+    if len(operations) > max_operations:
+        raise OperationError(f'At most {max_operations} operations per batch!', 413)
+    return operations
+
+
+def check_operation(operation):
+    """Return the op name of an operation after checking its fields"""
+    if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+        raise OperationError('Unknown operation!')
+    for field in OPERATIONS[operation['op']]:
+        if not isinstance(operation.get(field), str):
+            raise OperationError(f'Missing {field}!')
+    return operation['op']
+
+
+class ChangeSet:
+    """Changes made by the operations of a batch, recorded in one go
+
+    Operations run one after another on disk but the metadata index and
+    caches learn about all of them at once, in the order created, removed,
+    moved. An operation may therefore not touch a path that an earlier one
+    changed, or anything above or below it; check() refuses it with 409.
+    """
+
+    def __init__(self):
+        self.created = []
+        self.removed = []
+        self.moved = []
+        self._changed = set()
+        self._changed_ancestors = set()
+
+    def check(self, *paths):
+        for path in paths:
+            path = os.path.normpath(path)
+            if path in self._changed or path in self._changed_ancestors:
+                raise OperationError('Item was already changed in this batch!', 409)
+            parent = os.path.dirname(path)
+            while parent and parent != os.path.dirname(parent):
+                if parent in self._changed:
+                    raise OperationError('Item was already changed in this batch!', 409)
+                parent = os.path.dirname(parent)
+
+    def _mark(self, path):
+        path = os.path.normpath(path)
+        self._changed.add(path)
+        parent = os.path.dirname(path)
+        while parent and parent != os.path.dirname(parent):
+            self._changed_ancestors.add(parent)
+            parent = os.path.dirname(parent)
+
+    def create(self, path):
+        self.created.append(path)
+        self._mark(path)
+
+    def remove(self, path):
+        self.removed.append(path)
+        self._mark(path)
+
+    def move(self, old_path, new_path):
+        self.moved.append((old_path, new_path))
+        self._mark(old_path)
+        self._mark(new_path)
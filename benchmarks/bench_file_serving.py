@@ -0,0 +1,157 @@
+"""Compare file serving throughput and CPU before and after send_file_ranged
+
+Serves one generated file through flask.send_file ("before") and through
+file_responses.send_file_ranged ("after") from a real WSGI server in a
+subprocess, downloads it repeatedly over HTTP and reports MB/s and the
+server's CPU seconds per GB, read from the serving process itself.
+
+    python benchmarks/bench_file_serving.py --size-mb 512 --requests 8
+    python benchmarks/bench_file_serving.py --server wsgiref
+
+gunicorn (which sends file wrappers with sendfile) is used when installed.
+"""
+import argparse
+import http.client
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify, send_file  # noqa: E402
+
+from file_responses import send_file_ranged  # noqa: E402
+
+BENCH_FILE = os.environ.get('BENCH_FILE', '')
+
+bench_app = Flask(__name__)
+
+
+@bench_app.route('/before')
+def before():
+    return send_file(BENCH_FILE, mimetype='application/octet-stream')
+
+
+@bench_app.route('/after')
+def after():
+    return send_file_ranged(BENCH_FILE, mimetype='application/octet-stream')
+
+
+@bench_app.route('/cpu')
+def cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return jsonify({'user': usage.ru_utime, 'system': usage.ru_stime})
+
+
+def start_server(server, port, path):
+    env = dict(os.environ, BENCH_FILE=path)
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--workers', '1', '--threads', '4',
+                   '--bind', f'127.0.0.1:{port}', '--chdir', os.path.dirname(os.path.abspath(__file__)),
+                   'bench_file_serving:bench_app']
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', str(port)]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            request(port, '/cpu')
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{server} did not start')
+
+
+def request(port, path):
+    """GET path and return (status, body bytes read), discarding the body"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        if path == '/cpu':
+            return response.status, json.loads(response.read())
+        buffer = bytearray(1024 * 1024)
+        total = 0
+        while True:
+            n = response.readinto(buffer)
+            if not n:
+                return response.status, total
+            total += n
+    finally:
+        connection.close()
+
+
+def measure(port, path, requests):
+    _, cpu_start = request(port, '/cpu')
+    started = time.perf_counter()
+    transferred = 0
+    for _ in range(requests):
+        transferred += request(port, path)[1]
+    seconds = time.perf_counter() - started
+    _, cpu_end = request(port, '/cpu')
+    cpu_seconds = (cpu_end['user'] + cpu_end['system']) - (cpu_start['user'] + cpu_start['system'])
+    gigabytes = transferred / 1024 ** 3
+    return {
+        'bytes': transferred,
+        'mb_per_second': transferred / 1024 ** 2 / seconds,
+        'cpu_seconds_per_gb': cpu_seconds / gigabytes,
+        'user_seconds': cpu_end['user'] - cpu_start['user'],
+        'system_seconds': cpu_end['system'] - cpu_start['system']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--requests', type=int, default=8)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--server', choices=('gunicorn', 'wsgiref'))
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        from wsgiref.simple_server import make_server
+        make_server('127.0.0.1', args.serve, bench_app).serve_forever()
+        return
+
+    server = args.server
+    if server is None:
+        try:
+            import gunicorn  # noqa: F401
+            server = 'gunicorn'
+        except ImportError:
+            server = 'wsgiref'
+
+    with tempfile.NamedTemporaryFile(suffix='.bin') as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            f.write(block)
+        f.flush()
+
+        process = start_server(server, args.port, f.name)
+        try:
+            request(args.port, '/before')
+            request(args.port, '/after')
+            results = {mode: measure(args.port, '/' + mode, args.requests) for mode in ('before', 'after')}
+        finally:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        print(json.dumps({'server': server, 'size_mb': args.size_mb, 'results': results}, indent=2))
+        return
+    print(f'{server}, {args.requests} x {args.size_mb}MB')
+    for mode, result in results.items():
+        print(f"{mode:>7}: {result['mb_per_second']:9.1f} MB/s  "
+              f"{result['cpu_seconds_per_gb']:6.3f} CPU s/GB  "
+              f"(user {result['user_seconds']:.2f}s, system {result['system_seconds']:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,441 @@
+"""Benchmark the app over HTTP on synthetic uploads trees
+
+For each tree size and depth, generates an uploads/ tree in a scratch
+directory, starts the app on it and measures, through the Flask test
+client ("client") and a real local server ("http"):
+
+- startup: importing the app (which reconciles its indexes with the tree)
+  or the server getting ready
+- listing latency: first and repeated GETs of the root and of a leaf folder
+- upload and download throughput of a generated file
+- rename and delete cost of a file and of a top-level folder's subtree
+
+Every operation also records the filesystem calls it made, from the
+X-Filely-Fs-Ops header. Depth 0 puts every entry in uploads/ itself, depth
+d spreads them over d levels of folders with about 100 files per leaf.
+Each tree runs in a process of its own since the app keeps module-level
+state. Results are written as JSON, and --compare prints the change of
+each timing against an earlier run.
+
+    python benchmarks/bench_http.py --sizes 1k,100k --depths 0,3 --output results.json
+    python benchmarks/bench_http.py --sizes 1m --depths 3 --compare results.json
+
+gunicorn is used for the http mode when installed, werkzeug's threaded
+server otherwise.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from urllib.parse import urlencode
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXTENSIONS = ['txt', 'pdf', 'png', 'jpg', 'docx', 'xlsx', 'zip', 'mp3', 'mp4']
+FILES_PER_LEAF = 100
+# Values --compare reports
+COMPARED = {'ms', 'first_ms', 'median_ms', 'mb_per_second', 'startup_seconds', 'generate_seconds'}
+
+
+def parse_size(text):
+    """1k -> 1000, 1m -> 1000000"""
+    text = text.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000 ** 2}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def tree_name(entries, depth):
+    label = f'{entries // 1000 ** 2}m' if entries % 1000 ** 2 == 0 else \
+        f'{entries // 1000}k' if entries % 1000 == 0 else str(entries)
+    return f"{label}-{'flat' if depth == 0 else f'd{depth}'}"
+
+
+# Tree generation
+
+def generate_tree(root, entries, depth, file_bytes):
+    """Create entries files and folders under root, returns the tree's shape"""
+    content = os.urandom(file_bytes)
+
+    def make_files(folder, count, start):
+        for i in range(start, start + count):
+            path = os.path.join(folder, f'file_{i}.{EXTENSIONS[i % len(EXTENSIONS)]}')
+            fd = os.open(path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644)
+            if content:
+                os.write(fd, content)
+            os.close(fd)
+
+    os.makedirs(root)
+    if depth == 0:
+        make_files(root, entries, 0)
+        return {'folders': 0, 'files': entries, 'branching': 0, 'depth': 0, 'top_folders': []}
+
+    branching = max(2, round((entries / FILES_PER_LEAF) ** (1 / depth)))
+    levels = [['']]
+    for _ in range(depth):
+        levels.append([f'{parent}/folder_{i}'.lstrip('/') for parent in levels[-1] for i in range(branching)])
+    folders = [folder for level in levels[1:] for folder in level]
+    for folder in folders:
+        os.mkdir(os.path.join(root, folder))
+    leaves = levels[-1]
+    files = max(0, entries - len(folders))
+    made = 0
+    for i, leaf in enumerate(leaves):
+        count = files // len(leaves) + (1 if i < files % len(leaves) else 0)
+        make_files(os.path.join(root, leaf), count, made)
+        made += count
+    return {'folders': len(folders), 'files': files, 'branching': branching, 'depth': depth,
+            'top_folders': levels[1]}
+
+
+# Drivers, send requests and return (status, body bytes, headers)
+
+class TestClientDriver:
+    """Requests through the Flask test client, in this process"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def _result(self, response):
+        length = 0
+        for chunk in response.response:
+            length += len(chunk)
+        status, headers = response.status_code, dict(response.headers)
+        response.close()
+        return status, length, headers
+
+    def get(self, path):
+        return self._result(self.client.get(path, buffered=False))
+
+    def post_form(self, path, fields):
+        return self._result(self.client.post(path, data=fields, buffered=False))
+
+    def post_file(self, path, name, payload):
+        return self._result(self.client.post(path, data={'files': (io.BytesIO(payload), name)},
+                                             content_type='multipart/form-data', buffered=False))
+
+
+class HttpDriver:
+    """Requests over HTTP to a local server, one connection each"""
+
+    def __init__(self, port):
+        self.port = port
+
+    def _request(self, method, path, body=None, headers=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=600)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            buffer = bytearray(1024 * 1024)
+            length = 0
+            while True:
+                n = response.readinto(buffer)
+                if not n:
+                    break
+                length += n
+            return response.status, length, dict(response.getheaders())
+        finally:
+            connection.close()
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post_form(self, path, fields):
+        return self._request('POST', path, urlencode(fields),
+                             {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def post_file(self, path, name, payload):
+        boundary = uuid.uuid4().hex
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{name}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n').encode() + payload + \
+            f'\r\n--{boundary}--\r\n'.encode()
+        return self._request('POST', path, body, {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+
+# Measurements
+
+def timed(call):
+    started = time.perf_counter()
+    status, length, headers = call()
+    return {
+        'ms': (time.perf_counter() - started) * 1000,
+        'status': status,
+        'bytes': length,
+        'fs_ops': headers.get('X-Filely-Fs-Ops')
+    }
+
+
+def summarize(samples):
+    timings = sorted(sample['ms'] for sample in samples)
+    return {
+        'median_ms': statistics.median(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'min_ms': timings[0],
+        'status': samples[-1]['status'],
+        'bytes': samples[-1]['bytes'],
+        'fs_ops': samples[-1]['fs_ops']
+    }
+
+
+def measure_listing(driver, path, repeat):
+    first = timed(lambda: driver.get(path))
+    return dict(summarize([timed(lambda: driver.get(path)) for _ in range(repeat)]), first_ms=first['ms'])
+
+
+def measure_mode(driver, mode, shape, args):
+    """Every measurement of one mode, returns its results
+
+    Each mode works in its own top-level folder, a 1/branching share of the
+    tree, which it renames and deletes last.
+    """
+    results = {'listing': {'root': measure_listing(driver, '/files', args.repeat)}}
+    index = ['client', 'http'].index(mode)
+    top_folder = shape['top_folders'][index] if index < len(shape['top_folders']) else None
+    leaf = '/'.join([top_folder] + ['folder_0'] * (shape['depth'] - 1)) if top_folder else ''
+    if leaf:
+        results['listing']['leaf'] = measure_listing(driver, f'/files/{leaf}', args.repeat)
+        results['listing']['leaf_api'] = measure_listing(driver, f'/api/files/{leaf}', args.repeat)
+
+    payload = os.urandom(args.upload_mb * 1024 * 1024)
+    folder = f'/files/{leaf}' if leaf else '/files'
+    uploads = [timed(lambda i=i: driver.post_file(folder, f'{mode}_upload_{i}.zip', payload))
+               for i in range(args.transfers)]
+    upload = summarize(uploads)
+    upload['mb_per_second'] = args.upload_mb / (upload['median_ms'] / 1000)
+    results['upload'] = upload
+
+    file_path = f'{leaf}/{mode}_upload_0.zip'.lstrip('/')
+    downloads = [timed(lambda: driver.get(f'/download/{file_path}')) for _ in range(args.transfers)]
+    download = summarize(downloads)
+    download['mb_per_second'] = download['bytes'] / 1024 ** 2 / (download['median_ms'] / 1000)
+    results['download'] = download
+
+    renamed = f'{mode}_renamed.zip'
+    results['rename_file'] = timed(lambda: driver.post_form('/rename_item', {'item_path': file_path,
+                                                                           'new_name': renamed}))
+    results['delete_file'] = timed(lambda: driver.get(f"/delete_item/{f'{leaf}/{renamed}'.lstrip('/')}"))
+
+    if top_folder:
+        results['rename_folder'] = timed(lambda: driver.post_form('/rename_item', {'item_path': top_folder,
+                                                                                 'new_name': f'{mode}_renamed'}))
+        results['delete_folder'] = timed(lambda: driver.get(f'/delete_item/{mode}_renamed'))
+        results['folder_entries'] = (shape['folders'] + shape['files']) // len(shape['top_folders'])
+    return results
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(server, directory, port, workers):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--config', os.path.join(REPO_DIR, 'gunicorn.conf.py'),
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--chdir', directory,
+                   '--access-logfile', '/dev/null', 'app:app']
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', directory, '--port', str(port)]
+    process = subprocess.Popen(command, env=env, cwd=directory,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    driver = HttpDriver(port)
+    deadline = time.time() + 3600  # reconciling a large tree takes a while
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{server} exited with status {process.returncode}')
+        try:
+            if driver.get('/readyz')[0] == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{server} did not get ready')
+
+
+def run_tree(args, directory, entries, depth):
+    """Generate one tree in directory, measure it in each mode, returns its results"""
+    started = time.perf_counter()
+    shape = generate_tree(os.path.join(directory, 'uploads'), entries, depth, args.file_bytes)
+    results = {
+        'entries': entries,
+        'depth': depth,
+        'shape': {key: value for key, value in shape.items() if key != 'top_folders'},
+        'generate_seconds': time.perf_counter() - started,
+        'modes': {}
+    }
+
+    if 'client' in args.modes:
+        # The app reconciles its indexes with the tree when imported
+        os.chdir(directory)
+        sys.path.insert(0, REPO_DIR)
+        started = time.perf_counter()
+        import app as app_module
+        app_module.warm_up()
+        startup = time.perf_counter() - started
+        results['modes']['client'] = dict(measure_mode(TestClientDriver(app_module.app), 'client', shape, args),
+                                          startup_seconds=startup)
+
+    if 'http' in args.modes:
+        port = free_port()
+        started = time.perf_counter()
+        process = start_server(args.server, directory, port, args.workers)
+        try:
+            startup = time.perf_counter() - started
+            results['modes']['http'] = dict(measure_mode(HttpDriver(port), 'http', shape, args),
+                                            startup_seconds=startup, server=args.server)
+        finally:
+            process.terminate()
+            process.wait()
+    return results
+
+
+# Comparing runs
+
+def timings(results, prefix=''):
+    """Flatten results to {dotted.key: number} for the values in COMPARED"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(timings(value, name))
+        elif isinstance(value, (int, float)) and key in COMPARED:
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current):
+    before, after = timings(baseline['trees']), timings(current['trees'])
+    print(f"\n{'':<60} {'before':>10} {'after':>10} {'change':>8}")
+    for name in sorted(before.keys() & after.keys()):
+        if before[name]:
+            print(f'{name:<60} {before[name]:10.2f} {after[name]:10.2f} {after[name] / before[name] - 1:+8.0%}')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(name, results):
+    print(f"{name}: {results['shape']['folders']} folders, {results['shape']['files']} files, "
+          f"generated in {results['generate_seconds']:.1f}s")
+    for mode, result in results['modes'].items():
+        listing = result['listing']
+        print(f"  {mode:>6}: startup {result['startup_seconds']:.2f}s, "
+              + ', '.join(f"list {target} {value['first_ms']:.1f}/{value['median_ms']:.1f} ms"
+                          for target, value in listing.items()))
+        print(f"          upload {result['upload']['mb_per_second']:.0f} MB/s, "
+              f"download {result['download']['mb_per_second']:.0f} MB/s, "
+              f"rename/delete file {result['rename_file']['ms']:.1f}/{result['delete_file']['ms']:.1f} ms"
+              + (f", rename/delete folder of {result['folder_entries']} entries "
+                 f"{result['rename_folder']['ms']:.1f}/{result['delete_folder']['ms']:.1f} ms"
+                 if 'rename_folder' in result else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1k,100k', help='entries per tree, e.g. 1k,100k,1m')
+    parser.add_argument('--depths', default='0,3', help='folder levels per tree, 0 for a single folder')
+    parser.add_argument('--modes', default='client,http', help='client, http or both')
+    parser.add_argument('--server', choices=('gunicorn', 'werkzeug'))
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--repeat', type=int, default=20, help='requests per listing measurement')
+    parser.add_argument('--transfers', type=int, default=5, help='uploads and downloads per measurement')
+    parser.add_argument('--upload-mb', type=int, default=8, help='size of the uploaded file, at most 15')
+    parser.add_argument('--file-bytes', type=int, default=0, help='size of the generated files')
+    parser.add_argument('--work-dir', help='where trees are generated, defaults to the temp directory')
+    parser.add_argument('--keep-trees', action='store_true')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--tree', help=argparse.SUPPRESS)
+    parser.add_argument('--tree-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.modes = [mode.strip() for mode in args.modes.split(',')]
+
+    if args.serve:
+        os.chdir(args.serve)
+        sys.path.insert(0, REPO_DIR)
+        import app as app_module
+        from werkzeug.serving import make_server
+        app_module.warm_up()
+        make_server('127.0.0.1', args.port, app_module.app, threaded=True).serve_forever()
+        return
+
+    if args.server is None:
+        try:
+            import gunicorn  # noqa: F401
+            args.server = 'gunicorn'
+        except ImportError:
+            args.server = 'werkzeug'
+
+    if args.tree:
+        entries, depth = (int(value) for value in args.tree.split(':'))
+        results = run_tree(args, args.tree_dir, entries, depth)
+        with open(args.result_file, 'w') as f:
+            json.dump(results, f)
+        return
+
+    run = {
+        'started_at': time.time(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'server': args.server,
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in ('serve', 'port', 'tree', 'tree_dir', 'result_file', 'output', 'compare',
+                                    'json')},
+        'trees': {}
+    }
+    for entries in (parse_size(size) for size in args.sizes.split(',')):
+        for depth in (int(depth) for depth in args.depths.split(',')):
+            # A process per tree, the app's module-level state is bound to its working directory.
+            # The tree is removed once that process is gone, its background threads write to it until then.
+            if args.work_dir:
+                os.makedirs(args.work_dir, exist_ok=True)
+            directory = tempfile.mkdtemp(prefix=f'filely-bench-{tree_name(entries, depth)}-', dir=args.work_dir)
+            try:
+                with tempfile.NamedTemporaryFile(suffix='.json') as result_file:
+                    subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:],
+                                    '--tree', f'{entries}:{depth}', '--tree-dir', directory,
+                                    '--result-file', result_file.name, '--server', args.server],
+                                   check=True, stdout=subprocess.DEVNULL)
+                    with open(result_file.name) as f:
+                        results = json.load(f)
+            finally:
+                if not args.keep_trees:
+                    shutil.rmtree(directory, ignore_errors=True)
+            name = tree_name(entries, depth)
+            run['trees'][name] = results
+            if not args.json:
+                report(name, results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+    if args.json:
+        print(json.dumps(run, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Measure the listing rows' HTML size and render time
+
+Builds synthetic folder and file items the way the app does (category and
+icon lookups included), renders them with templates/item_rows.html and
+reports HTML bytes per row, render time per 1k rows and lookup time per
+1k files.
+
+    python benchmarks/bench_listing_render.py --rows 10000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXTENSIONS = ['txt', 'pdf', 'png', 'jpg', 'docx', 'xlsx', 'zip', 'mp3', 'mp4', 'bin']
+
+
+def make_items(app_module, rows):
+    items = []
+    for i in range(rows):
+        if i % 10 == 0:
+            items.append({'name': f'folder_{i}', 'type': 'folder', 'icon': app_module.FOLDER_ICON,
+                          'size': i * 1000, 'file_count': i, 'item_count': 7})
+        else:
+            name = f'file_{i}.{EXTENSIONS[i % len(EXTENSIONS)]}'
+            items.append({'name': name, 'type': 'file', 'icon': app_module.get_file_icon(name),
+                          'size': i * 100, 'category': app_module.get_file_category(name), 'mtime': 0})
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    # The app creates its state next to the uploads folder of the working directory
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, REPO_DIR)
+    import app as app_module
+    from flask import render_template
+
+    names = [f'file_{i}.{EXTENSIONS[i % len(EXTENSIONS)]}' for i in range(1000)]
+    started = time.perf_counter()
+    for name in names:
+        app_module.get_file_category(name)
+        app_module.get_file_icon(name)
+    lookup_seconds = time.perf_counter() - started
+
+    items = make_items(app_module, args.rows)
+    timings = []
+    with app_module.app.test_request_context('/files/bench'):
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            html = render_template('item_rows.html', items=items, current_path='bench')
+            timings.append(time.perf_counter() - started)
+
+    results = {
+        'rows': args.rows,
+        'html_bytes': len(html.encode()),
+        'bytes_per_row': len(html.encode()) / args.rows,
+        'render_ms_per_1k_rows': statistics.median(timings) * 1000 / (args.rows / 1000),
+        'lookup_us_per_1k_files': lookup_seconds * 1e6
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.rows} rows: {results['html_bytes'] / 1024:.0f} KB, "
+          f"{results['bytes_per_row']:.0f} bytes/row, "
+          f"{results['render_ms_per_1k_rows']:.2f} ms per 1k rows, "
+          f"category+icon lookups {results['lookup_us_per_1k_files']:.0f} us per 1k files")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import os
+import secrets
+
+from metadata_index import hash_file
+
+
+class BlobStore:
+    """Content-addressed store deduplicating identical uploads
+
+    Every distinct file body is kept once as <directory>/<ab>/<sha256>, and
+    files under uploads are hard links to their blob. Folder entries are
+    therefore plain references that the rest of Filely reads, renames and
+    serves like any other file, and the link count of a blob is its
+    reference count: a blob whose only remaining link is its own is
+    garbage and release() deletes it.
+
+    The store must be on the same filesystem as uploads. Files must never
+    be rewritten in place, since that would change every copy.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def blob_path(self, content_hash):
+        return os.path.join(self.directory, content_hash[:2], content_hash)
+
+    def add(self, path, content_hash=None):
+        """Turn the file at path into a reference to its blob
+
+        The first copy of a content becomes the blob itself; later copies
+        are replaced by a link to it, freeing their space. Returns the hash.
+        """
+        if content_hash is None:
+            content_hash = hash_file(path)
+        blob = self.blob_path(content_hash)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        while True:
+            try:
+                os.link(path, blob)
+                return content_hash
+            except FileExistsError:
+                pass
+            if os.path.samefile(path, blob):
+                return content_hash
+            # Link next to the blob first so the swap is a single atomic rename
+            temp_path = f'{blob}.{secrets.token_hex(8)}.link'
+            try:
+                os.link(blob, temp_path)
+            except FileNotFoundError:
+                continue  # released meanwhile, path becomes the blob
+            os.replace(temp_path, path)
+            return content_hash
+
+    def refcount(self, content_hash):
+        """Number of files referencing the blob of content_hash"""
+        try:
+            return os.stat(self.blob_path(content_hash)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def release(self, content_hashes):
+        """Delete the blobs of content_hashes that are no longer referenced"""
+        for content_hash in content_hashes:
+            if self.refcount(content_hash) == 0:
+                try:
+                    os.remove(self.blob_path(content_hash))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        """Return blob count, stored bytes and references over the store"""
+        blobs = stored_bytes = references = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            for blob in os.scandir(entry.path):
+                if blob.name.endswith('.link'):
+                    continue
+                stat = blob.stat()
+                blobs += 1
+                stored_bytes += stat.st_size
+                references += stat.st_nlink - 1
+        return {'blobs': blobs, 'stored_bytes': stored_bytes, 'references': references}
@@ -0,0 +1,172 @@
+import json
+import os
+import re
+import secrets
+import time
+
+SESSION_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+COPY_BUFFER_SIZE = 256 * 1024
+
+
+class UploadError(Exception):
+    """A chunked upload request that cannot be honoured"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChunkedUploadStore:
+    """Resumable uploads written chunk by chunk into a preallocated file
+
+    Each session keeps three files in the store directory, which lives on
+    the same filesystem as the uploads tree so that finishing an upload is
+    a single atomic rename:
+
+    - <id>.json: the session metadata, written once
+    - <id>.part: the file body, preallocated to its final size
+    - <id>.map:  one byte per chunk, set once the chunk is on disk
+
+    Chunks land with positional writes on their own file descriptor and
+    flag themselves in the map with a one-byte write, so they can arrive in
+    any order, in parallel, and even on different worker processes.
+    """
+
+    def __init__(self, directory, session_ttl=24 * 3600):
+        self.directory = directory
+        self.session_ttl = session_ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id, suffix):
+        if not SESSION_ID_RE.match(session_id):
+            raise UploadError('Upload session not found!', 404)
+        return os.path.join(self.directory, session_id + suffix)
+
+    def create(self, folder, filename, size, chunk_size):
+        """Start a session and preallocate its file"""
+        self.expire_sessions()
+        session_id = secrets.token_hex(16)
+        chunk_count = max(1, -(-size // chunk_size))
+        session = {
+            'id': session_id,
+            'folder': folder,
+            'filename': filename,
+            'size': size,
+            'chunk_size': chunk_size,
+            'chunk_count': chunk_count,
+            'created': time.time()
+        }
+
+        fd = os.open(self._path(session_id, '.part'), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            if size and hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:
+                    os.ftruncate(fd, size)
+            else:
+                os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+        with open(self._path(session_id, '.map'), 'wb') as f:
+            f.truncate(chunk_count)
+        with open(self._path(session_id, '.json'), 'w') as f:
+            json.dump(session, f)
+        return session
+
+    def get(self, session_id):
+        try:
+            with open(self._path(session_id, '.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError('Upload session not found!', 404)
+
+    def missing_chunks(self, session):
+        try:
+            with open(self._path(session['id'], '.map'), 'rb') as f:
+                received = f.read()
+        except FileNotFoundError:
+            raise UploadError('Upload session not found!', 404)
+        return [index for index in range(session['chunk_count'])
+                if index >= len(received) or not received[index]]
+
+    def write_chunk(self, session, index, stream):
+        """Copy one chunk from stream to its offset, in constant memory"""
+        if not 0 <= index < session['chunk_count']:
+            raise UploadError('Invalid chunk number!')
+        offset = index * session['chunk_size']
+        expected = min(session['chunk_size'], session['size'] - offset)
+
+        written = 0
+        try:
+            fd = os.open(self._path(session['id'], '.part'), os.O_WRONLY)
+        except FileNotFoundError:
+            raise UploadError('Upload session not found!', 404)
+        try:
+            while written < expected:
+                block = stream.read(min(COPY_BUFFER_SIZE, expected - written))
+                if not block:
+                    break
+                written += os.pwrite(fd, block, offset + written)
+            if written != expected or stream.read(1):
+                raise UploadError(f'Chunk {index} must be exactly {expected} bytes!')
+        finally:
+            os.close(fd)
+
+        fd = os.open(self._path(session['id'], '.map'), os.O_WRONLY)
+        try:
+            os.pwrite(fd, b'\x01', index)
+        finally:
+            os.close(fd)
+        return written
+
+    def finish(self, session, target_path):
+        """Move the completed file to target_path (atomic, same filesystem)
+
+        As with a form upload, the file replaces a file of the same name but
+        not a folder. The body is first claimed by renaming it, so that only
+        one of concurrent calls completes the session.
+        """
+        missing = self.missing_chunks(session)
+        if missing:
+            raise UploadError(f'{len(missing)} chunk(s) still missing!', 409)
+        if os.path.isdir(target_path):
+            raise UploadError('An item with that name already exists!', 409)
+
+        part_path = self._path(session['id'], '.part')
+        claimed_path = self._path(session['id'], '.claimed')
+        try:
+            os.rename(part_path, claimed_path)
+        except FileNotFoundError:
+            raise UploadError('Upload session not found!', 404)
+        try:
+            os.replace(claimed_path, target_path)
+        except OSError as e:
+            # Give the body back for the client to try again
+            os.rename(claimed_path, part_path)
+            if isinstance(e, IsADirectoryError):
+                raise UploadError('An item with that name already exists!', 409)
+            raise
+        self.discard(session['id'])
+
+    def discard(self, session_id):
+        for suffix in ('.part', '.claimed', '.map', '.json'):
+            try:
+                os.remove(self._path(session_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def expire_sessions(self):
+        """Drop sessions untouched for longer than session_ttl"""
+        cutoff = time.time() - self.session_ttl
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith('.map'):
+                try:
+                    if os.stat(os.path.join(self.directory, name)).st_mtime < cutoff:
+                        self.discard(name[:-len('.map')])
+                except (OSError, UploadError):
+                    pass
@@ -0,0 +1,173 @@
+import mimetypes
+import os
+import secrets
+import unicodedata
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+
+import fsops
+
+# Multi-range requests with more ranges than this (after merging) get the whole file
+MAX_RANGES = 32
+READ_BLOCK_SIZE = 256 * 1024
+# Servers whose wsgi.file_wrapper stops at Content-Length (gunicorn, which uses sendfile)
+CLIPPING_SERVERS = ('gunicorn',)
+
+
+def default_etag(stat):
+    return f'{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def content_disposition(download_name, as_attachment):
+    """Header value and parameters for Content-Disposition, as Werkzeug builds them"""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': "UTF-8''" + quote(download_name, safe="!#$&+^`|~")}
+    else:
+        names = {'filename': download_name}
+    return 'attachment' if as_attachment else 'inline', names
+
+
+def requested_ranges(size, etag, last_modified):
+    """Return the byte ranges to serve as sorted (start, stop) pairs
+
+    None means the whole file: no usable Range header, an If-Range that no
+    longer matches, or too many ranges. An empty list is unsatisfiable.
+    """
+    rng = request.range
+    if rng is None or rng.units != 'bytes':
+        return None
+    if_range = request.if_range
+    if if_range.etag is not None and if_range.etag != etag:
+        return None
+    # A date validator only matches exactly (RFC 9110, section 13.1.5)
+    if if_range.date is not None and if_range.date != last_modified:
+        return None
+
+    ranges = []
+    for start, stop in rng.ranges:
+        if start < 0:
+            start, stop = max(0, size + start), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+        else:
+            merged.append((start, stop))
+    return merged if len(merged) <= MAX_RANGES else None
+
+
+def read_range(f, start, stop):
+    """Yield the bytes of f from start to stop in blocks"""
+    offset = start
+    while offset < stop:
+        block = os.pread(f.fileno(), min(READ_BLOCK_SIZE, stop - offset), offset)
+        if not block:
+            return
+        offset += len(block)
+        yield block
+
+
+def iter_range(f, start, stop):
+    """Yield one range of f as a response body, closing f at the end"""
+    try:
+        yield from read_range(f, start, stop)
+    finally:
+        f.close()
+
+
+def iter_byteranges(f, ranges, size, mimetype, boundary):
+    """Yield a multipart/byteranges body, closing f at the end"""
+    try:
+        for start, stop in ranges:
+            yield part_header(start, stop, size, mimetype, boundary)
+            yield from read_range(f, start, stop)
+        yield f'\r\n--{boundary}--\r\n'.encode('ascii')
+    finally:
+        f.close()
+
+
+def part_header(start, stop, size, mimetype, boundary):
+    return (f'\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n'
+            f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('ascii')
+
+
+def send_file_ranged(path, mimetype=None, as_attachment=False, download_name=None, etag=None):
+    """Serve a file with validators, conditional requests and byte ranges
+
+    Sets a strong ETag (etag, or one derived from the inode, mtime and
+    size) and Last-Modified, answers If-None-Match / If-Modified-Since with
+    304 and Range requests, guarded by If-Range, with 206 single or
+    multipart/byteranges responses (416 when unsatisfiable).
+
+    Whole files and ranges running to the end of the file are handed to the
+    server's wsgi.file_wrapper with the file positioned at the start of the
+    range, so servers that use sendfile send the bytes without them passing
+    through Python. Bounded ranges are too on servers that clip the wrapper
+    to Content-Length; elsewhere they are read with pread.
+    """
+    if download_name is None:
+        download_name = os.path.basename(path)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+    f = fsops.open(path, 'rb')
+    stat = os.fstat(f.fileno())
+    size = stat.st_size
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+
+    response = Response(mimetype=mimetype, direct_passthrough=True)
+    disposition, names = content_disposition(download_name, as_attachment)
+    response.headers.set('Content-Disposition', disposition, **names)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.set_etag(etag or default_etag(stat))
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    etag = response.get_etag()[0]
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        f.close()
+        response.status_code = 304
+        for header in ('Content-Type', 'Content-Disposition'):
+            del response.headers[header]
+        return response
+
+    ranges = requested_ranges(size, etag, last_modified)
+    if ranges == []:
+        f.close()
+        response.status_code = 416
+        response.headers['Content-Range'] = f'bytes */{size}'
+        response.content_length = 0
+        return response
+
+    if ranges is None or len(ranges) == 1:
+        start, stop = ranges[0] if ranges else (0, size)
+        if stop == size or request.environ.get('SERVER_SOFTWARE', '').startswith(CLIPPING_SERVERS):
+            f.seek(start)
+            response.response = wrap_file(request.environ, f, READ_BLOCK_SIZE)
+        else:
+            response.response = iter_range(f, start, stop)
+        response.content_length = stop - start
+        if ranges:
+            response.status_code = 206
+            response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        return response
+
+    boundary = secrets.token_hex(16)
+    response.response = iter_byteranges(f, ranges, size, mimetype, boundary)
+    response.content_length = sum(len(part_header(start, stop, size, mimetype, boundary)) + stop - start
+                                  for start, stop in ranges) + len(f'\r\n--{boundary}--\r\n')
+    response.status_code = 206
+    response.content_type = f'multipart/byteranges; boundary={boundary}'
+    return response
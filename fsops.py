@@ -0,0 +1,145 @@
+"""Filesystem calls counted and timed per request
+
+Drop-in replacements for the os, os.path and shutil functions the app
+calls on the request path. Once track() has been called in a thread, each
+call is added to that thread's FsOps under one of OPS; elsewhere, in
+background threads for instance, they cost a context variable lookup on
+top of the call. A call counts once whatever number of syscalls it makes,
+so rmtree of a folder is one unlink and walk counts a list per folder.
+"""
+import builtins
+import contextvars
+import functools
+import os
+import shutil
+import time
+
+OPS = ('stat', 'list', 'open', 'mkdir', 'rename', 'unlink')
+
+_current = contextvars.ContextVar('fs_ops', default=None)
+
+
+class FsOps:
+    """Number of calls and seconds spent per kind of operation"""
+
+    def __init__(self):
+        self.counts = dict.fromkeys(OPS, 0)
+        self.seconds = dict.fromkeys(OPS, 0.0)
+
+    def add(self, op, seconds):
+        self.counts[op] += 1
+        self.seconds[op] += seconds
+
+    def header(self):
+        """Counts as "stat=12, list=1, open=0, ..." """
+        return ', '.join(f'{op}={self.counts[op]}' for op in OPS)
+
+    def server_timing(self):
+        """Timings in the Server-Timing header format, shown by browser devtools"""
+        return ', '.join(f'fs-{op};dur={self.seconds[op] * 1000:.3f};desc="{self.counts[op]} calls"'
+                         for op in OPS if self.counts[op])
+
+
+def track():
+    """Count the filesystem calls of the current thread in a new FsOps"""
+    ops = FsOps()
+    _current.set(ops)
+    return ops
+
+
+def _timed(op, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        ops = _current.get()
+        if ops is None:
+            return function(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            ops.add(op, time.perf_counter() - started)
+    return wrapper
+
+
+stat = _timed('stat', os.stat)
+exists = _timed('stat', os.path.exists)
+lexists = _timed('stat', os.path.lexists)
+isdir = _timed('stat', os.path.isdir)
+isfile = _timed('stat', os.path.isfile)
+islink = _timed('stat', os.path.islink)
+getsize = _timed('stat', os.path.getsize)
+entry_stat = _timed('stat', os.DirEntry.stat)  # entry_stat(entry) for entry.stat()
+listdir = _timed('list', os.listdir)
+open = _timed('open', builtins.open)
+makedirs = _timed('mkdir', os.makedirs)
+mkdir = _timed('mkdir', os.mkdir)
+rename = _timed('rename', os.rename)
+replace = _timed('rename', os.replace)
+move = _timed('rename', shutil.move)
+remove = _timed('unlink', os.remove)
+rmdir = _timed('unlink', os.rmdir)
+rmtree = _timed('unlink', shutil.rmtree)
+
+
+class _Scandir:
+    """os.scandir iterator timing the directory reads as one list call"""
+
+    def __init__(self, path):
+        self._ops = _current.get()
+        self._seconds = 0.0
+        self._iterator = None
+        self._iterator = self._time(os.scandir, path)
+
+    def _time(self, function, *args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self._seconds += time.perf_counter() - started
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self._time(next, self._iterator)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if self._iterator is None:
+            return
+        self._time(self._iterator.close)
+        self._iterator = None
+        self._ops.add('list', self._seconds)
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def scandir(path='.'):
+    if _current.get() is None:
+        return os.scandir(path)
+    return _Scandir(path)
+
+
+def walk(top, topdown=True, onerror=None, followlinks=False):
+    """os.walk, each folder read counting as a list call"""
+    iterator = os.walk(top, topdown, onerror, followlinks)
+    while True:
+        ops = _current.get()
+        started = time.perf_counter()
+        try:
+            entry = next(iterator)
+        except StopIteration:
+            return
+        if ops is not None:
+            ops.add('list', time.perf_counter() - started)
+        yield entry
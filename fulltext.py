@@ -0,0 +1,579 @@
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+INDEXED_EXTENSIONS = {'txt', 'pdf'}
+
+# Positions kept per term and document; enough for snippets, bounds memory
+MAX_POSITIONS_PER_TERM = 16
+# Postings buffered in memory before they are flushed as a new segment
+FLUSH_POSTINGS = 200000
+# Segments of a size tier merged together, see merge_segments()
+MERGE_FACTOR = 8
+# Segments smaller than this are all in the first tier
+TIER_BASE_BYTES = 1024 * 1024
+# Attempts at indexing a document before it is left 'failed' until it changes
+MAX_ATTEMPTS = 5
+# Delay before the first retry, doubled after each failed attempt
+RETRY_DELAY = 60
+# Document ids looked up per query by search()
+SEARCH_LOOKUP_CHUNK = 500
+
+logger = logging.getLogger('fulltext')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    status TEXT NOT NULL,
+    length INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    retry_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS docs_by_status ON docs (status);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (term, segment)
+);
+CREATE INDEX IF NOT EXISTS postings_by_segment ON postings (segment);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    size INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS removed (
+    path TEXT PRIMARY KEY
+);
+"""
+
+# Documents left below a removed folder until prune_removed() deletes them are not live
+LIVE = ("NOT EXISTS (SELECT 1 FROM removed WHERE docs.path > removed.path || '/' "
+        "AND docs.path < removed.path || '0')")
+
+
+def is_indexable(path):
+    return '.' in path and path.rsplit('.', 1)[1].lower() in INDEXED_EXTENSIONS
+
+
+# Postings compression: unsigned LEB128 varints, ids and positions delta-encoded
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data):
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield value
+            value = shift = 0
+
+
+def encode_postings(postings):
+    """Encode [(doc_id, tf, [positions])] sorted by doc_id"""
+    out = bytearray()
+    last_doc = 0
+    for doc_id, tf, positions in postings:
+        encode_varint(doc_id - last_doc, out)
+        encode_varint(tf, out)
+        encode_varint(len(positions), out)
+        last_pos = 0
+        for pos in positions:
+            encode_varint(pos - last_pos, out)
+            last_pos = pos
+        last_doc = doc_id
+    return bytes(out)
+
+
+def decode_postings(data):
+    values = decode_varints(data)
+    doc_id = 0
+    for delta in values:
+        doc_id += delta
+        tf = next(values)
+        count = next(values)
+        positions = []
+        pos = 0
+        for _ in range(count):
+            pos += next(values)
+            positions.append(pos)
+        yield doc_id, tf, positions
+
+
+# Text extraction (runs in the worker processes)
+
+_PDF_STREAM_RE = re.compile(rb'<<(.*?)>>\s*stream\r?\n(.*?)\r?\nendstream', re.DOTALL)
+_PDF_TEXT_RE = re.compile(rb'\((?:\\.|[^\\)])*\)\s*(?:Tj|\'|")|\[(?:\\.|[^\]])*\]\s*TJ', re.DOTALL)
+_PDF_STRING_RE = re.compile(rb'\(((?:\\.|[^\\)])*)\)', re.DOTALL)
+_PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+
+def _unescape_pdf_string(raw):
+    def replace(match):
+        escaped = match.group(1)
+        if escaped[:1].isdigit():
+            return bytes([int(escaped, 8) & 0xFF])
+        return _PDF_ESCAPES.get(escaped, escaped)
+    return re.sub(rb'\\([0-7]{1,3}|.)', replace, raw, flags=re.DOTALL)
+
+
+def _extract_pdf_text_fallback(data):
+    """Pull text shown with Tj/TJ out of (Flate-compressed) content streams"""
+    pieces = []
+    for match in _PDF_STREAM_RE.finditer(data):
+        header, body = match.groups()
+        if b'/FlateDecode' in header:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                continue
+        elif b'/Filter' in header:
+            continue
+        for op in _PDF_TEXT_RE.finditer(body):
+            text = b''.join(_unescape_pdf_string(s) for s in _PDF_STRING_RE.findall(op.group(0)))
+            pieces.append(text.decode('latin-1'))
+    return ' '.join(pieces)
+
+
+def extract_text(path, max_bytes):
+    """Return the text of a .txt or .pdf file (at most max_bytes are read)
+
+    PDFs are read with pypdf when it is installed, and by the fallback
+    content stream parser otherwise or when pypdf cannot read them.
+    """
+    with open(path, 'rb') as f:
+        data = f.read(max_bytes)
+    if not path.lower().endswith('.pdf'):
+        return data.decode('utf-8', errors='replace')
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return _extract_pdf_text_fallback(data)
+    try:
+        import io
+        reader = PdfReader(io.BytesIO(data))
+        return '\n'.join(page.extract_text() or '' for page in reader.pages)
+    except Exception:
+        return _extract_pdf_text_fallback(data)
+
+
+def tokenize(text):
+    """Yield (term, offset, length) for every word of text"""
+    for match in TOKEN_RE.finditer(text):
+        yield match.group(0).lower(), match.start(), match.end() - match.start()
+
+
+def analyze_document(path, max_bytes):
+    """Worker entry point: return ({term: (tf, positions)}, text length)"""
+    text = extract_text(path, max_bytes)
+    terms = {}
+    for term, offset, _ in tokenize(text):
+        entry = terms.get(term)
+        if entry is None:
+            terms[term] = [1, [offset]]
+        else:
+            entry[0] += 1
+            if len(entry[1]) < MAX_POSITIONS_PER_TERM:
+                entry[1].append(offset)
+    return terms, len(text)
+
+
+class FullTextIndex:
+    """Inverted index of the text and PDF documents under uploads
+
+    Postings are grouped into immutable segments of delta/varint encoded
+    blobs stored in SQLite. A re-indexed document gets a new id, so postings
+    of removed or stale ids are simply skipped at query time and dropped
+    when segments are merged. The docs table doubles as the work queue:
+    rows left 'pending' after a restart are picked up again, and documents
+    that fail to index stay pending until retry_at, see index_pending().
+    Removed folders are recorded in the removed table and the documents
+    below them deleted by the indexer, see prune_removed().
+    """
+
+    def __init__(self, db_path, root, workers=2, max_doc_bytes=32 * 1024 * 1024):
+        self.db_path = db_path
+        self.root = root
+        self.workers = workers
+        self.max_doc_bytes = max_doc_bytes
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # Indexes created before retries and tiered merges existed
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(docs)')}
+            if 'attempts' not in columns:
+                conn.execute('ALTER TABLE docs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+                conn.execute('ALTER TABLE docs ADD COLUMN retry_at REAL NOT NULL DEFAULT 0')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(segments)')}
+            if 'size' not in columns:
+                conn.execute('ALTER TABLE segments ADD COLUMN size INTEGER NOT NULL DEFAULT 0')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def disk_path(self, path):
+        return os.path.join(self.root, *path.split('/'))
+
+    # Queue maintenance (called from the request threads)
+
+    def enqueue(self, path):
+        """(Re-)index path, relative to the uploads root"""
+        if not is_indexable(path):
+            return
+        try:
+            stat = os.stat(self.disk_path(path))
+        except OSError:
+            return self.remove(path)
+        conn = self.conn
+        self._clear_removed(path)
+        conn.execute('DELETE FROM docs WHERE path = ?', (path,))
+        conn.execute("INSERT INTO docs (path, size, mtime, status) VALUES (?, ?, ?, 'pending')",
+                     (path, stat.st_size, stat.st_mtime))
+
+    def remove(self, path):
+        """Forget path and every document below it
+
+        Documents below path are only deleted by prune_removed(), until
+        then queries skip them.
+        """
+        conn = self.conn
+        conn.execute('DELETE FROM docs WHERE path = ?', (path,))
+        conn.execute('INSERT OR IGNORE INTO removed (path) VALUES (?)', (path,))
+
+    def _clear_removed(self, path):
+        """Delete the documents left below removed folders that path, or an ancestor, reuses"""
+        conn = self.conn
+        parts = path.split('/')
+        for folder in ['/'.join(parts[:i]) for i in range(1, len(parts) + 1)]:
+            if conn.execute('SELECT 1 FROM removed WHERE path = ?', (folder,)).fetchone() is not None:
+                conn.execute('DELETE FROM docs WHERE path > ? AND path < ?', (folder + '/', folder + '0'))
+                conn.execute('DELETE FROM removed WHERE path = ? OR (path > ? AND path < ?)',
+                             (folder, folder + '/', folder + '0'))
+
+    def move(self, old_path, new_path):
+        """Re-key the documents of old_path (and below it) under new_path"""
+        conn = self.conn
+        self._clear_removed(new_path)
+        conn.execute('UPDATE docs SET path = ? || substr(path, ?) WHERE path > ? AND path < ?',
+                     (new_path, len(old_path) + 1, old_path + '/', old_path + '0'))
+        conn.execute('UPDATE removed SET path = ? || substr(path, ?) WHERE path > ? AND path < ?',
+                     (new_path, len(old_path) + 1, old_path + '/', old_path + '0'))
+        if is_indexable(new_path):
+            conn.execute('UPDATE docs SET path = ? WHERE path = ?', (new_path, old_path))
+        else:
+            conn.execute('DELETE FROM docs WHERE path = ?', (old_path,))
+
+    def sync(self, entries):
+        """Queue new or changed documents and drop vanished ones
+
+        entries yields (path, size, mtime) for every file in the tree.
+        """
+        self.prune_removed()
+        conn = self.conn
+        known = {row[0]: (row[1], row[2]) for row in conn.execute('SELECT path, size, mtime FROM docs')}
+        conn.execute('BEGIN')
+        for path, size, mtime in entries:
+            if not is_indexable(path):
+                continue
+            if known.pop(path, None) != (size, mtime):
+                conn.execute('DELETE FROM docs WHERE path = ?', (path,))
+                conn.execute("INSERT INTO docs (path, size, mtime, status) VALUES (?, ?, ?, 'pending')",
+                             (path, size, mtime))
+        for path in known:
+            conn.execute('DELETE FROM docs WHERE path = ?', (path,))
+        conn.execute('COMMIT')
+
+    def prune_removed(self, batch_size=2000):
+        """Delete the documents left below removed folders, batch_size at a time"""
+        conn = self.conn
+        for (path,) in conn.execute('SELECT path FROM removed').fetchall():
+            while True:
+                conn.execute('BEGIN IMMEDIATE')
+                if conn.execute('SELECT 1 FROM removed WHERE path = ?', (path,)).fetchone() is None:
+                    conn.execute('COMMIT')
+                    break
+                deleted = conn.execute('DELETE FROM docs WHERE id IN (SELECT id FROM docs '
+                                       'WHERE path > ? AND path < ? LIMIT ?)',
+                                       (path + '/', path + '0', batch_size)).rowcount
+                if deleted < batch_size:
+                    conn.execute('DELETE FROM removed WHERE path = ?', (path,))
+                conn.execute('COMMIT')
+                if deleted < batch_size:
+                    break
+
+    def pending_count(self):
+        return self.conn.execute(f"SELECT COUNT(*) FROM docs WHERE status = 'pending' AND {LIVE}").fetchone()[0]
+
+    # Background indexing
+
+    def run_forever(self, poll_interval=1):
+        """Indexer loop of the indexer process, see main()
+
+        Exits when the process that started it goes away, or when a worker
+        dies and breaks the pool, for supervise_indexer() to start afresh.
+        """
+        parent_pid = os.getppid()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            while os.getppid() == parent_pid:
+                try:
+                    self.prune_removed()
+                    indexed = self.index_pending(pool)
+                except BrokenProcessPool:
+                    logger.exception('Full-text indexer worker died')
+                    return
+                except Exception:
+                    logger.exception('Full-text indexer error')
+                    indexed = 0
+                if not indexed:
+                    time.sleep(poll_interval)
+
+    def index_pending(self, pool, batch_size=64):
+        """Index one batch of pending documents, return how many were tried
+
+        At most workers * 2 documents are in flight, and postings are
+        flushed to a segment every FLUSH_POSTINGS, so memory stays bounded
+        whatever the number of pending documents. A document that fails
+        is retried after RETRY_DELAY, twice as long after each attempt,
+        and left 'failed' after MAX_ATTEMPTS until it is modified; one
+        that no longer exists is forgotten.
+        """
+        conn = self.conn
+        rows = conn.execute("SELECT id, path FROM docs WHERE status = 'pending' AND retry_at <= ? "
+                            f"AND {LIVE} ORDER BY id LIMIT ?", (time.time(), batch_size)).fetchall()
+        if not rows:
+            return 0
+
+        buffer = {}
+        buffered = 0
+        done = []
+        in_flight = []
+        queue = list(rows)
+        while queue or in_flight:
+            while queue and len(in_flight) < self.workers * 2:
+                doc_id, path = queue.pop(0)
+                future = pool.submit(analyze_document, self.disk_path(path), self.max_doc_bytes)
+                in_flight.append((doc_id, path, future))
+            doc_id, path, future = in_flight.pop(0)
+            try:
+                terms, length = future.result()
+            except (FileNotFoundError, NotADirectoryError):
+                # Removed since it was queued, its removal may not have reached us yet
+                conn.execute('DELETE FROM docs WHERE id = ?', (doc_id,))
+                continue
+            except Exception as e:
+                self._failed(doc_id, path, e)
+                if isinstance(e, BrokenProcessPool):
+                    raise
+                continue
+            done.append((doc_id,))
+            for term, (tf, positions) in terms.items():
+                buffer.setdefault(term, []).append((doc_id, tf, positions))
+            buffered += len(terms)
+            conn.execute("UPDATE docs SET length = ? WHERE id = ?", (length, doc_id))
+            if buffered >= FLUSH_POSTINGS:
+                self._flush(buffer)
+                buffer, buffered = {}, 0
+
+        self._flush(buffer)
+        # Only now are the documents durably searchable
+        conn.executemany("UPDATE docs SET status = 'indexed' WHERE id = ? AND status = 'pending'", done)
+        self.merge_segments()
+        return len(rows)
+
+    def _failed(self, doc_id, path, error):
+        conn = self.conn
+        row = conn.execute('SELECT attempts FROM docs WHERE id = ?', (doc_id,)).fetchone()
+        if row is None:
+            return  # removed or re-queued meanwhile
+        attempts = row[0] + 1
+        if attempts >= MAX_ATTEMPTS:
+            logger.warning('Giving up indexing %s after %d attempts: %r', path, attempts, error)
+            conn.execute("UPDATE docs SET status = 'failed', attempts = ? WHERE id = ?", (attempts, doc_id))
+        else:
+            delay = RETRY_DELAY * 2 ** (attempts - 1)
+            logger.warning('Could not index %s, retrying in %ds: %r', path, delay, error)
+            conn.execute('UPDATE docs SET attempts = ?, retry_at = ? WHERE id = ?',
+                         (attempts, time.time() + delay, doc_id))
+
+    def _flush(self, buffer):
+        if not buffer:
+            return
+        conn = self.conn
+        rows = [(term, encode_postings(sorted(postings))) for term, postings in buffer.items()]
+        conn.execute('BEGIN IMMEDIATE')
+        segment = conn.execute('INSERT INTO segments (size) VALUES (?)',
+                               (sum(len(data) for _, data in rows),)).lastrowid
+        conn.executemany('INSERT INTO postings (term, segment, data) VALUES (?, ?, ?)',
+                         [(term, segment, data) for term, data in rows])
+        conn.execute('COMMIT')
+
+    @staticmethod
+    def _tier(size):
+        if size < TIER_BASE_BYTES:
+            return 0
+        return int(math.log(size / TIER_BASE_BYTES, MERGE_FACTOR)) + 1
+
+    def merge_segments(self):
+        """Merge segments of about the same size, a tier at a time
+
+        A segment's tier grows with the log of its size, in MERGE_FACTOR
+        steps. Once a tier holds MERGE_FACTOR segments they are merged into
+        one of the next tier, so postings are rewritten once per tier rather
+        than on every merge and the number of segments stays logarithmic in
+        the size of the index.
+        """
+        while True:
+            tiers = {}
+            for segment, size in self.conn.execute('SELECT id, size FROM segments ORDER BY id'):
+                tiers.setdefault(self._tier(size), []).append(segment)
+            full = [segments for _, segments in sorted(tiers.items()) if len(segments) >= MERGE_FACTOR]
+            if not full:
+                return
+            self._merge(full[0][:MERGE_FACTOR])
+
+    def _merge(self, segments):
+        """Replace segments by one segment, dropping postings of dead documents"""
+        conn = self.conn
+        placeholders = ', '.join('?' * len(segments))
+        conn.execute('BEGIN IMMEDIATE')
+        live = {row[0] for row in conn.execute("SELECT id FROM docs WHERE status = 'indexed'")}
+        merged_segment = conn.execute('INSERT INTO segments DEFAULT VALUES').lastrowid
+        size = 0
+        rows = conn.execute(f'SELECT term, data FROM postings WHERE segment IN ({placeholders}) ORDER BY term',
+                            segments)
+        for term, group in itertools.groupby(rows, key=lambda row: row[0]):
+            merged = sorted(p for _, data in group for p in decode_postings(data) if p[0] in live)
+            if merged:
+                data = encode_postings(merged)
+                size += len(data)
+                conn.execute('INSERT INTO postings (term, segment, data) VALUES (?, ?, ?)',
+                             (term, merged_segment, data))
+        conn.execute(f'DELETE FROM postings WHERE segment IN ({placeholders})', segments)
+        conn.execute(f'DELETE FROM segments WHERE id IN ({placeholders})', segments)
+        conn.execute('UPDATE segments SET size = ? WHERE id = ?', (size, merged_segment))
+        conn.execute('COMMIT')
+
+    # Queries
+
+    def search(self, query, offset=0, limit=20, max_snippets=3):
+        """Return (total, results) of documents containing every query term
+
+        Results are ranked by tf-idf and carry up to max_snippets
+        [offset, length] pairs locating matches in the extracted text.
+
+        The posting lists of the terms are intersected first and only the
+        documents holding every term are looked up, so the cost follows
+        the length of those lists rather than the size of the index. As
+        in other segment-based indexes, postings of stale ids count
+        towards document frequencies until their segment is merged.
+        """
+        terms = {}
+        for term, _, length in tokenize(query):
+            terms[term] = length
+        if not terms:
+            return 0, []
+
+        conn = self.conn
+        matches = {}
+        for term in terms:
+            matches[term] = {}
+            for (data,) in conn.execute('SELECT data FROM postings WHERE term = ?', (term,)):
+                for doc_id, tf, positions in decode_postings(data):
+                    matches[term][doc_id] = (tf, positions)
+            if not matches[term]:
+                return 0, []
+        candidates = sorted(set.intersection(*(set(term_matches) for term_matches in matches.values())))
+
+        docs = {}
+        for i in range(0, len(candidates), SEARCH_LOOKUP_CHUNK):
+            chunk = candidates[i:i + SEARCH_LOOKUP_CHUNK]
+            docs.update(conn.execute(
+                f"SELECT id, path FROM docs WHERE status = 'indexed' AND {LIVE} "
+                f"AND id IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+        if not docs:
+            return 0, []
+        total_docs = max(conn.execute("SELECT COUNT(*) FROM docs WHERE status = 'indexed'").fetchone()[0], 1)
+
+        scores = dict.fromkeys(docs, 0)
+        snippets = {doc_id: [] for doc_id in docs}
+        for term, length in terms.items():
+            idf = math.log(1 + total_docs / (1 + len(matches[term])))
+            for doc_id in docs:
+                tf, positions = matches[term][doc_id]
+                scores[doc_id] += (1 + math.log(tf)) * idf
+                snippets[doc_id].extend([pos, length] for pos in positions)
+
+        ranked = sorted(scores.items(), key=lambda pair: (-pair[1], docs[pair[0]]))
+        results = [{
+            'path': docs[doc_id],
+            'score': round(score, 4),
+            'snippets': sorted(snippets[doc_id])[:max_snippets]
+        } for doc_id, score in ranked[offset:offset + limit]]
+        return len(ranked), results
+
+
+def supervise_indexer(db_path, root, workers, max_doc_bytes, restart_delay=5):
+    """Keep an indexer process running (meant for a background thread)
+
+    Indexing runs in its own process so that its worker pool is spawned
+    from a small, single-threaded parent rather than from the web server.
+    """
+    while True:
+        process = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), db_path, root,
+            '--workers', str(workers), '--max-doc-bytes', str(max_doc_bytes)
+        ])
+        process.wait()
+        time.sleep(restart_delay)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Filely full-text indexer')
+    parser.add_argument('db_path')
+    parser.add_argument('root')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--max-doc-bytes', type=int, default=32 * 1024 * 1024)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s fulltext %(levelname)s: %(message)s')
+    index = FullTextIndex(args.db_path, args.root, args.workers, args.max_doc_bytes)
+    index.run_forever()
+
+
+if __name__ == '__main__':
+    main()
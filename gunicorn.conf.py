@@ -0,0 +1,44 @@
+# Production server settings: gunicorn --config gunicorn.conf.py app:app
+#
+# Pre-fork workers, each running a pool of threads, spread the app over every
+# core. Workers load the app themselves (no preload), so each has its own
+# SQLite connections and background threads, and `kill -HUP <master pid>`
+# reloads gracefully: new workers load the new code and warm up while the
+# old ones finish their requests.
+import multiprocessing
+import os
+import secrets
+
+bind = os.environ.get('FILELY_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('FILELY_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('FILELY_THREADS', 8))
+
+# Uploads and downloads can be long, the timeout only applies to a worker
+# that stops reporting to the master
+timeout = int(os.environ.get('FILELY_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('FILELY_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+preload_app = False
+
+# Keep worker heartbeats off disk where available
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    """Name this server start, the indexes are reconciled once per name
+
+    Workers inherit the name; a HUP reload keeps it, so new workers skip the
+    reconcile and catch up through the change log (see reconcile_on_startup).
+    """
+    os.environ['FILELY_SERVER_ID'] = f'{os.getpid()}-{secrets.token_hex(8)}'
+
+
+def post_worker_init(worker):
+    """Warm the worker up before it accepts connections"""
+    from app import warm_up
+    warm_up()
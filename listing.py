@@ -0,0 +1,146 @@
+import base64
+import json
+import threading
+
+SORT_KEYS = ('name', 'size', 'mtime', 'type')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _primary_key(item, sort):
+    if sort == 'size':
+        return item['size'] if isinstance(item['size'], int) else 0
+    if sort == 'mtime':
+        return item['mtime']
+    if sort == 'type':
+        return item.get('category', 'folder')
+    return item['name'].lower()
+
+
+def sort_key(item, sort='name'):
+    """Full, unique sort key of an item: folders first, then the primary key
+
+    The name is appended as a tie breaker so that a key identifies exactly
+    one position in a listing, which is what cursors rely on.
+    """
+    return [item['type'] != 'folder', _primary_key(item, sort), item['name'].lower(), item['name']]
+
+
+def _at_or_before(key, cursor, descending):
+    """Whether key sorts at or before cursor in a view (folders stay first)"""
+    if key[0] != cursor[0]:
+        return key[0] < cursor[0]
+    return key[1:] >= cursor[1:] if descending else key[1:] <= cursor[1:]
+
+
+class Listing(list):
+    """A sorted directory listing that memoizes its alternative orderings
+
+    Iterates like the plain list of item dicts the templates expect. Sorted
+    views are built once per (sort, order) and kept alongside the listing,
+    so they live and die with its entry in the listing cache.
+    """
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.folder_count = sum(1 for item in self if item['type'] == 'folder')
+        self.file_count = len(self) - self.folder_count
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def sorted_view(self, sort='name', order='asc'):
+        """Return (items, keys) ordered by sort/order"""
+        view_key = (sort, order)
+        with self._lock:
+            view = self._views.get(view_key)
+            if view is None:
+                descending = order == 'desc'
+                keyed = [(sort_key(item, sort), item) for item in self]
+                # Sort descending within each group, keeping folders first
+                keyed.sort(key=lambda pair: pair[0][1:], reverse=descending)
+                keyed.sort(key=lambda pair: pair[0][0])
+                view = ([item for _, item in keyed], [key for key, _ in keyed])
+                self._views[view_key] = view
+            return view
+
+    def page(self, sort='name', order='asc', cursor=None, limit=100):
+        """Return (items, next_cursor) for the page following cursor
+
+        Locating the cursor is a binary search over the memoized view, so
+        the cost of a page depends on its size, not on the folder size.
+        """
+        items, keys = self.sorted_view(sort, order)
+        start = 0
+        if cursor is not None:
+            position = decode_cursor(cursor)
+            descending = order == 'desc'
+            lo, hi = 0, len(keys)
+            try:
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if _at_or_before(keys[mid], position, descending):
+                        lo = mid + 1
+                    else:
+                        hi = mid
+            except TypeError:
+                # The cursor was issued for a different sort key
+                raise InvalidCursor('Cursor does not match the requested sort')
+            start = lo
+
+        end = start + limit
+        next_cursor = encode_cursor(keys[end - 1]) if end < len(items) else None
+        return items[start:end], next_cursor
+
+
+class ChunkedRows:
+    """The rows of a listing page, read chunk by chunk as they are rendered
+
+    fetch(after, limit) returns up to limit items sorted by sort that
+    follow the sort key after (None for the first items). Iterating yields
+    lists of at most chunk_size items until limit items went out, so only
+    one chunk is held in memory at a time. next_cursor is set once the
+    iteration is over.
+    """
+
+    def __init__(self, fetch, limit=100, chunk_size=100, sort='name'):
+        self.fetch = fetch
+        self.limit = limit
+        self.chunk_size = chunk_size
+        self.sort = sort
+        self.next_cursor = None
+
+    def __iter__(self):
+        after = None
+        remaining = self.limit
+        while remaining > 0:
+            wanted = min(self.chunk_size, remaining)
+            items = self.fetch(after, wanted + 1)
+            more = len(items) > wanted
+            items = items[:wanted]
+            if not items:
+                return
+            after = sort_key(items[-1], self.sort)
+            remaining -= len(items)
+            if more and remaining == 0:
+                self.next_cursor = encode_cursor(after)
+            yield items
+            if not more:
+                return
+
+
+def encode_cursor(key):
+    raw = json.dumps(key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise InvalidCursor('Malformed cursor')
+    if not isinstance(key, list) or len(key) != 4:
+        raise InvalidCursor('Malformed cursor')
+    return key
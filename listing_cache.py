@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Rough per-entry overhead of a listing item dict, used to estimate memory
+ITEM_OVERHEAD_BYTES = 600
+
+
+def estimate_listing_size(items):
+    """Estimate how many bytes a listing occupies in memory"""
+    size = 0
+    for item in items:
+        size += ITEM_OVERHEAD_BYTES + len(item['name']) + len(item['path'])
+    return size
+
+
+class ListingCache:
+    """Bounded LRU of directory listings keyed by directory path.
+
+    Each entry stores a validator (inode and mtime of the directory taken
+    before it was scanned), so a hit costs a single os.stat. Changes the
+    directory mtime does not reflect (file sizes, subfolder item counts) are
+    handled by explicit invalidation from the mutating routes.
+
+    on_change(name, delta) is called as the counters (hits, misses,
+    evictions, invalidations) and the size (entries, bytes) change, for
+    them to be exported as metrics.
+    """
+
+    def __init__(self, max_bytes, on_change=lambda name, delta: None):
+        self.max_bytes = max_bytes
+        self.on_change = on_change
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+    @staticmethod
+    def validator(stat_result):
+        return (stat_result.st_ino, stat_result.st_mtime_ns)
+
+    @staticmethod
+    def _key(path):
+        return os.path.normpath(path)
+
+    def get(self, path, validator):
+        """Return the cached listing for path, or None if missing or stale"""
+        key = self._key(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != validator:
+                self.on_change('misses', 1)
+                return None
+            self._entries.move_to_end(key)
+            self.on_change('hits', 1)
+            return entry[1]
+
+    def put(self, path, validator, items):
+        key = self._key(path)
+        size = estimate_listing_size(items)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            entries, old_bytes = len(self._entries), self._bytes
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (validator, items, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.on_change('evictions', 1)
+            self.on_change('entries', len(self._entries) - entries)
+            self.on_change('bytes', self._bytes - old_bytes)
+
+    def invalidate(self, path, recursive=False):
+        """Drop the listing of path (and of every folder below it if recursive)"""
+        key = self._key(path)
+        prefix = key + os.sep
+        with self._lock:
+            if recursive:
+                keys = [k for k in self._entries if k == key or k.startswith(prefix)]
+            else:
+                keys = [key] if key in self._entries else []
+            removed_bytes = 0
+            for k in keys:
+                removed_bytes += self._entries.pop(k)[2]
+            self._bytes -= removed_bytes
+            if keys:
+                self.on_change('invalidations', len(keys))
+                self.on_change('entries', -len(keys))
+                self.on_change('bytes', -removed_bytes)
+
+    def clear(self):
+        with self._lock:
+            if self._entries:
+                self.on_change('invalidations', len(self._entries))
+                self.on_change('entries', -len(self._entries))
+                self.on_change('bytes', -self._bytes)
+            self._entries.clear()
+            self._bytes = 0
@@ -0,0 +1,628 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Name of the folder inside the uploads root that holds Filely's own state
+INTERNAL_DIR_NAME = '.filely'
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Rows kept in the change log; processes further behind resync instead
+CHANGE_LOG_SIZE = 100000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    sort_name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    is_file INTEGER NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    mtime REAL NOT NULL DEFAULT 0,
+    category TEXT NOT NULL,
+    content_hash TEXT,
+    item_count INTEGER NOT NULL DEFAULT 0,
+    file_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_by_name ON entries (parent, is_file, sort_name, name);
+CREATE INDEX IF NOT EXISTS entries_by_size ON entries (parent, is_file, size, sort_name, name);
+CREATE INDEX IF NOT EXISTS entries_by_mtime ON entries (parent, is_file, mtime, sort_name, name);
+CREATE INDEX IF NOT EXISTS entries_by_type ON entries (parent, is_file, category, sort_name, name);
+CREATE INDEX IF NOT EXISTS entries_by_hash ON entries (content_hash);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    is_folder INTEGER NOT NULL,
+    removed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS removed_trees (
+    path TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# Rows left below a removed folder until prune_removed() deletes them are not live
+LIVE = ("NOT EXISTS (SELECT 1 FROM removed_trees WHERE entries.path > removed_trees.path || '/' "
+        "AND entries.path < removed_trees.path || '0')")
+
+# Listing sort keys mapped to the column holding their primary key
+SORT_COLUMNS = {
+    'name': 'sort_name',
+    'size': 'size',
+    'mtime': 'mtime',
+    'type': 'category'
+}
+
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def split_path(path):
+    """Split a relative index path into (parent, name)"""
+    parent, _, name = path.rpartition('/')
+    return parent, name
+
+
+def _subtree_range(path):
+    """Bounds matching every path strictly below path ('0' sorts right after '/')"""
+    return path + '/', path + '0'
+
+
+class MetadataIndex:
+    """On-disk SQLite mirror of the uploads tree
+
+    Rows are keyed by the path relative to the uploads root using '/'
+    separators (the root itself is ''). Mutating routes apply their changes
+    through transaction(); reconcile() brings the index back in sync with
+    the disk at startup.
+
+    Removing a folder only deletes its own row and records it in
+    removed_trees; the rows below it are skipped by every query (see LIVE)
+    and deleted in the background by prune_removed(), so a removal costs
+    the same whatever the size of the folder.
+    """
+
+    def __init__(self, db_path, root, categorize):
+        self.db_path = db_path
+        self.root = root
+        self.categorize = categorize
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(entries)')}
+            if 'file_count' not in columns:
+                # Indexes created before folder totals existed, reconcile() fills them in
+                conn.execute('ALTER TABLE entries ADD COLUMN file_count INTEGER NOT NULL DEFAULT 0')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @property
+    def conn(self):
+        """Connection of the current thread (reopened after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def disk_path(self, path):
+        return os.path.join(self.root, *path.split('/')) if path else self.root
+
+    @staticmethod
+    def relative(disk_path, root):
+        rel = os.path.relpath(disk_path, root).replace(os.sep, '/')
+        return '' if rel == '.' else rel
+
+    @contextmanager
+    def transaction(self):
+        """Run index updates atomically: ``with index.transaction() as tx:``"""
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield IndexTransaction(self, conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    # Queries
+
+    def get(self, path):
+        return self.conn.execute(f'SELECT * FROM entries WHERE path = ? AND {LIVE}', (path,)).fetchone()
+
+    def list_children(self, parent, sort='name', order='asc', after=None, limit=100):
+        """Return one keyset-paginated page of parent's children
+
+        Rows are ordered folders first, then by the sort column, sort_name
+        and name, matching listing.sort_key; after is such a key.
+        """
+        column = SORT_COLUMNS[sort]
+        direction = 'DESC' if order == 'desc' else 'ASC'
+        sql = f'SELECT * FROM entries WHERE parent = ? AND {LIVE}'
+        params = [parent]
+        if after is not None:
+            is_file, primary, sort_name, name = after
+            comparison = '<' if order == 'desc' else '>'
+            sql += (f' AND (is_file > ? OR (is_file = ? AND ({column}, sort_name, name) '
+                    f'{comparison} (?, ?, ?)))')
+            params += [int(is_file), int(is_file), primary, sort_name, name]
+        sql += (f' ORDER BY is_file, {column} {direction}, sort_name {direction}, '
+                f'name {direction} LIMIT ?')
+        params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
+
+    def count_children(self, parent):
+        row = self.conn.execute(
+            'SELECT COUNT(*) AS total, COALESCE(SUM(is_file), 0) AS files '
+            f'FROM entries WHERE parent = ? AND {LIVE}', (parent,)).fetchone()
+        return row['total'] - row['files'], row['files']
+
+    def folder_totals(self, path=''):
+        """Return (total bytes, file count) of the subtree below path
+
+        A single row lookup for folders; the root sums its direct children.
+        """
+        if path:
+            row = self.conn.execute(f'SELECT size, file_count FROM entries WHERE path = ? AND {LIVE}',
+                                    (path,)).fetchone()
+            return (row['size'], row['file_count']) if row is not None else (0, 0)
+        row = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0), COALESCE(SUM(CASE WHEN is_file = 1 THEN 1 '
+            "ELSE file_count END), 0) FROM entries WHERE parent = ''").fetchone()
+        return row[0], row[1]
+
+    def total_size(self, path=''):
+        """Total bytes of the files below path"""
+        return self.folder_totals(path)[0]
+
+    def subtree(self, path):
+        """List (path, is_folder) for path and everything indexed below it"""
+        low, high = _subtree_range(path)
+        return [(row[0], not row[1]) for row in self.conn.execute(
+            f'SELECT path, is_file FROM entries WHERE (path = ? OR (path > ? AND path < ?)) AND {LIVE}',
+            (path, low, high))]
+
+    def content_hashes(self, path):
+        """Set of the content hashes of path and every file indexed below it"""
+        low, high = _subtree_range(path)
+        return {row[0] for row in self.conn.execute(
+            'SELECT content_hash FROM entries WHERE is_file = 1 AND content_hash IS NOT NULL '
+            f'AND (path = ? OR (path > ? AND path < ?)) AND {LIVE}', (path, low, high))}
+
+    def file_hashes(self, path):
+        """Map path and every file indexed below it to (size, mtime, content_hash)"""
+        low, high = _subtree_range(path)
+        return {row[0]: (row[1], row[2], row[3]) for row in self.conn.execute(
+            'SELECT path, size, mtime, content_hash FROM entries WHERE is_file = 1 '
+            f'AND content_hash IS NOT NULL AND (path = ? OR (path > ? AND path < ?)) AND {LIVE}',
+            (path, low, high))}
+
+    def content_stats(self):
+        """Return (logical bytes, bytes of distinct contents) over all files"""
+        logical = self.conn.execute(
+            f'SELECT COALESCE(SUM(size), 0) FROM entries WHERE is_file = 1 AND {LIVE}').fetchone()[0]
+        unique = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM entries '
+            f'WHERE is_file = 1 AND {LIVE} GROUP BY COALESCE(content_hash, path))').fetchone()[0]
+        return logical, unique
+
+    def iter_paths(self):
+        """Yield (path, is_folder) for every indexed entry"""
+        for row in self.conn.execute(f'SELECT path, is_file FROM entries WHERE {LIVE}'):
+            yield row[0], not row[1]
+
+    def iter_files(self):
+        """Yield (path, size, mtime) for every indexed file"""
+        for row in self.conn.execute(f'SELECT path, size, mtime FROM entries WHERE is_file = 1 AND {LIVE}'):
+            yield row[0], row[1], row[2]
+
+    def folder_mtime(self, path):
+        """The mtime the index last saw on disk for a folder, None if unknown"""
+        if path:
+            row = self.conn.execute(f"SELECT mtime FROM entries WHERE path = ? AND type = 'folder' AND {LIVE}",
+                                    (path,)).fetchone()
+        else:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'root_mtime'").fetchone()
+        return row[0] if row is not None else None
+
+    def refresh_folder(self, path):
+        """Rescan the children of a folder changed behind the index's back
+
+        Every change made through the app refreshes the mtime of the folders
+        it touches (see IndexTransaction.touch_folder), so a folder whose mtime
+        on disk differs was changed by something else: its children are
+        diffed against the disk like reconcile() does and new subfolders are
+        indexed whole. The changes go to the change log. Returns whether the
+        folder was rescanned.
+        """
+        try:
+            mtime = os.stat(self.disk_path(path)).st_mtime
+        except OSError:
+            return False
+        known = self.folder_mtime(path)
+        if known == mtime or (known is None and path):
+            return False  # up to date, or not indexed at all
+
+        added, removed = [], []
+        with self.transaction() as tx:
+            if self.folder_mtime(path) == mtime:
+                return False  # another process got there first
+            indexed = {row['name']: row for row in tx.conn.execute(
+                f'SELECT name, type, size, mtime FROM entries WHERE parent = ? AND {LIVE}', (path,))}
+            try:
+                with os.scandir(self.disk_path(path)) as it:
+                    entries = [entry for entry in it if entry.name != INTERNAL_DIR_NAME]
+            except OSError:
+                return False
+            for entry in entries:
+                child = f'{path}/{entry.name}' if path else entry.name
+                row = indexed.pop(entry.name, None)
+                try:
+                    is_directory = entry.is_dir()
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if row is not None and row['type'] != ('folder' if is_directory else 'file'):
+                    tx.remove(child)
+                    removed.append((child, row['type'] == 'folder'))
+                    row = None
+                if is_directory:
+                    if row is None:
+                        tx.insert_tree(child)
+                        added.append((child, True))
+                elif row is None or row['size'] != stat.st_size or row['mtime'] != stat.st_mtime:
+                    tx.upsert_file(child)
+                    added.append((child, False))
+            for name, row in indexed.items():
+                child = f'{path}/{name}' if path else name
+                tx.remove(child)
+                removed.append((child, row['type'] == 'folder'))
+            # The mtime seen before the scan, anything changed since shows up next time
+            tx.set_folder_mtime(path, mtime)
+            tx.log_changes(added=added, removed=removed)
+        return True
+
+    def folder_aggregates(self, parent):
+        """Map each subfolder name of parent to (size, file_count, item_count)"""
+        return {row['name']: (row['size'], row['file_count'], row['item_count'])
+                for row in self.conn.execute(
+                    'SELECT name, size, file_count, item_count FROM entries '
+                    f'WHERE parent = ? AND is_file = 0 AND {LIVE}', (parent,))}
+
+    def last_change(self):
+        """Sequence number of the latest change log entry"""
+        return self.conn.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+
+    def changes_since(self, seq):
+        """Return (changes, last seq) for change log entries after seq
+
+        changes lists (path, is_folder, removed) in order. It is None when
+        the log no longer reaches back to seq or the whole tree was
+        reconciled since, in which case the reader has to resync.
+        """
+        rows = self.conn.execute('SELECT seq, path, is_folder, removed FROM changes '
+                                 'WHERE seq > ? ORDER BY seq', (seq,)).fetchall()
+        if not rows:
+            return [], seq
+        first = self.conn.execute('SELECT MIN(seq) FROM changes').fetchone()[0]
+        if first > seq + 1 or any(row['path'] == '' for row in rows):
+            return None, rows[-1]['seq']
+        return [(row['path'], bool(row['is_folder']), bool(row['removed'])) for row in rows], rows[-1]['seq']
+
+    # Removed folders
+
+    def prune_removed(self, batch_size=2000):
+        """Delete the rows left below removed folders, batch_size rows per transaction
+
+        Returns the removed folders that were pruned completely.
+        """
+        pruned = []
+        for (path,) in self.conn.execute('SELECT path FROM removed_trees').fetchall():
+            low, high = _subtree_range(path)
+            while True:
+                with self.transaction() as tx:
+                    if tx.conn.execute('SELECT 1 FROM removed_trees WHERE path = ?', (path,)).fetchone() is None:
+                        break  # reused or moved meanwhile, see IndexTransaction.clear_removed
+                    deleted = tx.conn.execute(
+                        'DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries '
+                        'WHERE path > ? AND path < ? LIMIT ?)', (low, high, batch_size)).rowcount
+                    if deleted < batch_size:
+                        tx.conn.execute('DELETE FROM removed_trees WHERE path = ?', (path,))
+                        pruned.append(path)
+                        break
+        return pruned
+
+    def prune_forever(self, poll_interval=5):
+        """Prune removed folders as they come, for the background pruner thread"""
+        while True:
+            try:
+                self.prune_removed()
+            except sqlite3.Error:
+                pass  # retried on the next pass
+            time.sleep(poll_interval)
+
+    # Reconciliation
+
+    def reconcile(self):
+        """Bring the index in line with the uploads tree on disk
+
+        Directories are diffed one at a time against their indexed children,
+        so memory stays bounded by the largest folder. Only new or changed
+        files are hashed.
+        """
+        self.prune_removed()
+        stack = ['']
+        root_mtime = os.stat(self.root).st_mtime
+        with self.transaction() as tx:
+            tx.set_folder_mtime('', root_mtime)
+            tx.bulk = True
+            while stack:
+                parent = stack.pop()
+                indexed = {row['name']: row for row in tx.conn.execute(
+                    'SELECT name, type, size, mtime FROM entries WHERE parent = ?', (parent,))}
+                try:
+                    with os.scandir(self.disk_path(parent)) as it:
+                        entries = [entry for entry in it if entry.name != INTERNAL_DIR_NAME]
+                except OSError:
+                    entries = []
+
+                for entry in entries:
+                    path = f'{parent}/{entry.name}' if parent else entry.name
+                    row = indexed.pop(entry.name, None)
+                    try:
+                        is_directory = entry.is_dir()
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+
+                    if is_directory:
+                        if row is not None and row['type'] != 'folder':
+                            tx.remove(path)
+                            row = None
+                        if row is None:
+                            tx.insert_folder(path, stat.st_mtime)
+                        elif row['mtime'] != stat.st_mtime:
+                            tx.conn.execute('UPDATE entries SET mtime = ? WHERE path = ?',
+                                            (stat.st_mtime, path))
+                        stack.append(path)
+                    else:
+                        if row is not None and row['type'] != 'file':
+                            tx.remove(path)
+                            row = None
+                        if row is None or row['size'] != stat.st_size or row['mtime'] != stat.st_mtime:
+                            tx.upsert_file(path)
+
+                # Whatever is left was removed from disk behind our back
+                for name in indexed:
+                    tx.remove(f'{parent}/{name}' if parent else name)
+
+            tx.conn.execute(
+                "UPDATE entries SET item_count = (SELECT COUNT(*) FROM entries AS child "
+                "WHERE child.parent = entries.path) WHERE type = 'folder'")
+            self._recompute_folder_totals(tx.conn)
+            # An entry for the root tells change log readers to resync everything
+            tx.log_changes(removed=[('', True)])
+
+    @staticmethod
+    def _recompute_folder_totals(conn):
+        """Rebuild every folder's recursive size and file count from its files"""
+        totals = {}
+        for row in conn.execute('SELECT parent, SUM(size), COUNT(*) FROM entries '
+                                'WHERE is_file = 1 GROUP BY parent'):
+            parent, size, count = row
+            for folder in [parent] + list(ancestors(parent)) if parent else []:
+                folder_size, folder_count = totals.get(folder, (0, 0))
+                totals[folder] = (folder_size + size, folder_count + count)
+        conn.execute("UPDATE entries SET size = 0, file_count = 0 WHERE type = 'folder'")
+        conn.executemany('UPDATE entries SET size = ?, file_count = ? WHERE path = ?',
+                         [(size, count, path) for path, (size, count) in totals.items()])
+
+
+def ancestors(path):
+    """Paths of every folder containing path, nearest first"""
+    parent, _ = split_path(path)
+    while parent:
+        yield parent
+        parent, _ = split_path(parent)
+
+
+class IndexTransaction:
+    """Index mutations applied inside MetadataIndex.transaction()
+
+    Folder rows carry recursive aggregates: size is the total bytes and
+    file_count the number of files in the folder's subtree. Every mutation
+    applies its delta to the ancestor chain, so reading a folder's totals is
+    a single row lookup.
+    """
+
+    def __init__(self, index, conn):
+        self.index = index
+        self.conn = conn
+        # Set by reconcile(), which recomputes counts and totals in one pass at the end
+        self.bulk = False
+
+    def touch_folder(self, path, delta=0):
+        """Refresh a folder's mtime from disk and adjust its item count"""
+        if self.bulk:
+            return
+        try:
+            mtime = os.stat(self.index.disk_path(path)).st_mtime
+        except OSError:
+            return
+        if not path:
+            self.set_folder_mtime('', mtime)
+            return
+        self.conn.execute('UPDATE entries SET item_count = item_count + ?, mtime = ? WHERE path = ?',
+                          (delta, mtime, path))
+
+    def set_folder_mtime(self, path, mtime):
+        if path:
+            self.conn.execute('UPDATE entries SET mtime = ? WHERE path = ?', (mtime, path))
+        else:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('root_mtime', ?)", (mtime,))
+
+    def add_to_ancestors(self, path, size_delta, file_delta):
+        """Apply a size/file count delta to every folder containing path"""
+        if self.bulk or (not size_delta and not file_delta):
+            return
+        folders = list(ancestors(path))
+        if folders:
+            self.conn.execute(
+                'UPDATE entries SET size = size + ?, file_count = file_count + ? '
+                f'WHERE path IN ({", ".join("?" * len(folders))})',
+                [size_delta, file_delta] + folders)
+
+    def clear_removed(self, path):
+        """Delete what is left below path if it is a removed folder, before path is reused"""
+        if self.conn.execute('SELECT 1 FROM removed_trees WHERE path = ?', (path,)).fetchone() is None:
+            return
+        low, high = _subtree_range(path)
+        self.conn.execute('DELETE FROM entries WHERE path > ? AND path < ?', (low, high))
+        self.conn.execute('DELETE FROM removed_trees WHERE path = ? OR (path > ? AND path < ?)',
+                          (path, low, high))
+
+    def insert_folder(self, path, mtime=None):
+        """Index a folder (and any missing ancestors)"""
+        self.clear_removed(path)
+        parent, name = split_path(path)
+        if parent and self.conn.execute('SELECT 1 FROM entries WHERE path = ?', (parent,)).fetchone() is None:
+            self.insert_folder(parent)
+        if mtime is None:
+            mtime = os.stat(self.index.disk_path(path)).st_mtime
+        inserted = self.conn.execute(
+            'INSERT INTO entries (path, parent, name, sort_name, type, is_file, mtime, category) '
+            "VALUES (?, ?, ?, ?, 'folder', 0, ?, 'folder') "
+            'ON CONFLICT (path) DO NOTHING',
+            (path, parent, name, name.lower(), mtime)).rowcount
+        if inserted:
+            self.touch_folder(parent, 1)
+
+    def log_changes(self, added=(), removed=()):
+        """Append (path, is_folder) entries to the change log, removals first
+
+        Other processes replay the log to keep in-memory state, such as the
+        search index, in step with changes they did not make themselves. An
+        entry for a folder covers everything below it, so a move or removal
+        takes one entry whatever the size of the folder.
+        """
+        self.conn.executemany('INSERT INTO changes (path, is_folder, removed) VALUES (?, ?, 1)',
+                              [(path, int(is_folder)) for path, is_folder in removed])
+        self.conn.executemany('INSERT INTO changes (path, is_folder, removed) VALUES (?, ?, 0)',
+                              [(path, int(is_folder)) for path, is_folder in added])
+        self.conn.execute('DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?',
+                          (CHANGE_LOG_SIZE,))
+
+    def insert_tree(self, path, content_hashes=None):
+        """Index a folder and everything on disk below it
+
+        content_hashes maps the paths of files whose hash is already known
+        to it, the others are read.
+        """
+        content_hashes = content_hashes or {}
+        root = self.index.disk_path(path)
+        for dirpath, _, filenames in os.walk(root):
+            folder = self.index.relative(dirpath, self.index.root)
+            # Entries removed while being walked are skipped, their removal is recorded on its own
+            try:
+                self.insert_folder(folder)
+            except FileNotFoundError:
+                continue
+            for name in filenames:
+                try:
+                    self.upsert_file(f'{folder}/{name}', content_hashes.get(f'{folder}/{name}'))
+                except FileNotFoundError:
+                    pass
+
+    def upsert_file(self, path, content_hash=None):
+        """Index a file from its current state on disk (and any missing ancestors)"""
+        disk_path = self.index.disk_path(path)
+        stat = os.stat(disk_path)
+        if content_hash is None:
+            content_hash = hash_file(disk_path)
+        self.clear_removed(path)
+        parent, name = split_path(path)
+        if parent and self.conn.execute('SELECT 1 FROM entries WHERE path = ?', (parent,)).fetchone() is None:
+            self.insert_folder(parent)
+        old = self.conn.execute('SELECT size FROM entries WHERE path = ?', (path,)).fetchone()
+        self.conn.execute(
+            'INSERT INTO entries (path, parent, name, sort_name, type, is_file, size, mtime, '
+            "category, content_hash) VALUES (?, ?, ?, ?, 'file', 1, ?, ?, ?, ?) "
+            'ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, '
+            'category = excluded.category, content_hash = excluded.content_hash',
+            (path, parent, name, name.lower(), stat.st_size, stat.st_mtime,
+             self.index.categorize(name), content_hash))
+        if old is None:
+            self.touch_folder(parent, 1)
+            self.add_to_ancestors(path, stat.st_size, 1)
+        else:
+            # Replacing a file by a rename changes the folder's mtime too
+            self.touch_folder(parent)
+            self.add_to_ancestors(path, stat.st_size - old['size'], 0)
+
+    def remove(self, path):
+        """Drop path and everything indexed below it
+
+        Below a folder, rows are left to MetadataIndex.prune_removed().
+        """
+        row = self.conn.execute('SELECT is_file, size, file_count FROM entries WHERE path = ?',
+                                (path,)).fetchone()
+        self.conn.execute('DELETE FROM entries WHERE path = ?', (path,))
+        if self.bulk:
+            low, high = _subtree_range(path)
+            self.conn.execute('DELETE FROM entries WHERE path > ? AND path < ?', (low, high))
+        elif row is None or not row['is_file']:
+            self.conn.execute('INSERT OR IGNORE INTO removed_trees (path) VALUES (?)', (path,))
+        if row is not None:
+            self.touch_folder(split_path(path)[0], -1)
+            self.add_to_ancestors(path, -row['size'], -(1 if row['is_file'] else row['file_count']))
+
+    def move(self, old_path, new_path):
+        """Re-key old_path and its subtree under new_path"""
+        row = self.conn.execute('SELECT is_file, size, file_count FROM entries WHERE path = ?',
+                                (old_path,)).fetchone()
+        low, high = _subtree_range(old_path)
+        new_parent, new_name = split_path(new_path)
+        old_parent, _ = split_path(old_path)
+        self.clear_removed(new_path)
+        # Removed folders below old_path move along with the rows left below them
+        self.conn.execute('UPDATE removed_trees SET path = ? || substr(path, ?) WHERE path > ? AND path < ?',
+                          (new_path, len(old_path) + 1, low, high))
+        if row is not None and old_parent != new_parent:
+            files = 1 if row['is_file'] else row['file_count']
+            self.add_to_ancestors(old_path, -row['size'], -files)
+        self.conn.execute(
+            'UPDATE entries SET path = ? || substr(path, ?), parent = ? || substr(parent, ?) '
+            'WHERE path > ? AND path < ?',
+            (new_path, len(old_path) + 1, new_path, len(old_path) + 1, low, high))
+        self.conn.execute(
+            'UPDATE entries SET path = ?, parent = ?, name = ?, sort_name = ?, category = '
+            "CASE WHEN type = 'folder' THEN 'folder' ELSE ? END WHERE path = ?",
+            (new_path, new_parent, new_name, new_name.lower(), self.index.categorize(new_name),
+             old_path))
+        if row is not None and old_parent != new_parent:
+            self.add_to_ancestors(new_path, row['size'], files)
+        if old_parent != new_parent:
+            self.touch_folder(old_parent, -1)
+            self.touch_folder(new_parent, 1)
+        else:
+            self.touch_folder(new_parent)
@@ -0,0 +1,313 @@
+"""Prometheus metrics shared by every worker process
+
+Each process keeps its metrics in memory and a background thread writes
+them to a shard file of its own, <id>.json in the metrics directory, at
+most once per flush interval. A scrape merges all shards, so whichever
+worker serves it reports the whole server. Shards of processes that are
+gone are folded into archive.json, keeping counters from going back.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from bisect import bisect_left
+
+from background import acquire_process_lock, exclusive_lock, lock_is_held
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'filely_http_request_duration_seconds': (
+        'histogram', 'Time from receiving a request to sending the last byte of its response',
+        LATENCY_BUCKETS),
+    'filely_http_requests_in_flight': ('gauge', 'Requests being served', None),
+    'filely_http_request_bytes_total': ('counter', 'Bytes of request bodies read', None),
+    'filely_http_response_bytes_total': ('counter', 'Bytes of response bodies sent', None),
+    'filely_listing_entries': ('histogram', 'Entries of the folders listed', SIZE_BUCKETS),
+    'filely_listing_cache_hits_total': ('counter', 'Folder listings served from the listing cache', None),
+    'filely_listing_cache_misses_total': ('counter', 'Folder listings read from disk', None),
+    'filely_listing_cache_evictions_total': ('counter', 'Cached listings evicted to stay under the memory cap', None),
+    'filely_listing_cache_invalidations_total': ('counter', 'Cached listings dropped after a change', None),
+    'filely_listing_cache_entries': ('gauge', 'Listings in the listing cache', None),
+    'filely_listing_cache_bytes': ('gauge', 'Estimated memory used by the listing cache', None),
+    'filely_listing_rescans_total': ('counter', 'Indexed folders rescanned after a change made outside Filely', None),
+    'filely_fs_ops_total': ('counter', 'Filesystem calls made by requests, by kind of operation', None),
+    'filely_fs_op_seconds_total': ('counter', 'Time requests spent in filesystem calls', None)
+}
+ARCHIVE_NAME = 'archive.json'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metrics:
+    """Counters, gauges and histograms of this process, see the module docstring"""
+
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._values = {}  # (name, labels) -> number, or [bucket counts, sum, count]
+        self._changed = threading.Event()
+        self._pid = None
+        self._shard = None
+
+    def _start(self):
+        """Claim a shard and start the flusher, once per process"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._shard = os.path.join(self.directory, f'{os.getpid()}-{secrets.token_hex(4)}')
+            acquire_process_lock(self._shard + '.lock')
+            self._pid = os.getpid()
+            threading.Thread(target=self._flush_forever, name='metrics-flusher', daemon=True).start()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Add to a counter or a gauge"""
+        self._start()
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+        self._changed.set()
+
+    def observe(self, name, value, **labels):
+        """Count value in a histogram"""
+        self._start()
+        key = self._key(name, labels)
+        buckets = METRICS[name][2]
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = [[0] * (len(buckets) + 1), 0, 0]
+            histogram[0][bisect_left(buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+        self._changed.set()
+
+    def flush(self):
+        """Write this process's metrics to its shard"""
+        if self._shard is None:
+            return
+        self._changed.clear()
+        with self._lock:
+            data = [[name, list(labels), [list(value[0]), value[1], value[2]] if isinstance(value, list) else value]
+                    for (name, labels), value in self._values.items()]
+        with self._flush_lock:
+            temp_path = f'{self._shard}.json.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self._shard + '.json')
+
+    def _flush_forever(self):
+        while True:
+            self._changed.wait()
+            try:
+                self.flush()
+            except OSError:
+                pass  # retried with the next change
+            time.sleep(self.flush_interval)
+
+    @staticmethod
+    def _merge(totals, data, counters_only=False):
+        for name, labels, value in data:
+            metric_type = METRICS.get(name, ('gauge',))[0]
+            if counters_only and metric_type == 'gauge':
+                continue
+            key = (name, tuple(tuple(pair) for pair in labels))
+            if metric_type == 'histogram':
+                total = totals.setdefault(key, [[0] * len(value[0]), 0, 0])
+                total[0] = [a + b for a, b in zip(total[0], value[0])]
+                total[1] += value[1]
+                total[2] += value[2]
+            else:
+                totals[key] = totals.get(key, 0) + value
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def collect(self):
+        """Merge the shards of every process into {(name, labels): value}"""
+        self._start()
+        self.flush()
+        totals = {}
+        with exclusive_lock(os.path.join(self.directory, 'collect.lock')):
+            archive_path = os.path.join(self.directory, ARCHIVE_NAME)
+            archive = {}
+            self._merge(archive, self._read(archive_path))
+            archived = False
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json') or name == ARCHIVE_NAME:
+                    continue
+                shard = os.path.join(self.directory, name[:-len('.json')])
+                data = self._read(shard + '.json')
+                if lock_is_held(shard + '.lock'):
+                    self._merge(totals, data)
+                    continue
+                # Its process exited, gauges went with it
+                self._merge(archive, data, counters_only=True)
+                archived = True
+                os.remove(shard + '.json')
+                if os.path.exists(shard + '.lock'):
+                    os.remove(shard + '.lock')
+            if archived:
+                temp_path = archive_path + '.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump([[name, list(labels), value] for (name, labels), value in archive.items()], f)
+                os.replace(temp_path, archive_path)
+        self._merge(totals, [[name, list(labels), value] for (name, labels), value in archive.items()])
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        by_name = {}
+        for (name, labels), value in self.collect().items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(by_name):
+            metric_type, help_text, buckets = METRICS.get(name, ('untyped', name, None))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in sorted(by_name[name]):
+                if metric_type != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], value[0]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {value[1]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value[2]}')
+        return '\n'.join(lines) + '\n'
+
+
+class _CountingInput:
+    """wsgi.input counting the bytes read from it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, *args):
+        data = self.stream.read(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self.stream.readline(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def readlines(self, *args):
+        lines = self.stream.readlines(*args)
+        self.bytes_read += sum(len(line) for line in lines)
+        return lines
+
+    def __iter__(self):
+        for line in self.stream:
+            self.bytes_read += len(line)
+            yield line
+
+
+class _CountingIterable:
+    """Response body counting the bytes sent, finishing the request on close"""
+
+    def __init__(self, iterable, on_close):
+        self.iterable = iterable
+        self.on_close = on_close
+        self.bytes_sent = 0
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            self.bytes_sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.iterable, 'close'):
+                self.iterable.close()
+        finally:
+            self.on_close(self.bytes_sent)
+
+
+class MetricsMiddleware:
+    """WSGI middleware timing requests until their body is sent
+
+    The endpoint label comes from environ['filely.endpoint'], which the app
+    sets once the request is routed, along with environ['filely.fs_ops'],
+    the request's fsops.FsOps. File responses handed to the server's
+    wsgi.file_wrapper are left as they are so sendfile still applies, their
+    size is taken from Content-Length.
+    """
+
+    def __init__(self, wsgi_app, metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        request_body = _CountingInput(environ['wsgi.input'])
+        environ['wsgi.input'] = request_body
+        response = {'status': '500', 'length': 0}
+
+        def counting_start_response(status, headers, exc_info=None):
+            response['status'] = status.split(' ', 1)[0]
+            for name, value in headers:
+                if name.lower() == 'content-length' and value.isdigit():
+                    response['length'] = int(value)
+            return start_response(status, headers, exc_info)
+
+        def finish(bytes_sent):
+            endpoint = environ.get('filely.endpoint') or 'unmatched'
+            if 'filely.endpoint' in environ:
+                self.metrics.inc('filely_http_requests_in_flight', -1, endpoint=endpoint)
+            self.metrics.observe('filely_http_request_duration_seconds', time.perf_counter() - started,
+                                 endpoint=endpoint, method=environ.get('REQUEST_METHOD', ''),
+                                 status=response['status'])
+            self.metrics.inc('filely_http_request_bytes_total', request_body.bytes_read, endpoint=endpoint)
+            self.metrics.inc('filely_http_response_bytes_total', bytes_sent, endpoint=endpoint)
+            fs_ops = environ.get('filely.fs_ops')
+            if fs_ops is not None:
+                for op, count in fs_ops.counts.items():
+                    if count:
+                        self.metrics.inc('filely_fs_ops_total', count, endpoint=endpoint, op=op)
+                        self.metrics.inc('filely_fs_op_seconds_total', fs_ops.seconds[op], endpoint=endpoint, op=op)
+
+        iterable = self.wsgi_app(environ, counting_start_response)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(iterable, file_wrapper):
+            close = getattr(iterable, 'close', None)
+
+            def close_file():
+                try:
+                    if close is not None:
+                        close()
+                finally:
+                    finish(response['length'])
+
+            iterable.close = close_file
+            return iterable
+        return _CountingIterable(iterable, finish)
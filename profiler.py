@@ -0,0 +1,306 @@
+"""On-demand profiling of live requests
+
+Settings live in a JSON file so that enabling the profiler from any worker
+turns it on in all of them; each process looks at the file at most once
+per check interval, and while it is disabled a request costs one clock
+read. A profiled request runs under cProfile and a sampler thread records
+its stack every few milliseconds. Each process aggregates its profiles in
+memory and writes them to shard files next to the settings:
+
+- <id>.pstats:     cProfile statistics, for pstats or snakeviz
+- <id>.collapsed:  sampled stacks, one "frame;frame;... count" per line,
+                   the input of flamegraph.pl and speedscope
+"""
+import cProfile
+import json
+import marshal
+import os
+import pstats
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+DEFAULT_SETTINGS = {
+    'enabled': False,
+    'sample_rate': 0.01,  # fraction of the matching requests that are profiled
+    'endpoint': None,  # only profile requests routed to this endpoint
+    'path_prefix': None,  # only profile requests whose path starts with this
+    'interval_ms': 5,  # time between two stack samples
+    'generation': 0  # bumped to drop the profiles collected so far
+}
+SETTINGS_NAME = 'settings.json'
+
+
+class ProfilerError(Exception):
+    """Profiler settings that cannot be applied"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class RequestProfiler:
+    """Profiles of the requests selected by the settings, see the module docstring"""
+
+    def __init__(self, directory, check_interval=1.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._settings = dict(DEFAULT_SETTINGS)
+        self._settings_checked = 0
+        self._settings_version = None
+        self._lock = threading.Lock()
+        self._active = {}  # thread id -> root frame label of the profiled request
+        self._wake_sampler = threading.Event()
+        self._sampler_pid = None
+        self._shard = None
+        self._reset(self._settings['generation'])
+
+    def _reset(self, generation):
+        self._generation = generation
+        self._stats = None
+        self._stacks = Counter()
+        self.profiled_requests = 0
+
+    def settings(self):
+        """Current settings, re-read from disk at most every check_interval"""
+        now = time.monotonic()
+        if now - self._settings_checked < self.check_interval:
+            return self._settings
+        self._settings_checked = now
+        path = os.path.join(self.directory, SETTINGS_NAME)
+        try:
+            stat_result = os.stat(path)
+            # Settings are replaced by a rename, a new inode tells changes within the mtime granularity apart
+            version = (stat_result.st_ino, stat_result.st_mtime_ns)
+            if version != self._settings_version:
+                with open(path) as f:
+                    self._settings = dict(DEFAULT_SETTINGS, **json.load(f))
+                self._settings_version = version
+        except (FileNotFoundError, ValueError):
+            self._settings = dict(DEFAULT_SETTINGS)
+        if self._settings['generation'] != self._generation:
+            with self._lock:
+                self._reset(self._settings['generation'])
+        return self._settings
+
+    @staticmethod
+    def _check(changes):
+        for name, value in changes.items():
+            if name not in DEFAULT_SETTINGS or name == 'generation':
+                raise ProfilerError(f'Unknown setting: {name}')
+            if name == 'enabled' and not isinstance(value, bool):
+                raise ProfilerError('enabled must be true or false!')
+            if name == 'sample_rate' and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                          or not 0 <= value <= 1):
+                raise ProfilerError('sample_rate must be a number from 0 to 1!')
+            if name == 'interval_ms' and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                          or not 1 <= value <= 1000):
+                raise ProfilerError('interval_ms must be a number from 1 to 1000!')
+            if name in ('endpoint', 'path_prefix') and value is not None and not isinstance(value, str):
+                raise ProfilerError(f'{name} must be a string or null!')
+
+    def _write(self, settings):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = os.path.join(self.directory, f'{SETTINGS_NAME}.{os.getpid()}.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(settings, f)
+        os.replace(temp_path, os.path.join(self.directory, SETTINGS_NAME))
+        self._settings_checked = 0
+        return self.settings()
+
+    def update(self, **changes):
+        """Change the settings of every process, returns the new settings"""
+        self._check(changes)
+        self._settings_checked = 0
+        settings = dict(self.settings(), **changes)
+        settings['endpoint'] = settings['endpoint'] or None
+        settings['path_prefix'] = settings['path_prefix'] or None
+        return self._write(settings)
+
+    def clear(self):
+        """Drop the profiles of every process"""
+        for path in self._shards('.pstats') + self._shards('.collapsed'):
+            os.remove(path)
+        self._settings_checked = 0
+        settings = self.settings()
+        return self._write(dict(settings, generation=settings['generation'] + 1))
+
+    def should_profile(self, path, resolve_endpoint):
+        settings = self.settings()
+        if not settings['enabled']:
+            return None
+        if settings['path_prefix'] and not path.startswith(settings['path_prefix']):
+            return None
+        endpoint = resolve_endpoint()
+        if settings['endpoint'] and endpoint != settings['endpoint']:
+            return None
+        if random.random() >= settings['sample_rate']:
+            return None
+        return endpoint or path
+
+    # Sampling
+
+    def _start_sampler(self):
+        if self._sampler_pid == os.getpid():
+            return
+        self._sampler_pid = os.getpid()
+        threading.Thread(target=self._sample_forever, name='profiler-sampler', daemon=True).start()
+
+    def _sample_forever(self):
+        while True:
+            self._wake_sampler.wait()
+            with self._lock:
+                active = dict(self._active)
+                if not active:
+                    self._wake_sampler.clear()
+                    continue
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, root in active.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(root)
+                samples.append(';'.join(reversed(stack)))
+            with self._lock:
+                self._stacks.update(samples)
+            time.sleep(self.settings()['interval_ms'] / 1000)
+
+    # Profiling a request
+
+    def begin(self, root):
+        """Start profiling the request of the current thread"""
+        self._start_sampler()
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            profile = None  # another request is profiled and Python 3.12+ allows one profiler, sampling only
+        with self._lock:
+            self._active[threading.get_ident()] = root.replace(';', ':')
+        self._wake_sampler.set()
+        return profile
+
+    def end(self, profile):
+        """Stop profiling the request of the current thread and save the profiles"""
+        if profile is not None:
+            profile.disable()
+        self.settings()  # drops the profiles collected so far if they were cleared
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+            if profile is not None:
+                profile.create_stats()
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+            self.profiled_requests += 1
+            self._save()
+
+    def _save(self):
+        """Write this process's profiles to its shards, with _lock held"""
+        os.makedirs(self.directory, exist_ok=True)
+        if self._shard is None or not self._shard.startswith(os.path.join(self.directory, f'{os.getpid()}-')):
+            self._shard = os.path.join(self.directory, f'{os.getpid()}-{secrets.token_hex(4)}')
+        for suffix, write in (('.pstats', self._write_pstats), ('.collapsed', self._write_collapsed)):
+            temp_path = f'{self._shard}{suffix}.tmp'
+            with open(temp_path, 'wb') as f:
+                write(f)
+            os.replace(temp_path, self._shard + suffix)
+
+    def _write_pstats(self, f):
+        marshal.dump(self._stats.stats if self._stats is not None else {}, f)
+
+    def _write_collapsed(self, f):
+        f.write(''.join(f'{stack} {count}\n' for stack, count in self._stacks.items()).encode())
+
+    # Downloads
+
+    def _shards(self, suffix):
+        if not os.path.isdir(self.directory):
+            return []
+        return [os.path.join(self.directory, name) for name in sorted(os.listdir(self.directory))
+                if name.endswith(suffix)]
+
+    def pstats_dump(self):
+        """cProfile statistics of every process merged, in the marshal format of pstats"""
+        merged = None
+        for path in self._shards('.pstats'):
+            with open(path, 'rb') as f:
+                stats = marshal.load(f)
+            if not stats:
+                continue
+            if merged is None:
+                merged = pstats.Stats(path)
+            else:
+                merged.add(path)
+        return marshal.dumps(merged.stats if merged is not None else {})
+
+    def collapsed_stacks(self):
+        """Sampled stacks of every process merged, in collapsed format"""
+        stacks = Counter()
+        for path in self._shards('.collapsed'):
+            with open(path) as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack:
+                        stacks[stack] += int(count)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+class ProfilerMiddleware:
+    """WSGI middleware profiling the requests the profiler selects
+
+    Profiling lasts until the response body is closed, so the time spent
+    streaming files and pages is included.
+    """
+
+    def __init__(self, wsgi_app, profiler, url_map):
+        self.wsgi_app = wsgi_app
+        self.profiler = profiler
+        self.url_map = url_map
+
+    def _endpoint(self, environ):
+        try:
+            return self.url_map.bind_to_environ(environ).match()[0]
+        except Exception:
+            return None  # 404, 405 and redirects
+
+    def __call__(self, environ, start_response):
+        root = self.profiler.should_profile(environ.get('PATH_INFO', ''), lambda: self._endpoint(environ))
+        if root is None:
+            return self.wsgi_app(environ, start_response)
+
+        profile = self.profiler.begin(f"{environ.get('REQUEST_METHOD', '')} {root}")
+        try:
+            iterable = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self.profiler.end(profile)
+            raise
+        return _ProfiledIterable(iterable, lambda: self.profiler.end(profile))
+
+
+class _ProfiledIterable:
+    def __init__(self, iterable, on_close):
+        self.iterable = iterable
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def close(self):
+        try:
+            if hasattr(self.iterable, 'close'):
+                self.iterable.close()
+        finally:
+            self.on_close()
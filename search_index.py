@@ -0,0 +1,194 @@
+import heapq
+import os
+import pickle
+import threading
+from array import array
+
+PERSIST_VERSION = 1
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def extension_of(path):
+    name = path.rsplit('/', 1)[-1]
+    return name.rsplit('.', 1)[1].lower() if '.' in name else ''
+
+
+def rank(path, query):
+    """Sort key of a match: better name matches first, then shorter paths"""
+    name = path.rsplit('/', 1)[-1].lower()
+    if name == query or name.rsplit('.', 1)[0] == query:
+        score = 0
+    elif name.startswith(query):
+        score = 1
+    elif query in name:
+        score = 2
+    else:
+        score = 3
+    return (score, path.count('/'), len(path), path)
+
+
+class TrigramIndex:
+    """In-memory trigram index over every path under uploads
+
+    Paths get increasing ids and each trigram of the lowercased path maps to
+    an array of ids. Removal only clears the id's path, so stale postings
+    are filtered out when candidates are verified; compact() rebuilds the
+    postings once too many ids are dead.
+
+    A query scans the posting list of its rarest trigram and checks each
+    candidate with a plain substring test, so its cost is bounded by that
+    list rather than by the number of indexed paths.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.paths = []
+        self.folders = set()
+        self.ids = {}
+        self.postings = {}
+        self.extensions = {}
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, path, is_folder=False):
+        with self._lock:
+            if path in self.ids:
+                self.remove(path)
+            doc_id = len(self.paths)
+            self.paths.append(path)
+            self.ids[path] = doc_id
+            if is_folder:
+                self.folders.add(doc_id)
+            for gram in trigrams(path.lower()):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    posting = self.postings[gram] = array('I')
+                posting.append(doc_id)
+            if not is_folder:
+                self.extensions.setdefault(extension_of(path), array('I')).append(doc_id)
+
+    def remove(self, path):
+        with self._lock:
+            self._drop(path)
+            self._maybe_compact()
+
+    def remove_tree(self, path):
+        """Remove path and every path below it"""
+        with self._lock:
+            prefix = path + '/'
+            for removed in [p for p in self.ids if p == path or p.startswith(prefix)]:
+                self._drop(removed)
+            self._maybe_compact()
+
+    def _drop(self, path):
+        doc_id = self.ids.pop(path, None)
+        if doc_id is not None:
+            self.paths[doc_id] = None
+            self.folders.discard(doc_id)
+            self.dead += 1
+
+    def _maybe_compact(self):
+        if self.dead > 1024 and self.dead > len(self.paths) // 4:
+            self.compact()
+
+    def compact(self):
+        """Rebuild the postings without the ids of removed paths"""
+        with self._lock:
+            live = [(path, doc_id in self.folders) for doc_id, path in enumerate(self.paths)
+                    if path is not None]
+            self._reset()
+            for path, is_folder in live:
+                self.add(path, is_folder)
+
+    def search(self, query, extension=None, offset=0, limit=50):
+        """Return (total, results) for paths containing query
+
+        query is matched case-insensitively anywhere in the path, extension
+        restricts results to files with that extension. Results are ranked
+        with rank() and paginated with offset/limit.
+        """
+        query = query.lower()
+        extension = extension.lower().lstrip('.') if extension else None
+        with self._lock:
+            if len(query) >= 3:
+                grams = trigrams(query)
+                lists = [self.postings.get(gram, ()) for gram in grams]
+                candidates = min(lists, key=len)
+            elif extension is not None:
+                candidates = self.extensions.get(extension, ())
+            else:
+                candidates = range(len(self.paths))
+
+            paths = self.paths
+            matches = []
+            for doc_id in candidates:
+                path = paths[doc_id]
+                if path is None or query not in path.lower():
+                    continue
+                if extension is not None and (doc_id in self.folders or extension_of(path) != extension):
+                    continue
+                matches.append(doc_id)
+
+            total = len(matches)
+            best = heapq.nsmallest(offset + limit, matches, key=lambda doc_id: rank(paths[doc_id], query))
+            results = [{
+                'path': paths[doc_id],
+                'name': paths[doc_id].rsplit('/', 1)[-1],
+                'parent': paths[doc_id].rpartition('/')[0],
+                'type': 'folder' if doc_id in self.folders else 'file'
+            } for doc_id in best[offset:]]
+        return total, results
+
+    def save(self, path):
+        """Persist the index, postings included, to path (atomically replaced)"""
+        with self._lock:
+            if self.dead:
+                self.compact()
+            state = {
+                'version': PERSIST_VERSION,
+                'paths': self.paths,
+                'folders': self.folders,
+                'postings': self.postings,
+                'extensions': self.extensions
+            }
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def sync(self, entries):
+        """Make the index match entries, an iterable of (path, is_folder)"""
+        with self._lock:
+            wanted = dict(entries)
+            for path in [p for p in self.ids if p not in wanted]:
+                self.remove(path)
+            for path, is_folder in wanted.items():
+                doc_id = self.ids.get(path)
+                if doc_id is None or (doc_id in self.folders) != is_folder:
+                    self.add(path, is_folder)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save(), or return None if unusable"""
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if not isinstance(state, dict) or state.get('version') != PERSIST_VERSION:
+            return None
+        index = cls()
+        index.paths = state['paths']
+        index.folders = state['folders']
+        index.postings = state['postings']
+        index.extensions = state['extensions']
+        index.ids = {p: doc_id for doc_id, p in enumerate(index.paths)}
+        return index
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from flask import Request, current_app
+
+
+class UploadStats:
+    """Running totals for multipart file uploads
+
+    bytes_written counts every byte put on disk for an upload, so
+    write_amplification is 1.0 when files are written once and 2.0 when
+    they are spooled to a temporary file and then copied.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = 0
+        self.bytes_received = 0
+        self.bytes_written = 0
+        self.seconds = 0.0
+
+    def record(self, received, written, seconds):
+        with self._lock:
+            self.files += 1
+            self.bytes_received += received
+            self.bytes_written += written
+            self.seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': self.files,
+                'bytes_received': self.bytes_received,
+                'bytes_written': self.bytes_written,
+                'write_amplification': self.bytes_written / self.bytes_received if self.bytes_received else None,
+                'throughput_bytes_per_second': self.bytes_received / self.seconds if self.seconds else None
+            }
+
+
+class StreamedUpload:
+    """A multipart file part written straight to disk as it is parsed
+
+    The part goes to a temporary file next to the uploads, its size and
+    sha256 are computed on the way, and commit() renames it into place.
+    Parts that are never committed are deleted when the request closes.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self.file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.started = time.perf_counter()
+        self.committed = False
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def commit(self, target_path):
+        """Rename the part to target_path, returns (size, sha256 hex digest, seconds)"""
+        self.file.close()
+        os.replace(self.temp_path, target_path)
+        self.committed = True
+        return self.size, self.sha256.hexdigest(), time.perf_counter() - self.started
+
+    def close(self):
+        self.file.close()
+        if not self.committed:
+            try:
+                os.remove(self.temp_path)
+            except FileNotFoundError:
+                pass
+
+
+class StreamingUploadRequest(Request):
+    """Request whose multipart file parts are StreamedUpload objects
+
+    Enabled by the STREAMING_UPLOADS config key, parts are written to
+    STREAMING_UPLOAD_DIR, which must be on the same filesystem as uploads.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not current_app.config.get('STREAMING_UPLOADS'):
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return StreamedUpload(current_app.config['STREAMING_UPLOAD_DIR'])
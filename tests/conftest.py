@@ -76,4 +76,26 @@ def slow_actions():
         'input': 0.5,    # seconds to wait after input
         'click': 1,      # seconds to wait after clicks
         'action': 1      # seconds to wait after major actions
-    }
\ No newline at end of file
+    }
+
+
+@pytest.fixture
+def client(login_credentials):
+    """Fixture providing a logged in Flask test client for API tests"""
+    from app import app
+
+    client = app.test_client()
+    client.post('/login', data=login_credentials)
+    return client
+
+
+@pytest.fixture
+def workspace(client):
+    """Fixture providing an empty folder under uploads, deleted after the test"""
+    import uuid
+    folder = f"api_test_{uuid.uuid4().hex[:8]}"
+    client.post('/create_folder', data={'current_path': '', 'new_folder_name': folder})
+
+    yield folder
+
+    client.get(f'/delete_item/{folder}')
@@ -0,0 +1,94 @@
+import gzip
+import os
+import re
+import pytest
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+from assets import MANIFEST_NAME, AssetPipeline
+
+
+def accept(header):
+    return parse_accept_header(header, Accept)
+
+
+class TestAssetPipeline:
+    """Test the fingerprinted and compressed copies of static files"""
+
+    @pytest.fixture
+    def pipeline(self, tmp_path):
+        source = tmp_path / 'static'
+        (source / 'js').mkdir(parents=True)
+        (source / 'style.css').write_text('body { color: red; }\n' * 50)
+        (source / 'js' / 'app.js').write_text('console.log(1);\n' * 50)
+        (source / 'logo.png').write_bytes(os.urandom(64))
+        return AssetPipeline(str(source), str(source / 'build'))
+
+    @pytest.mark.preview
+    def test_build(self, pipeline):
+        """Test that each file is copied under its content hash, with a gzip variant"""
+        manifest = pipeline.build()
+        assert sorted(manifest) == ['js/app.js', 'logo.png', 'style.css']
+        assert re.fullmatch(r'style\.[0-9a-f]{12}\.css', manifest['style.css'])
+        assert re.fullmatch(r'js/app\.[0-9a-f]{12}\.js', manifest['js/app.js'])
+
+        built = os.path.join(pipeline.build_dir, manifest['style.css'])
+        with open(built + '.gz', 'rb') as f:
+            assert gzip.decompress(f.read()) == b'body { color: red; }\n' * 50
+        assert not os.path.exists(os.path.join(pipeline.build_dir, manifest['logo.png']) + '.gz')
+        assert os.path.exists(os.path.join(pipeline.build_dir, MANIFEST_NAME))
+        assert pipeline.url_name('style.css') == manifest['style.css']
+        assert pipeline.url_name('missing.css') is None
+
+    @pytest.mark.preview
+    def test_rebuild(self, pipeline):
+        """Test that a changed file gets a new name and unchanged ones keep theirs"""
+        first = pipeline.build()
+        with open(os.path.join(pipeline.source_dir, 'style.css'), 'a') as f:
+            f.write('p { margin: 0; }\n')
+        second = pipeline.build()
+        assert second['style.css'] != first['style.css']
+        assert second['js/app.js'] == first['js/app.js']
+        assert not os.path.exists(os.path.join(pipeline.build_dir, 'build'))
+
+    @pytest.mark.preview
+    def test_resolve(self, pipeline):
+        """Test that the best accepted variant is chosen and unknown names refused"""
+        name = pipeline.build()['style.css']
+        path = os.path.join(pipeline.build_dir, name)
+        assert pipeline.resolve(name, accept('gzip, deflate')) == (path + '.gz', 'gzip')
+        assert pipeline.resolve(name, accept('')) == (path, None)
+        assert pipeline.resolve(MANIFEST_NAME, accept('')) is None
+        assert pipeline.resolve('style.css', accept('')) is None
+
+
+class TestAssetRoute:
+    """Test serving fingerprinted static files"""
+
+    def _style_url(self, client):
+        html = client.get('/login').get_data(as_text=True)
+        return re.search(r'href="(/assets/style\.[0-9a-f]{12}\.css)"', html).group(1)
+
+    @pytest.mark.preview
+    def test_immutable_asset(self, client):
+        """Test that templates link fingerprinted names served with immutable caching"""
+        url = self._style_url(client)
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.content_encoding == 'gzip'
+        assert response.mimetype == 'text/css'
+        assert 'immutable' in response.headers['Cache-Control']
+        assert response.cache_control.max_age == 365 * 24 * 3600
+        assert 'Accept-Encoding' in response.headers['Vary']
+        with open(os.path.join('static', 'style.css'), 'rb') as f:
+            assert gzip.decompress(response.data) == f.read()
+
+        plain = client.get(url)
+        assert plain.content_encoding is None
+        assert plain.headers['ETag'] != response.headers['ETag']
+
+    @pytest.mark.preview
+    def test_unknown_asset(self, client):
+        """Test that names the pipeline did not build are not served"""
+        assert client.get('/assets/style.css').status_code == 404
+        assert client.get(f'/assets/{MANIFEST_NAME}').status_code == 404
+        assert client.get('/assets/../app.py').status_code == 404
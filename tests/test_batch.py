@@ -0,0 +1,98 @@
+import os
+import pytest
+from .test_utils import upload_test_file
+
+
+class TestBatch:
+    """Test the batch API running several file operations in one request"""
+
+    def _batch(self, client, *operations):
+        response = client.post('/api/batch', json={'operations': list(operations)})
+        assert response.status_code == 200
+        return response.get_json()
+
+    def _names(self, client, folder):
+        return sorted(item['name'] for item in client.get(f'/api/files/{folder}').get_json()['items'])
+
+    @pytest.mark.file_ops
+    def test_batch_operations(self, client, workspace):
+        """Test that each kind of operation is carried out and indexed"""
+        for name in ('a.txt', 'b.txt', 'c.txt'):
+            upload_test_file(client, workspace, name, b'x')
+        upload_test_file(client, f'{workspace}/archive', 'old.txt', b'x')
+
+        result = self._batch(
+            client,
+            {'op': 'create_folder', 'path': workspace, 'name': 'new'},
+            {'op': 'rename', 'path': f'{workspace}/a.txt', 'name': 'renamed'},
+            {'op': 'move', 'path': f'{workspace}/b.txt', 'destination': f'{workspace}/archive'},
+            {'op': 'delete', 'path': f'{workspace}/c.txt'})
+        assert result['succeeded'] == 4
+        assert result['failed'] == 0
+        assert [r['path'] for r in result['results']] == [
+            f'{workspace}/new', f'{workspace}/renamed.txt', f'{workspace}/archive/b.txt', f'{workspace}/c.txt']
+
+        assert self._names(client, workspace) == ['archive', 'new', 'renamed.txt']
+        assert self._names(client, f'{workspace}/archive') == ['b.txt', 'old.txt']
+
+    @pytest.mark.file_ops
+    def test_item_changed_twice(self, client, workspace):
+        """Test that an item, or anything below it, cannot be changed again in the same batch"""
+        upload_test_file(client, workspace, 'a.txt', b'a')
+
+        result = self._batch(
+            client,
+            {'op': 'rename', 'path': f'{workspace}/a.txt', 'name': 'renamed'},
+            {'op': 'delete', 'path': f'{workspace}/renamed.txt'},
+            {'op': 'create_folder', 'path': workspace, 'name': 'new'},
+            {'op': 'move', 'path': f'{workspace}/renamed.txt', 'destination': f'{workspace}/new'})
+        changed_twice = {'ok': False, 'error': 'Item was already changed in this batch!', 'status': 409}
+        assert result['results'][1] == changed_twice
+        assert result['results'][3] == changed_twice
+        assert self._names(client, workspace) == ['new', 'renamed.txt']
+
+    @pytest.mark.file_ops
+    def test_failed_operations(self, client, workspace):
+        """Test that a failing operation does not stop the others"""
+        upload_test_file(client, workspace, 'a.txt', b'a')
+        upload_test_file(client, workspace, 'b.txt', b'b')
+
+        result = self._batch(
+            client,
+            {'op': 'explode', 'path': workspace},
+            {'op': 'rename', 'path': f'{workspace}/a.txt'},
+            {'op': 'delete', 'path': f'{workspace}/missing.txt'},
+            {'op': 'rename', 'path': f'{workspace}/a.txt', 'name': 'b.txt'},
+            {'op': 'move', 'path': workspace, 'destination': f'{workspace}'},
+            {'op': 'delete', 'path': f'{workspace}/a.txt'})
+        assert [r['ok'] for r in result['results']] == [False, False, False, False, False, True]
+        assert [r.get('status') for r in result['results']] == [400, 400, 404, 409, 400, None]
+        assert self._names(client, workspace) == ['b.txt']
+
+    @pytest.mark.file_ops
+    @pytest.mark.parametrize('operation', [
+        {'op': 'delete', 'path': '..'},
+        {'op': 'delete', 'path': '.filely'},
+        {'op': 'rename', 'path': 'articles/../../requirements.txt', 'name': 'x'},
+        {'op': 'move', 'path': 'articles', 'destination': '../tests'},
+        {'op': 'create_folder', 'path': '..', 'name': 'escaped'},
+    ])
+    def test_paths_outside_uploads(self, client, operation):
+        """Test that operations never reach outside uploads or internal state"""
+        result = self._batch(client, operation)
+        assert result['results'] == [{'ok': False, 'error': 'Invalid path!', 'status': 400}]
+        assert os.path.exists('requirements.txt')
+        assert os.path.isdir(os.path.join('uploads', 'articles'))
+        assert not os.path.exists('escaped')
+
+    @pytest.mark.file_ops
+    def test_invalid_batches(self, client):
+        """Test that malformed or oversized batches are refused as a whole"""
+        from app import app
+
+        assert client.post('/api/batch', json={}).status_code == 400
+        assert client.post('/api/batch', json={'operations': []}).status_code == 400
+        assert client.post('/api/batch', data='not json').status_code == 400
+
+        operations = [{'op': 'delete', 'path': 'missing.txt'}] * (app.config['BATCH_MAX_OPERATIONS'] + 1)
+        assert client.post('/api/batch', json={'operations': operations}).status_code == 413
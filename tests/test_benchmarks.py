@@ -0,0 +1,89 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+BENCH_HTTP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'bench_http.py')
+
+
+@pytest.fixture(scope='module')
+def bench():
+    spec = importlib.util.spec_from_file_location('bench_http', BENCH_HTTP)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def count_tree(root):
+    folders = files = 0
+    for _, dirnames, filenames in os.walk(root):
+        folders += len(dirnames)
+        files += len(filenames)
+    return folders, files
+
+
+class TestBenchHelpers:
+    """Test the tree generator and result helpers of the HTTP benchmark"""
+
+    @pytest.mark.file_ops
+    def test_sizes_and_names(self, bench):
+        """Test parsing tree sizes and naming trees"""
+        assert [bench.parse_size(text) for text in ('1k', '100K', '1m', '250', '1.5k')] == [
+            1000, 100000, 1000000, 250, 1500]
+        assert bench.tree_name(1000, 0) == '1k-flat'
+        assert bench.tree_name(2000000, 3) == '2m-d3'
+        assert bench.tree_name(250, 2) == '250-d2'
+
+    @pytest.mark.folder_ops
+    @pytest.mark.parametrize('entries, depth', [(150, 0), (1000, 2), (5000, 3)])
+    def test_generate_tree(self, bench, tmp_path, entries, depth):
+        """Test that generated trees have the requested entries and shape"""
+        root = str(tmp_path / 'uploads')
+        shape = bench.generate_tree(root, entries, depth, 3)
+        assert count_tree(root) == (shape['folders'], shape['files'])
+        assert shape['folders'] + shape['files'] == entries
+        assert shape['depth'] == depth
+        assert len(shape['top_folders']) == shape['branching']
+        if depth:
+            leaf = os.path.join(root, *['folder_0'] * depth)
+            assert not any(entry.is_dir() for entry in os.scandir(leaf))
+            assert os.path.getsize(os.path.join(leaf, 'file_0.txt')) == 3
+
+    @pytest.mark.file_ops
+    def test_timings(self, bench, capsys):
+        """Test that summaries keep the compared timings and comparisons print their change"""
+        samples = [{'ms': ms, 'status': 200, 'bytes': 10, 'fs_ops': 'stat=1'} for ms in (4, 1, 3, 2, 100)]
+        summary = bench.summarize(samples)
+        assert (summary['median_ms'], summary['min_ms'], summary['p95_ms']) == (3, 1, 100)
+
+        before = {'trees': {'1k-flat': {'modes': {'client': {'listing': {'root': summary}, 'status': 200}}}}}
+        assert bench.timings(before['trees']) == {'1k-flat.modes.client.listing.root.median_ms': 3}
+        after = {'trees': {'1k-flat': {'modes': {'client': {'listing': {'root': dict(summary, median_ms=6)}}}}}}
+        bench.compare(before, after)
+        assert '+100%' in capsys.readouterr().out
+
+
+class TestBenchRun:
+    """Test a small end-to-end run of the HTTP benchmark"""
+
+    @pytest.mark.file_ops
+    def test_client_run(self, tmp_path):
+        """Test that a run measures every operation and saves its results"""
+        output = str(tmp_path / 'results.json')
+        subprocess.run([sys.executable, BENCH_HTTP, '--sizes', '200', '--depths', '2', '--modes', 'client',
+                        '--repeat', '2', '--transfers', '1', '--upload-mb', '1',
+                        '--work-dir', str(tmp_path / 'trees'), '--output', output],
+                       check=True, capture_output=True, timeout=120)
+        with open(output) as f:
+            run = json.load(f)
+
+        tree = run['trees']['200-d2']
+        assert tree['shape'] == {'folders': 6, 'files': 194, 'branching': 2, 'depth': 2}
+        client = tree['modes']['client']
+        assert client['listing']['root']['status'] == 200
+        assert client['download']['bytes'] == 1024 * 1024
+        for operation in ('upload', 'download', 'rename_file', 'delete_file', 'rename_folder', 'delete_folder'):
+            assert client[operation]['fs_ops'].startswith('stat=')
+        assert os.listdir(str(tmp_path / 'trees')) == []
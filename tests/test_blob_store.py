@@ -0,0 +1,105 @@
+import hashlib
+import os
+import shutil
+import uuid
+import pytest
+from blob_store import BlobStore
+from .test_utils import upload_test_file
+
+
+def write(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+class TestBlobStore:
+    """Test the content-addressed store of deduplicated files"""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        return BlobStore(str(tmp_path / 'blobs'))
+
+    @pytest.mark.file_ops
+    def test_identical_files_share_blob(self, store, tmp_path):
+        """Test that identical files become links to one blob and others stay apart"""
+        first, second, other = (str(tmp_path / name) for name in ('first.txt', 'second.txt', 'other.txt'))
+        write(first, b'same content')
+        write(second, b'same content')
+        write(other, b'other content')
+
+        content_hash = store.add(first)
+        assert content_hash == hashlib.sha256(b'same content').hexdigest()
+        assert store.add(second, content_hash) == content_hash
+        other_hash = store.add(other)
+
+        assert os.path.samefile(first, second)
+        assert os.path.samefile(first, store.blob_path(content_hash))
+        assert not os.path.samefile(first, other)
+        assert store.refcount(content_hash) == 2
+        assert store.refcount(other_hash) == 1
+        assert store.add(first) == content_hash
+        assert store.refcount(content_hash) == 2
+        with open(second, 'rb') as f:
+            assert f.read() == b'same content'
+        assert store.stats() == {'blobs': 2, 'stored_bytes': 25, 'references': 3}
+
+    @pytest.mark.file_ops
+    def test_release(self, store, tmp_path):
+        """Test that a blob is deleted once its last reference is gone"""
+        first, second = str(tmp_path / 'first.txt'), str(tmp_path / 'second.txt')
+        write(first, b'shared')
+        write(second, b'shared')
+        content_hash = store.add(first)
+        store.add(second)
+
+        os.remove(first)
+        store.release([content_hash])
+        assert os.path.exists(store.blob_path(content_hash))
+        os.remove(second)
+        store.release([content_hash, 'f' * 64])
+        assert not os.path.exists(store.blob_path(content_hash))
+        assert store.refcount(content_hash) == 0
+
+        write(first, b'shared')
+        store.add(first)
+        assert store.refcount(content_hash) == 1
+
+
+class TestDedupStorage:
+    """Test uploads and deletions with deduplicating storage enabled"""
+
+    @pytest.fixture
+    def store(self, workspace, monkeypatch):
+        import app
+        directory = os.path.join(app.STATE_DIR, f'blobs_test_{uuid.uuid4().hex[:8]}')
+        store = BlobStore(directory)
+        monkeypatch.setattr(app, 'blob_store', store)
+        monkeypatch.setattr(app.trash, 'on_purged', store.release)
+        yield store
+        shutil.rmtree(directory)
+
+    @pytest.mark.file_ops
+    def test_uploads_deduplicated(self, client, workspace, store):
+        """Test that identical uploads are stored once and released once purged"""
+        from app import trash
+        upload_test_file(client, workspace, 'a.txt', b'duplicate body')
+        upload_test_file(client, f'{workspace}/sub', 'b.txt', b'duplicate body')
+        content_hash = hashlib.sha256(b'duplicate body').hexdigest()
+        assert os.path.samefile(os.path.join('uploads', workspace, 'a.txt'),
+                                os.path.join('uploads', workspace, 'sub', 'b.txt'))
+        assert store.refcount(content_hash) == 2
+
+        stats = client.get('/api/storage/stats').get_json()
+        assert stats['dedup_storage'] is True
+        assert (stats['blobs'], stats['references']) == (1, 2)
+
+        client.get(f'/delete_item/{workspace}/a.txt')
+        client.get(f'/delete_item/{workspace}/sub')
+        assert store.refcount(content_hash) == 2  # restorable from the trash
+
+        trashed = [info for info in trash.entries() if info['original_path'].startswith(f'{workspace}/')]
+        assert len(trashed) == 2
+        trash.purge(trashed[0])
+        assert store.refcount(content_hash) == 1
+        trash.purge(trashed[1])
+        assert not os.path.exists(store.blob_path(content_hash))
@@ -0,0 +1,95 @@
+import os
+import pytest
+import metadata_index as metadata_index_module
+from metadata_index import MetadataIndex
+from .test_utils import upload_test_file
+
+
+@pytest.fixture
+def index(tmp_path):
+    root = str(tmp_path / 'uploads')
+    os.makedirs(root)
+    return MetadataIndex(str(tmp_path / 'index.sqlite3'), root, lambda name: 'document')
+
+
+class TestChangeLog:
+    """Test the change log other workers replay"""
+
+    def _search(self, client, query):
+        return [result['path'] for result in client.get(f'/api/search?q={query}').get_json()['results']]
+
+    @pytest.mark.rename
+    def test_move_logs_two_changes(self, client, workspace):
+        """Test that renaming a folder logs its old and new path, not every entry below it"""
+        from app import metadata_index
+        client.post('/create_folder', data={'current_path': workspace, 'new_folder_name': 'docs'})
+        for i in range(3):
+            upload_test_file(client, f'{workspace}/docs', f'report{i}.txt', b'report')
+        seq = metadata_index.last_change()
+
+        client.post('/rename_item', data={'item_path': f'{workspace}/docs', 'new_name': 'archive'})
+        changes, _ = metadata_index.changes_since(seq)
+        assert changes == [(f'{workspace}/docs', True, True), (f'{workspace}/archive', True, False)]
+
+    @pytest.mark.rename
+    def test_search_follows_move(self, client, workspace):
+        """Test that the search index replays a folder move for everything below it"""
+        client.post('/create_folder', data={'current_path': workspace, 'new_folder_name': 'docs'})
+        upload_test_file(client, f'{workspace}/docs', 'quarterly.txt', b'report')
+        assert self._search(client, f'{workspace}/docs/quarterly') == [f'{workspace}/docs/quarterly.txt']
+
+        client.post('/rename_item', data={'item_path': f'{workspace}/docs', 'new_name': 'archive'})
+        assert self._search(client, f'{workspace}/docs/quarterly') == []
+        assert self._search(client, f'{workspace}/archive/quarterly') == [f'{workspace}/archive/quarterly.txt']
+
+    @pytest.mark.folder_ops
+    def test_replay_change_of_another_worker(self, client, workspace):
+        """Test that a folder another worker added is searchable with its content"""
+        from app import metadata_index
+        folder = os.path.join('uploads', workspace, 'elsewhere')
+        os.makedirs(folder)
+        with open(os.path.join(folder, 'minutes.txt'), 'w') as f:
+            f.write('minutes')
+        with metadata_index.transaction() as tx:
+            tx.insert_tree(f'{workspace}/elsewhere')
+            tx.log_changes(added=[(f'{workspace}/elsewhere', True)])
+
+        assert self._search(client, f'{workspace}/elsewhere/minutes') == [f'{workspace}/elsewhere/minutes.txt']
+
+    @pytest.mark.folder_ops
+    def test_listing_cache_follows_log(self, client, workspace):
+        """Test that a change logged by another worker drops the cached listings it affects"""
+        import app
+        validator = app.ListingCache.validator(os.stat(os.path.join('uploads', workspace)))
+        app.listing_cache.put(os.path.join('uploads', workspace), validator, [])
+        with app.metadata_index.transaction() as tx:
+            tx.log_changes(added=[(f'{workspace}/new.txt', False)])
+
+        app.sync_listing_cache()
+        assert app.listing_cache.get(os.path.join('uploads', workspace), validator) is None
+
+
+class TestResync:
+    """Test that readers are told to resync when the log cannot be replayed"""
+
+    @pytest.mark.file_ops
+    def test_truncated_log(self, index, monkeypatch):
+        """Test that a reader behind the start of the log has to resync"""
+        monkeypatch.setattr(metadata_index_module, 'CHANGE_LOG_SIZE', 2)
+        for i in range(4):
+            with index.transaction() as tx:
+                tx.log_changes(added=[(f'file{i}.txt', False)])
+
+        changes, seq = index.changes_since(0)
+        assert changes is None
+        assert seq == index.last_change()
+        changes, _ = index.changes_since(seq - 1)
+        assert changes == [('file3.txt', False, False)]
+
+    @pytest.mark.file_ops
+    def test_reconcile(self, index):
+        """Test that a reconcile since the reader's position makes it resync"""
+        seq = index.last_change()
+        index.reconcile()
+        assert index.changes_since(seq)[0] is None
+        assert index.changes_since(index.last_change()) == ([], index.last_change())
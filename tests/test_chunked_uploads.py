@@ -0,0 +1,171 @@
+import io
+import os
+import threading
+import pytest
+from chunked_upload import ChunkedUploadStore, UploadError
+
+
+class TestChunkedUploads:
+    """Test the chunked upload session API"""
+
+    def _create_session(self, client, folder, filename='chunked.txt', size=10, chunk_size=4):
+        return client.post('/api/uploads', json={
+            'folder': folder, 'filename': filename, 'size': size, 'chunk_size': chunk_size})
+
+    @pytest.mark.file_ops
+    def test_chunked_upload(self, client, workspace):
+        """Test uploading a file in chunks sent out of order"""
+        print("Testing chunked upload...")
+
+        response = self._create_session(client, workspace)
+        assert response.status_code == 201
+        session = response.get_json()
+        assert session['chunk_count'] == 3
+        assert session['missing'] == [0, 1, 2]
+
+        for index, chunk in ((2, b'89'), (0, b'0123'), (1, b'4567')):
+            response = client.put(f"/api/uploads/{session['id']}/chunks/{index}", data=chunk)
+            assert response.status_code == 200
+            assert response.get_json()['size'] == len(chunk)
+
+        assert client.get(f"/api/uploads/{session['id']}").get_json()['missing'] == []
+        response = client.post(f"/api/uploads/{session['id']}/complete")
+        assert response.status_code == 200
+        assert response.get_json()['path'] == f'{workspace}/chunked.txt'
+
+        response = client.get(f'/download/{workspace}/chunked.txt')
+        assert response.get_data() == b'0123456789'
+        response.close()
+        print("Chunked upload test completed")
+
+    @pytest.mark.file_ops
+    def test_chunk_of_wrong_size(self, client, workspace):
+        """Test that a chunk of the wrong size is refused"""
+        session = self._create_session(client, workspace).get_json()
+
+        response = client.put(f"/api/uploads/{session['id']}/chunks/0", data=b'012')
+        assert response.status_code == 400
+        response = client.put(f"/api/uploads/{session['id']}/chunks/3", data=b'0123')
+        assert response.status_code == 400
+        assert client.get(f"/api/uploads/{session['id']}").get_json()['missing'] == [0, 1, 2]
+
+    @pytest.mark.file_ops
+    def test_complete_with_missing_chunks(self, client, workspace):
+        """Test that an upload cannot complete before every chunk arrived"""
+        session = self._create_session(client, workspace).get_json()
+        client.put(f"/api/uploads/{session['id']}/chunks/0", data=b'0123')
+
+        response = client.post(f"/api/uploads/{session['id']}/complete")
+        assert response.status_code == 409
+        assert not os.path.exists(os.path.join('uploads', workspace, 'chunked.txt'))
+
+    @pytest.mark.file_ops
+    def test_abort_upload(self, client, workspace):
+        """Test that an aborted session is gone"""
+        session = self._create_session(client, workspace).get_json()
+
+        response = client.delete(f"/api/uploads/{session['id']}")
+        assert response.get_json()['aborted'] is True
+        assert client.get(f"/api/uploads/{session['id']}").status_code == 404
+        assert client.put(f"/api/uploads/{session['id']}/chunks/0", data=b'0123').status_code == 404
+
+    @pytest.mark.file_ops
+    def test_invalid_session_requests(self, client, workspace):
+        """Test the errors of session creation"""
+        assert self._create_session(client, f'{workspace}/missing').status_code == 404
+        assert self._create_session(client, workspace, filename='script.exe').status_code == 400
+        assert client.post('/api/uploads', json={'folder': workspace, 'filename': 'a.txt'}).status_code == 400
+        assert client.get('/api/uploads/not-a-session').status_code == 404
+
+    @pytest.mark.file_ops
+    @pytest.mark.parametrize('folder', ['..', '../tests', 'articles/../..', '.filely', 'articles/.filely'])
+    def test_upload_outside_uploads(self, client, folder):
+        """Test that sessions cannot target folders outside uploads or internal state"""
+        response = self._create_session(client, folder, filename='requirements.txt')
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Invalid path!'
+
+    @pytest.mark.file_ops
+    def test_upload_through_symlink(self, client, workspace, tmp_path):
+        """Test that a symlink leading out of uploads is not followed"""
+        os.symlink(tmp_path, os.path.join('uploads', workspace, 'outside'))
+
+        response = self._create_session(client, f'{workspace}/outside')
+        assert response.status_code == 400
+        assert not os.listdir(tmp_path)
+
+    @pytest.mark.file_ops
+    def test_complete_after_folder_replaced_by_symlink(self, client, workspace, tmp_path):
+        """Test that the folder is checked again when the upload completes"""
+        os.mkdir(os.path.join('uploads', workspace, 'target'))
+        session = self._create_session(client, f'{workspace}/target', size=4).get_json()
+        client.put(f"/api/uploads/{session['id']}/chunks/0", data=b'0123')
+        os.rmdir(os.path.join('uploads', workspace, 'target'))
+        os.symlink(tmp_path, os.path.join('uploads', workspace, 'target'))
+
+        response = client.post(f"/api/uploads/{session['id']}/complete")
+        assert response.status_code == 400
+        assert not os.listdir(tmp_path)
+
+    @pytest.mark.file_ops
+    def test_complete_twice(self, client, workspace):
+        """Test that a session completes only once"""
+        session = self._create_session(client, workspace, size=4).get_json()
+        client.put(f"/api/uploads/{session['id']}/chunks/0", data=b'0123')
+
+        assert client.post(f"/api/uploads/{session['id']}/complete").status_code == 200
+        response = client.post(f"/api/uploads/{session['id']}/complete")
+        assert response.status_code == 404
+        assert response.get_json()['error'] == 'Upload session not found!'
+
+    @pytest.mark.file_ops
+    def test_complete_over_existing_items(self, client, workspace):
+        """Test that an upload replaces a file of the same name but not a folder"""
+        with open(os.path.join('uploads', workspace, 'chunked.txt'), 'wb') as f:
+            f.write(b'old')
+        session = self._create_session(client, workspace, size=4).get_json()
+        client.put(f"/api/uploads/{session['id']}/chunks/0", data=b'0123')
+        assert client.post(f"/api/uploads/{session['id']}/complete").status_code == 200
+        with open(os.path.join('uploads', workspace, 'chunked.txt'), 'rb') as f:
+            assert f.read() == b'0123'
+
+        os.mkdir(os.path.join('uploads', workspace, 'folder.txt'))
+        session = self._create_session(client, workspace, filename='folder.txt', size=4).get_json()
+        client.put(f"/api/uploads/{session['id']}/chunks/0", data=b'0123')
+        response = client.post(f"/api/uploads/{session['id']}/complete")
+        assert response.status_code == 409
+        assert response.get_json()['error'] == 'An item with that name already exists!'
+        assert os.path.isdir(os.path.join('uploads', workspace, 'folder.txt'))
+
+        # The session is kept for the client to complete once the folder is gone
+        os.rmdir(os.path.join('uploads', workspace, 'folder.txt'))
+        assert client.post(f"/api/uploads/{session['id']}/complete").status_code == 200
+
+    @pytest.mark.file_ops
+    def test_concurrent_complete(self, tmp_path):
+        """Test that of concurrent completions exactly one moves the file"""
+        store = ChunkedUploadStore(str(tmp_path / 'chunked'))
+        session = store.create('', 'chunked.txt', 4, 4)
+        store.write_chunk(session, 0, io.BytesIO(b'0123'))
+        target_path = str(tmp_path / 'chunked.txt')
+        barrier = threading.Barrier(8)
+        results = []
+
+        def complete():
+            barrier.wait()
+            try:
+                store.finish(session, target_path)
+                results.append(200)
+            except UploadError as e:
+                results.append(e.status)
+
+        threads = [threading.Thread(target=complete) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(results) == [200] + [404] * 7
+        with open(target_path, 'rb') as f:
+            assert f.read() == b'0123'
+        assert os.listdir(tmp_path / 'chunked') == []
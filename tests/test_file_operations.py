@@ -209,8 +209,9 @@ class TestFileOperations:
             new_window = [handle for handle in browser.window_handles if handle != original_window][0]
             browser.switch_to.window(new_window)
 
-            # Verify preview content
-            assert 'Lorem ipsum dolor sit amet' in browser.page_source
+            # Verify preview content, the viewer fetches and renders the lines after loading
+            WebDriverWait(browser, 10).until(
+                EC.text_to_be_present_in_element((By.ID, 'viewerLines'), 'Lorem ipsum dolor sit amet'))
 
             # Close preview tab and switch back
             browser.close()
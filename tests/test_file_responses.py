@@ -0,0 +1,127 @@
+import pytest
+from datetime import timedelta
+from werkzeug.http import http_date
+from .test_utils import upload_test_file
+
+CONTENT = b'0123456789'
+
+
+class TestFileResponses:
+    """Test range and conditional requests of file downloads"""
+
+    @pytest.fixture
+    def file_url(self, client, workspace):
+        upload_test_file(client, workspace, 'digits.txt', CONTENT)
+        return f'/download/{workspace}/digits.txt'
+
+    def _get(self, client, url, **headers):
+        response = client.get(url, headers=headers)
+        data = response.get_data()
+        response.close()
+        return response, data
+
+    @pytest.mark.file_ops
+    def test_full_download(self, client, file_url):
+        """Test that a whole file comes with its validators"""
+        response, data = self._get(client, file_url)
+        assert response.status_code == 200
+        assert data == CONTENT
+        assert response.headers['Accept-Ranges'] == 'bytes'
+        assert response.headers['ETag']
+        assert response.headers['Last-Modified']
+        assert response.content_length == len(CONTENT)
+
+    @pytest.mark.file_ops
+    @pytest.mark.parametrize('header, body, content_range', [
+        ('bytes=2-5', b'2345', 'bytes 2-5/10'),
+        ('bytes=7-', b'789', 'bytes 7-9/10'),
+        ('bytes=-3', b'789', 'bytes 7-9/10'),
+        ('bytes=8-100', b'89', 'bytes 8-9/10'),
+    ])
+    def test_single_range(self, client, file_url, header, body, content_range):
+        """Test that a Range request gets its bytes only"""
+        response, data = self._get(client, file_url, Range=header)
+        assert response.status_code == 206
+        assert data == body
+        assert response.headers['Content-Range'] == content_range
+        assert response.content_length == len(body)
+
+    @pytest.mark.file_ops
+    def test_multiple_ranges(self, client, file_url):
+        """Test that several ranges come as multipart/byteranges"""
+        response, data = self._get(client, file_url, Range='bytes=0-1,6-7')
+        assert response.status_code == 206
+        assert response.mimetype == 'multipart/byteranges'
+        assert b'Content-Range: bytes 0-1/10\r\n\r\n01\r\n' in data
+        assert b'Content-Range: bytes 6-7/10\r\n\r\n67\r\n' in data
+        assert response.content_length == len(data)
+
+    @pytest.mark.file_ops
+    def test_unsatisfiable_range(self, client, file_url):
+        """Test that a range past the end of the file gets 416"""
+        response, data = self._get(client, file_url, Range='bytes=100-')
+        assert response.status_code == 416
+        assert response.headers['Content-Range'] == 'bytes */10'
+        assert data == b''
+
+    @pytest.mark.file_ops
+    def test_not_modified(self, client, file_url):
+        """Test that a cached copy is revalidated with 304"""
+        response, _ = self._get(client, file_url)
+
+        cached, data = self._get(client, file_url, **{'If-None-Match': response.headers['ETag']})
+        assert cached.status_code == 304
+        assert data == b''
+        assert cached.headers['ETag'] == response.headers['ETag']
+
+        cached, _ = self._get(client, file_url, **{'If-Modified-Since': response.headers['Last-Modified']})
+        assert cached.status_code == 304
+
+        changed, data = self._get(client, file_url, **{'If-None-Match': '"something-else"'})
+        assert changed.status_code == 200
+        assert data == CONTENT
+
+    @pytest.mark.file_ops
+    def test_if_range(self, client, file_url):
+        """Test that a range is only served if the file did not change"""
+        response, _ = self._get(client, file_url)
+
+        current, data = self._get(client, file_url, Range='bytes=0-1', **{'If-Range': response.headers['ETag']})
+        assert current.status_code == 206
+        assert data == b'01'
+
+        stale, data = self._get(client, file_url, Range='bytes=0-1', **{'If-Range': '"something-else"'})
+        assert stale.status_code == 200
+        assert data == CONTENT
+
+    @pytest.mark.file_ops
+    def test_if_range_date(self, client, file_url):
+        """Test that a date If-Range only serves a range for the exact Last-Modified"""
+        response, _ = self._get(client, file_url)
+        last_modified = response.last_modified
+
+        current, data = self._get(client, file_url, Range='bytes=0-1',
+                                  **{'If-Range': http_date(last_modified)})
+        assert current.status_code == 206
+        assert data == b'01'
+
+        later, data = self._get(client, file_url, Range='bytes=0-1',
+                                **{'If-Range': http_date(last_modified + timedelta(days=1))})
+        assert later.status_code == 200
+        assert data == CONTENT
+
+    @pytest.mark.file_ops
+    def test_stream_range(self, client, workspace):
+        """Test that media streaming honours Range requests"""
+        upload_test_file(client, workspace, 'clip.mp4', CONTENT)
+
+        response, data = self._get(client, f'/stream/{workspace}/clip.mp4', Range='bytes=0-3')
+        assert response.status_code == 206
+        assert response.mimetype == 'video/mp4'
+        assert data == b'0123'
+
+    @pytest.mark.file_ops
+    def test_missing_file(self, client, workspace):
+        """Test that downloading a missing file redirects to the file list"""
+        response, _ = self._get(client, f'/download/{workspace}/missing.txt')
+        assert response.status_code == 302
@@ -0,0 +1,54 @@
+import io
+import os
+import zipfile
+import pytest
+from .test_utils import upload_test_file
+
+
+class TestFolderDownload:
+    """Test downloading folders as zip archives"""
+
+    def _download(self, client, url):
+        response = client.get(url)
+        data = response.get_data()
+        response.close()
+        return response, data
+
+    @pytest.mark.folder_ops
+    def test_download_folder(self, client, workspace):
+        """Test that a folder is zipped with its subfolders"""
+        upload_test_file(client, workspace, 'top.txt', b'top')
+        upload_test_file(client, f'{workspace}/sub', 'nested.txt', b'nested')
+
+        response, data = self._download(client, f'/download_folder/{workspace}')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/zip'
+        assert f'{workspace}.zip' in response.headers['Content-Disposition']
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.read(f'{workspace}/top.txt') == b'top'
+            assert archive.read(f'{workspace}/sub/nested.txt') == b'nested'
+
+    @pytest.mark.folder_ops
+    def test_download_missing_folder(self, client, workspace):
+        """Test that a missing folder redirects to the file list"""
+        response, _ = self._download(client, f'/download_folder/{workspace}/missing')
+        assert response.status_code == 302
+
+    @pytest.mark.folder_ops
+    @pytest.mark.parametrize('folder_path', ['..', '../tests', 'articles/../..', '..%2F..', '.filely'])
+    def test_download_outside_uploads(self, client, folder_path):
+        """Test that folders outside uploads or internal state are never zipped"""
+        response, data = self._download(client, f'/download_folder/{folder_path}')
+        assert response.status_code == 302
+        assert not data.startswith(b'PK')
+
+    @pytest.mark.folder_ops
+    def test_download_through_symlink(self, client, workspace, tmp_path):
+        """Test that a symlink leading out of uploads is not followed"""
+        (tmp_path / 'secret.txt').write_bytes(b'secret')
+        os.symlink(tmp_path, os.path.join('uploads', workspace, 'outside'))
+
+        response, data = self._download(client, f'/download_folder/{workspace}/outside')
+        assert response.status_code == 302
+        assert b'secret' not in data
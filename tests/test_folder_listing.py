@@ -0,0 +1,70 @@
+import contextvars
+import os
+import pytest
+from .test_utils import upload_test_file
+
+
+def scan_counting(path):
+    """Return (items, fs op counts) of scan_folder(path)"""
+    import app
+
+    def scan():
+        ops = app.fsops.track()
+        return app.scan_folder(path), ops.counts
+
+    return contextvars.copy_context().run(scan)
+
+
+class TestFolderListing:
+    """Test the single-pass scandir listing of a folder"""
+
+    @pytest.mark.folder_ops
+    def test_listing_items(self, client, workspace):
+        """Test that files and folders are listed with their details"""
+        upload_test_file(client, workspace, 'report.pdf', b'%PDF-1.4')
+        upload_test_file(client, f'{workspace}/photos', 'cat.jpg', b'1234567')
+        upload_test_file(client, f'{workspace}/photos', 'dog.jpg', b'123')
+
+        items, _ = scan_counting(os.path.join('uploads', workspace))
+        by_name = {item['name']: item for item in items}
+        assert sorted(by_name) == ['photos', 'report.pdf']
+
+        folder = by_name['photos']
+        assert folder['type'] == 'folder'
+        assert (folder['size'], folder['file_count'], folder['item_count']) == (10, 2, 2)
+        assert folder['path'] == os.path.join('uploads', workspace, 'photos')
+
+        report = by_name['report.pdf']
+        assert report['type'] == 'file'
+        assert report['size'] == 8
+        assert report['category'] == 'document'
+        assert report['mtime'] == os.stat(os.path.join('uploads', workspace, 'report.pdf')).st_mtime
+
+    @pytest.mark.folder_ops
+    def test_one_pass(self, client, workspace):
+        """Test that a listing reads the folder once and stats each entry once"""
+        for i in range(5):
+            upload_test_file(client, workspace, f'file{i}.txt', b'x' * i)
+        client.post('/create_folder', data={'current_path': workspace, 'new_folder_name': 'sub'})
+        upload_test_file(client, f'{workspace}/sub', 'deep.txt', b'deep')
+
+        items, counts = scan_counting(os.path.join('uploads', workspace))
+        assert len(items) == 6
+        assert counts['list'] == 1
+        assert counts['stat'] == 6
+        assert counts['open'] == 0
+
+    @pytest.mark.folder_ops
+    def test_unindexed_folder(self, client, workspace):
+        """Test that a subfolder the index does not know is listed without being read"""
+        os.makedirs(os.path.join('uploads', workspace, 'fresh', 'deeper'))
+
+        items, counts = scan_counting(os.path.join('uploads', workspace))
+        assert [(item['name'], item['item_count']) for item in items] == [('fresh', None)]
+        assert counts['list'] == 1
+
+    @pytest.mark.folder_ops
+    def test_internal_state_hidden(self):
+        """Test that Filely's own state folder is not listed"""
+        items, _ = scan_counting('uploads')
+        assert '.filely' not in [item['name'] for item in items]
@@ -0,0 +1,89 @@
+import os
+import pytest
+from metadata_index import MetadataIndex
+from .test_utils import upload_test_file
+
+
+def write(root, path, size):
+    os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+    with open(os.path.join(root, path), 'wb') as f:
+        f.write(b'x' * size)
+
+
+@pytest.fixture
+def index(tmp_path):
+    root = str(tmp_path / 'uploads')
+    os.makedirs(root)
+    return MetadataIndex(str(tmp_path / 'index.sqlite3'), root, lambda name: 'document')
+
+
+def totals(index):
+    """Every folder's (size, file_count, item_count)"""
+    return {row['path']: (row['size'], row['file_count'], row['item_count']) for row in index.conn.execute(
+        "SELECT path, size, file_count, item_count FROM entries WHERE type = 'folder'")}
+
+
+class TestFolderTotals:
+    """Test the recursive size and counts kept on folder rows"""
+
+    @pytest.mark.folder_ops
+    def test_incremental_totals(self, index):
+        """Test that each change updates the ancestors as a full recount would"""
+        write(index.root, 'a/b/one.txt', 10)
+        write(index.root, 'a/b/two.txt', 5)
+        write(index.root, 'a/three.txt', 1)
+        with index.transaction() as tx:
+            tx.insert_tree('a')
+        assert totals(index) == {'a': (16, 3, 2), 'a/b': (15, 2, 2)}
+
+        write(index.root, 'a/b/one.txt', 20)
+        write(index.root, 'c/four.txt', 7)
+        with index.transaction() as tx:
+            tx.upsert_file('a/b/one.txt')
+            tx.insert_tree('c')
+        os.rename(os.path.join(index.root, 'a', 'b'), os.path.join(index.root, 'c', 'b'))
+        with index.transaction() as tx:
+            tx.move('a/b', 'c/b')
+        os.remove(os.path.join(index.root, 'a', 'three.txt'))
+        with index.transaction() as tx:
+            tx.remove('a/three.txt')
+
+        incremental = totals(index)
+        assert incremental == {'a': (0, 0, 0), 'c': (32, 3, 2), 'c/b': (25, 2, 2)}
+        index.reconcile()
+        assert totals(index) == incremental
+        assert index.folder_totals() == (32, 3)
+        assert index.folder_totals('c/b') == (25, 2)
+
+    @pytest.mark.folder_ops
+    def test_removed_folder(self, index):
+        """Test that removing a folder takes its whole subtree off its ancestors"""
+        write(index.root, 'a/b/c/one.txt', 10)
+        write(index.root, 'a/two.txt', 3)
+        with index.transaction() as tx:
+            tx.insert_tree('a')
+        with index.transaction() as tx:
+            tx.remove('a/b')
+
+        assert totals(index)['a'] == (3, 1, 1)
+        assert index.folder_totals('a/b') == (0, 0)
+
+
+class TestFolderTotalsApi:
+    """Test the folder totals shown by the listings"""
+
+    def _folder(self, client, parent, name):
+        items = client.get(f'/api/files/{parent}').get_json()['items']
+        return [item for item in items if item['name'] == name][0]
+
+    @pytest.mark.folder_ops
+    def test_listed_totals(self, client, workspace):
+        """Test that a listed folder shows the size and counts of its subtree"""
+        upload_test_file(client, f'{workspace}/docs', 'a.txt', b'12345')
+        upload_test_file(client, f'{workspace}/docs/sub', 'b.txt', b'123')
+        folder = self._folder(client, workspace, 'docs')
+        assert (folder['size'], folder['file_count'], folder['item_count']) == (8, 2, 2)
+
+        client.get(f'/delete_item/{workspace}/docs/sub/b.txt')
+        folder = self._folder(client, workspace, 'docs')
+        assert (folder['size'], folder['file_count'], folder['item_count']) == (5, 1, 2)
@@ -0,0 +1,95 @@
+import contextvars
+import os
+import re
+import threading
+import pytest
+import fsops
+from .test_utils import upload_test_file
+
+
+def tracked(function):
+    """Run function with its filesystem calls tracked, returns (result, FsOps)"""
+    def run():
+        ops = fsops.track()
+        return function(), ops
+    return contextvars.copy_context().run(run)
+
+
+def parse_header(value):
+    return {op: int(count) for op, count in (pair.split('=') for pair in value.split(', '))}
+
+
+class TestFsOps:
+    """Test counting the filesystem calls of a request"""
+
+    @pytest.mark.file_ops
+    def test_counts(self, tmp_path):
+        """Test that each call counts once under its kind of operation"""
+        def calls():
+            fsops.makedirs(str(tmp_path / 'a' / 'b'))
+            with fsops.open(str(tmp_path / 'a' / 'b' / 'file.txt'), 'w') as f:
+                f.write('data')
+            fsops.exists(str(tmp_path / 'a'))
+            fsops.getsize(str(tmp_path / 'a' / 'b' / 'file.txt'))
+            fsops.rename(str(tmp_path / 'a' / 'b' / 'file.txt'), str(tmp_path / 'a' / 'file.txt'))
+            with fsops.scandir(str(tmp_path / 'a')) as entries:
+                names = sorted(entry.name for entry in entries)
+            walked = list(fsops.walk(str(tmp_path)))
+            fsops.rmtree(str(tmp_path / 'a'))
+            return names, len(walked)
+
+        (names, folders), ops = tracked(calls)
+        assert names == ['b', 'file.txt']
+        assert ops.counts == {'stat': 2, 'list': 1 + folders, 'open': 1, 'mkdir': 1, 'rename': 1, 'unlink': 1}
+        assert all(ops.seconds[op] > 0 for op in fsops.OPS)
+        assert ops.header() == f'stat=2, list={1 + folders}, open=1, mkdir=1, rename=1, unlink=1'
+        assert re.fullmatch(r'fs-stat;dur=[\d.]+;desc="2 calls", fs-list;dur=[\d.]+;desc="\d+ calls", .*',
+                            ops.server_timing())
+
+    @pytest.mark.file_ops
+    def test_untracked(self, tmp_path):
+        """Test that calls outside the tracked context are not counted"""
+        def calls():
+            thread = threading.Thread(target=fsops.exists, args=(str(tmp_path),))
+            thread.start()
+            thread.join()
+            list(fsops.scandir(str(tmp_path)))
+
+        _, ops = tracked(calls)
+        assert ops.counts['stat'] == 0
+        assert ops.counts['list'] == 1
+        fsops.exists(str(tmp_path))
+        assert ops.counts['stat'] == 0
+
+
+class TestFsOpsHeaders:
+    """Test the filesystem calls reported with each response"""
+
+    @pytest.mark.file_ops
+    def test_headers(self, client, workspace):
+        """Test that responses carry their calls in X-Filely-Fs-Ops and Server-Timing"""
+        upload_test_file(client, workspace, 'report.txt', b'report')
+        response = client.get(f'/preview/{workspace}/report.txt')
+        counts = parse_header(response.headers['X-Filely-Fs-Ops'])
+        assert list(counts) == list(fsops.OPS)
+        assert counts['stat'] > 0
+        assert 'fs-stat;dur=' in response.headers['Server-Timing']
+
+        response = client.get('/healthz')
+        assert set(parse_header(response.headers['X-Filely-Fs-Ops']).values()) == {0}
+        assert 'Server-Timing' not in response.headers
+
+    @pytest.mark.file_ops
+    def test_headers_disabled(self, client, workspace, monkeypatch):
+        """Test that FS_OPS_HEADERS off leaves the headers out, not the metrics"""
+        from app import app, metrics
+        monkeypatch.setitem(app.config, 'FS_OPS_HEADERS', False)
+        upload_test_file(client, workspace, 'report.txt', b'report')
+        key = ('filely_fs_ops_total', (('endpoint', 'preview_file'), ('op', 'stat')))
+        before = metrics.collect().get(key, 0)
+
+        response = client.get(f'/preview/{workspace}/report.txt')
+        response.close()
+        assert 'X-Filely-Fs-Ops' not in response.headers
+        assert 'Server-Timing' not in response.headers
+        assert metrics.collect()[key] > before
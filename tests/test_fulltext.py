@@ -0,0 +1,106 @@
+import os
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from fulltext import FullTextIndex
+from .test_utils import upload_test_file
+
+DOCUMENTS = {
+    'notes/alpha.txt': 'The quarterly budget review is due on Friday. Budget numbers attached.',
+    'notes/beta.txt': 'Team lunch on Friday.',
+    'notes/gamma.txt': 'The budget for the offsite was approved.'
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    root = tmp_path / 'uploads'
+    for path, text in DOCUMENTS.items():
+        os.makedirs(root / os.path.dirname(path), exist_ok=True)
+        (root / path).write_text(text)
+    index = FullTextIndex(str(tmp_path / 'fulltext.sqlite3'), str(root))
+    for path in DOCUMENTS:
+        index.enqueue(path)
+    return index
+
+
+def index_all(index):
+    with ThreadPoolExecutor(2) as pool:
+        while index.index_pending(pool):
+            pass
+
+
+class TestFullTextIndex:
+    """Test indexing and searching document contents"""
+
+    @pytest.mark.preview
+    def test_search(self, index):
+        """Test that documents holding every term are ranked with their snippets"""
+        index_all(index)
+
+        total, results = index.search('budget')
+        assert total == 2
+        assert [result['path'] for result in results] == ['notes/alpha.txt', 'notes/gamma.txt']
+        text = DOCUMENTS['notes/alpha.txt']
+        assert [text[start:start + length].lower() for start, length in results[0]['snippets']] == ['budget'] * 2
+
+        total, results = index.search('friday budget')
+        assert total == 1
+        assert results[0]['path'] == 'notes/alpha.txt'
+        assert index.search('friday offsite') == (0, [])
+        assert index.search('nowhere') == (0, [])
+
+    @pytest.mark.preview
+    def test_removed_documents(self, index):
+        """Test that removed documents, alone or with their folder, leave the results"""
+        index_all(index)
+        index.remove('notes/gamma.txt')
+        assert [result['path'] for result in index.search('budget')[1]] == ['notes/alpha.txt']
+
+        index.remove('notes')
+        assert index.search('budget') == (0, [])
+
+    @pytest.mark.preview
+    def test_file_deleted_before_indexing(self, index):
+        """Test that a document deleted while queued is forgotten rather than retried"""
+        os.remove(os.path.join(index.root, 'notes', 'beta.txt'))
+        index_all(index)
+
+        paths = [row[0] for row in index.conn.execute('SELECT path FROM docs ORDER BY path')]
+        assert paths == ['notes/alpha.txt', 'notes/gamma.txt']
+        assert index.pending_count() == 0
+
+    @pytest.mark.preview
+    def test_reindexed_document(self, index):
+        """Test that a changed document is only found for its new content"""
+        index_all(index)
+        with open(os.path.join(index.root, 'notes', 'beta.txt'), 'w') as f:
+            f.write('Budget lunch moved to Monday.')
+        index.enqueue('notes/beta.txt')
+        index_all(index)
+
+        assert index.search('friday lunch') == (0, [])
+        assert index.search('monday')[1][0]['path'] == 'notes/beta.txt'
+        assert index.search('budget')[0] == 3
+
+
+class TestFullTextApi:
+    """Test the full-text search API"""
+
+    @pytest.mark.preview
+    def test_search_api(self, client, workspace):
+        """Test that an uploaded document can be found by its content"""
+        upload_test_file(client, workspace, 'minutes.txt', f'Minutes {workspace} signed'.encode())
+        for _ in range(100):
+            data = client.get(f'/api/fulltext?q={workspace} signed').get_json()
+            if data['total']:
+                break
+            time.sleep(0.2)
+        assert data['results'][0]['path'] == f'{workspace}/minutes.txt'
+        assert data['next_offset'] is None
+
+    @pytest.mark.preview
+    def test_invalid_queries(self, client):
+        """Test the errors of the full-text search API"""
+        assert client.get('/api/fulltext').status_code == 400
+        assert client.get('/api/fulltext?q=x&limit=many').status_code == 400
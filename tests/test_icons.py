@@ -0,0 +1,64 @@
+import os
+import re
+import pytest
+from .test_utils import upload_test_file
+
+
+def sprite_symbols():
+    with open(os.path.join('static', 'icons.svg')) as f:
+        return set(re.findall(r'<symbol[^>]* id="([\w-]+)"', f.read()))
+
+
+class TestFileCategories:
+    """Test the precomputed category and icon lookups"""
+
+    @pytest.mark.preview
+    @pytest.mark.parametrize('filename, category, icon', [
+        ('photo.JPG', 'image', 'icon-image'),
+        ('report.tar.pdf', 'document', 'icon-document'),
+        ('backup.zip', 'archive', 'icon-archive'),
+        ('clip.mp4', 'video', 'icon-video'),
+        ('song.mp3', 'audio', 'icon-audio'),
+        ('Makefile', 'other', 'icon-document'),
+        ('script.py', 'other', 'icon-document')
+    ])
+    def test_lookup(self, filename, category, icon):
+        """Test that the lookups give each extension its category and icon"""
+        from app import get_file_category, get_file_icon
+        assert get_file_category(filename) == category
+        assert get_file_icon(filename) == icon
+
+    @pytest.mark.preview
+    def test_every_extension_categorized(self):
+        """Test that the lookup tables cover FILE_CATEGORIES and the sprite"""
+        from app import CATEGORY_ICONS, EXTENSION_CATEGORIES, FILE_CATEGORIES, FOLDER_ICON
+        assert sorted(EXTENSION_CATEGORIES) == sorted(ext for exts in FILE_CATEGORIES.values() for ext in exts)
+        assert set(CATEGORY_ICONS) == set(FILE_CATEGORIES)
+        assert set(CATEGORY_ICONS.values()) | {FOLDER_ICON} <= sprite_symbols()
+
+
+class TestIconSprite:
+    """Test the icons drawn from the cached SVG sprite"""
+
+    @pytest.mark.preview
+    def test_templates_use_known_symbols(self):
+        """Test that every symbol a template references is in the sprite"""
+        used = set()
+        for name in os.listdir('templates'):
+            with open(os.path.join('templates', name)) as f:
+                used.update(re.findall(r'#(icon-[\w-]+)"', f.read()))
+        assert used
+        assert used <= sprite_symbols()
+
+    @pytest.mark.preview
+    def test_rows_reference_sprite(self, client, workspace):
+        """Test that listed rows point at the fingerprinted sprite instead of inlining paths"""
+        upload_test_file(client, workspace, 'report.pdf', b'%PDF-1.4')
+        client.post('/create_folder', data={'current_path': workspace, 'new_folder_name': 'sub'})
+        html = client.get(f'/api/files/{workspace}?format=html').get_json()['html']
+
+        hrefs = set(re.findall(r'<use href="([^"#]+)#(icon-[\w-]+)"', html))
+        assert {icon for _, icon in hrefs} >= {'icon-folder', 'icon-document', 'icon-rename', 'icon-delete'}
+        assert len({url for url, _ in hrefs}) == 1
+        assert re.fullmatch(r'/assets/icons\.[0-9a-f]{12}\.svg', hrefs.pop()[0])
+        assert '<path' not in html
@@ -0,0 +1,53 @@
+import os
+import pytest
+
+STATE_DIR = os.path.join('uploads', '.filely')
+
+
+class TestInternalState:
+    """Test that no page route reaches Filely's own state under uploads/.filely"""
+
+    @pytest.mark.file_ops
+    @pytest.mark.parametrize('url', [
+        '/files/.filely',
+        '/files/.filely/trash',
+        '/files/articles/../.filely',
+        '/preview/.filely/index.sqlite3',
+        '/view/.filely/index.sqlite3',
+        '/download/.filely/index.sqlite3',
+        '/download/..%2Fapp.py',
+        '/stream/.filely/index.sqlite3',
+        '/download_folder/.filely',
+    ])
+    def test_get_routes(self, client, url):
+        """Test that reading internal state redirects to the file list"""
+        response = client.get(url)
+        assert response.status_code == 302
+        assert response.headers['Location'].endswith('/files')
+        assert not response.get_data().startswith(b'SQLite format')
+        response.close()
+
+    @pytest.mark.file_ops
+    def test_thumbnail(self, client):
+        """Test that thumbnails are not rendered for internal files"""
+        assert client.get('/thumbnail/.filely/image.png').status_code == 404
+
+    @pytest.mark.folder_ops
+    @pytest.mark.parametrize('url, data', [
+        ('/files/.filely/trash', {'new_folder_name': 'intruder'}),
+        ('/create_folder', {'current_path': '.filely/trash', 'new_folder_name': 'intruder'}),
+    ])
+    def test_write_routes(self, client, url, data):
+        """Test that folders cannot be created inside internal state"""
+        response = client.post(url, data=data)
+        assert response.status_code == 302
+        assert not os.path.exists(os.path.join(STATE_DIR, 'trash', 'intruder'))
+
+    @pytest.mark.rename
+    @pytest.mark.parametrize('item_path', ['.filely', '.filely/index.sqlite3', '/'])
+    def test_rename_and_delete(self, client, item_path):
+        """Test that internal state can be neither renamed nor deleted"""
+        client.post('/rename_item', data={'item_path': item_path, 'new_name': 'state'})
+        client.get(f'/delete_item/{item_path}')
+        assert os.path.isfile(os.path.join(STATE_DIR, 'index.sqlite3'))
+        assert not os.path.exists(os.path.join('uploads', 'state'))
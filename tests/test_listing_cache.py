@@ -0,0 +1,120 @@
+import os
+import pytest
+from listing_cache import ListingCache
+from .test_utils import upload_test_file
+
+
+def item(name):
+    return {'name': name, 'path': f'uploads/{name}'}
+
+
+class TestListingCache:
+    """Test the LRU of folder listings"""
+
+    @pytest.fixture
+    def changes(self):
+        return {}
+
+    @pytest.fixture
+    def cache(self, changes):
+        def on_change(name, delta):
+            changes[name] = changes.get(name, 0) + delta
+        return ListingCache(max_bytes=10000, on_change=on_change)
+
+    @pytest.mark.folder_ops
+    def test_validator(self, cache, changes):
+        """Test that a listing is only served for the validator it was stored with"""
+        cache.put('uploads/docs', (1, 100), [item('a.txt')])
+
+        assert cache.get('uploads/docs', (1, 100)) == [item('a.txt')]
+        assert cache.get('uploads/docs/', (1, 100)) == [item('a.txt')]
+        assert cache.get('uploads/docs', (1, 200)) is None
+        assert changes['hits'] == 2
+        assert changes['misses'] == 1
+        assert changes['entries'] == 1
+
+    @pytest.mark.folder_ops
+    def test_eviction(self, cache, changes):
+        """Test that the least recently used listings go once the cache is full"""
+        for i in range(20):
+            cache.put(f'uploads/folder{i}', (i, 0), [item(f'file{i}.txt')])
+            cache.get('uploads/folder0', (0, 0))
+
+        assert cache.get('uploads/folder0', (0, 0)) is not None
+        assert cache.get('uploads/folder1', (1, 0)) is None
+        assert cache.get('uploads/folder19', (19, 0)) is not None
+        assert changes['evictions'] > 0
+        assert changes['bytes'] <= 10000
+
+    @pytest.mark.folder_ops
+    def test_invalidate(self, cache, changes):
+        """Test that invalidation drops a listing, and with recursive=True everything below it"""
+        for path in ('uploads/docs', 'uploads/docs/sub', 'uploads/docs/sub/deeper', 'uploads/docs2'):
+            cache.put(path, (0, 0), [item('a.txt')])
+
+        cache.invalidate('uploads/docs/sub')
+        assert cache.get('uploads/docs/sub', (0, 0)) is None
+        assert cache.get('uploads/docs/sub/deeper', (0, 0)) is not None
+
+        cache.invalidate('uploads/docs', recursive=True)
+        assert cache.get('uploads/docs/sub/deeper', (0, 0)) is None
+        assert cache.get('uploads/docs2', (0, 0)) is not None
+        assert changes['invalidations'] == 3
+        assert changes['entries'] == 1
+
+
+class TestListingConsistency:
+    """Test that folder listings follow changes made outside Filely"""
+
+    def _names(self, client, folder):
+        return sorted(item['name'] for item in client.get(f'/api/files/{folder}').get_json()['items'])
+
+    @pytest.mark.folder_ops
+    def test_api_rescans_changed_folder(self, client, workspace):
+        """Test that files added or removed behind Filely's back show in /api/files"""
+        from app import metrics
+        upload_test_file(client, workspace, 'uploaded.txt', b'uploaded')
+        assert self._names(client, workspace) == ['uploaded.txt']
+
+        with open(os.path.join('uploads', workspace, 'copied.txt'), 'wb') as f:
+            f.write(b'copied in')
+        os.makedirs(os.path.join('uploads', workspace, 'synced', 'deeper'))
+        before = metrics.collect().get(('filely_listing_rescans_total', ()), 0)
+        assert self._names(client, workspace) == ['copied.txt', 'synced', 'uploaded.txt']
+        assert metrics.collect()[('filely_listing_rescans_total', ())] == before + 1
+        assert self._names(client, f'{workspace}/synced') == ['deeper']
+
+        os.remove(os.path.join('uploads', workspace, 'uploaded.txt'))
+        assert self._names(client, workspace) == ['copied.txt', 'synced']
+        totals = client.get(f'/api/files/{workspace}').get_json()
+        assert totals['file_count'] == 1
+
+    @pytest.mark.folder_ops
+    def test_page_rescans_changed_folder(self, client, workspace):
+        """Test that the streamed folder page shows files added behind Filely's back"""
+        client.get(f'/files/{workspace}').close()
+        with open(os.path.join('uploads', workspace, 'copied.txt'), 'wb') as f:
+            f.write(b'copied in')
+
+        response = client.get(f'/files/{workspace}')
+        assert 'copied.txt' in response.get_data(as_text=True)
+
+    @pytest.mark.folder_ops
+    def test_cached_page(self, client, workspace, monkeypatch):
+        """Test that without streamed listings pages come from the listing cache until changed"""
+        from app import app, metrics
+        monkeypatch.setitem(app.config, 'STREAMED_LISTINGS', False)
+        upload_test_file(client, workspace, 'first.txt', b'first')
+
+        def hits():
+            return metrics.collect().get(('filely_listing_cache_hits_total', ()), 0)
+
+        client.get(f'/files/{workspace}').close()
+        before = hits()
+        response = client.get(f'/files/{workspace}')
+        assert 'first.txt' in response.get_data(as_text=True)
+        assert hits() == before + 1
+
+        upload_test_file(client, workspace, 'second.txt', b'second')
+        response = client.get(f'/files/{workspace}')
+        assert 'second.txt' in response.get_data(as_text=True)
@@ -0,0 +1,150 @@
+import os
+import pytest
+from metadata_index import MetadataIndex
+from fulltext import FullTextIndex
+from .test_utils import upload_test_file
+
+
+def make_tree(root, folder, files=3):
+    os.makedirs(os.path.join(root, folder, 'sub'))
+    for i in range(files):
+        with open(os.path.join(root, folder, 'sub', f'f{i}.txt'), 'w') as f:
+            f.write(f'file {i}')
+
+
+@pytest.fixture
+def index(tmp_path):
+    root = str(tmp_path / 'uploads')
+    os.makedirs(root)
+    return MetadataIndex(str(tmp_path / 'index.sqlite3'), root, lambda name: 'document')
+
+
+class TestRemovedFolders:
+    """Test that removing a folder is cheap and the rows below it are pruned later"""
+
+    def _rows(self, index):
+        return index.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    @pytest.mark.folder_ops
+    def test_remove_hides_subtree(self, index):
+        """Test that rows below a removed folder are left in place but no longer visible"""
+        make_tree(index.root, 'docs')
+        with index.transaction() as tx:
+            tx.insert_tree('docs')
+        with index.transaction() as tx:
+            tx.remove('docs')
+
+        assert self._rows(index) == 4
+        assert index.get('docs') is None
+        assert index.get('docs/sub/f0.txt') is None
+        assert index.subtree('docs/sub') == []
+        assert list(index.iter_paths()) == []
+        assert index.folder_totals() == (0, 0)
+
+    @pytest.mark.folder_ops
+    def test_prune_removed(self, index):
+        """Test that pruning deletes the rows left below removed folders"""
+        make_tree(index.root, 'docs', files=5)
+        with index.transaction() as tx:
+            tx.insert_tree('docs')
+        with index.transaction() as tx:
+            tx.remove('docs')
+
+        assert index.prune_removed(batch_size=2) == ['docs']
+        assert self._rows(index) == 0
+        assert index.prune_removed() == []
+
+    @pytest.mark.folder_ops
+    def test_recreated_folder(self, index):
+        """Test that a folder recreated under a removed name only shows its new content"""
+        make_tree(index.root, 'docs')
+        with index.transaction() as tx:
+            tx.insert_tree('docs')
+        with index.transaction() as tx:
+            tx.remove('docs')
+        os.rename(os.path.join(index.root, 'docs'), os.path.join(index.root, 'old'))
+        os.makedirs(os.path.join(index.root, 'docs', 'sub'))
+        with index.transaction() as tx:
+            tx.insert_tree('docs')
+
+        assert sorted(index.subtree('docs')) == [('docs', True), ('docs/sub', True)]
+        assert index.folder_totals('docs') == (0, 0)
+
+    @pytest.mark.folder_ops
+    def test_move_keeps_removed_folders(self, index):
+        """Test that a removed folder below a moved one stays removed under its new path"""
+        make_tree(index.root, 'docs')
+        with index.transaction() as tx:
+            tx.insert_tree('docs')
+        with index.transaction() as tx:
+            tx.remove('docs/sub')
+        os.rename(os.path.join(index.root, 'docs'), os.path.join(index.root, 'moved'))
+        with index.transaction() as tx:
+            tx.move('docs', 'moved')
+
+        assert index.subtree('moved') == [('moved', True)]
+        assert index.prune_removed() == ['moved/sub']
+        assert self._rows(index) == 1
+
+
+class TestRemovedDocuments:
+    """Test that the full-text index forgets removed folders lazily"""
+
+    @pytest.mark.folder_ops
+    def test_remove_and_prune(self, tmp_path):
+        """Test that documents below a removed folder are skipped, then pruned"""
+        root = str(tmp_path / 'uploads')
+        make_tree(root, 'docs')
+        index = FullTextIndex(str(tmp_path / 'fulltext.sqlite3'), root)
+        for i in range(3):
+            index.enqueue(f'docs/sub/f{i}.txt')
+        assert index.pending_count() == 3
+
+        index.remove('docs')
+        assert index.pending_count() == 0
+        index.prune_removed()
+        assert index.conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0] == 0
+
+    @pytest.mark.folder_ops
+    def test_reused_folder(self, tmp_path):
+        """Test that a document queued under a removed name clears the old documents"""
+        root = str(tmp_path / 'uploads')
+        make_tree(root, 'docs')
+        index = FullTextIndex(str(tmp_path / 'fulltext.sqlite3'), root)
+        index.enqueue('docs/sub/f0.txt')
+        index.enqueue('docs/sub/f1.txt')
+        index.remove('docs')
+
+        index.enqueue('docs/sub/f2.txt')
+        paths = [row[0] for row in index.conn.execute('SELECT path FROM docs')]
+        assert paths == ['docs/sub/f2.txt']
+        assert index.pending_count() == 1
+
+
+class TestDeleteFolder:
+    """Test deleting folders through the API"""
+
+    @pytest.mark.folder_ops
+    def test_delete_logs_one_change(self, client, workspace):
+        """Test that deleting a folder writes a single change log entry"""
+        from app import metadata_index
+        client.post('/create_folder', data={'current_path': workspace, 'new_folder_name': 'docs'})
+        for i in range(3):
+            upload_test_file(client, f'{workspace}/docs', f'report{i}.txt', b'report')
+        seq = metadata_index.last_change()
+
+        client.get(f'/delete_item/{workspace}/docs')
+        changes, _ = metadata_index.changes_since(seq)
+        assert changes == [(f'{workspace}/docs', True, True)]
+
+    @pytest.mark.folder_ops
+    def test_deleted_folder_leaves_search(self, client, workspace):
+        """Test that files of a deleted folder are no longer found, nor listed once it is recreated"""
+        client.post('/create_folder', data={'current_path': workspace, 'new_folder_name': 'docs'})
+        upload_test_file(client, f'{workspace}/docs', 'quarterly_report.txt', b'report')
+        client.get(f'/delete_item/{workspace}/docs')
+        client.post('/create_folder', data={'current_path': workspace, 'new_folder_name': 'docs'})
+
+        results = client.get(f'/api/search?q={workspace}/docs/quarterly').get_json()['results']
+        assert results == []
+        assert client.get(f'/api/files/{workspace}/docs').get_json()['items'] == []
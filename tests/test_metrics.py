@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import re
+import pytest
+from metrics import ARCHIVE_NAME, Metrics
+
+fork = pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+
+
+def worker(directory, ready, done):
+    """Another worker process: report metrics, then wait to be let go"""
+    metrics = Metrics(directory)
+    metrics.inc('filely_listing_rescans_total', 2)
+    metrics.inc('filely_http_requests_in_flight', 3, endpoint='files')
+    metrics.observe('filely_listing_entries', 50, endpoint='files')
+    metrics.flush()
+    ready.set()
+    done.wait(10)
+
+
+def value(text, sample):
+    match = re.search(rf'^{re.escape(sample)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+class TestMetrics:
+    """Test the metrics of one process and their exposition"""
+
+    @pytest.mark.file_ops
+    def test_render(self, tmp_path):
+        """Test that counters, gauges and cumulative histogram buckets are rendered"""
+        metrics = Metrics(str(tmp_path))
+        metrics.inc('filely_listing_rescans_total')
+        metrics.inc('filely_listing_rescans_total', 4)
+        metrics.inc('filely_http_requests_in_flight', endpoint='files')
+        metrics.inc('filely_http_requests_in_flight', -1, endpoint='files')
+        for entries in (5, 10, 5000):
+            metrics.observe('filely_listing_entries', entries, endpoint='a "quoted" name')
+
+        text = metrics.render()
+        assert '# TYPE filely_listing_rescans_total counter' in text
+        assert '# TYPE filely_listing_entries histogram' in text
+        assert value(text, 'filely_listing_rescans_total') == 5
+        assert value(text, 'filely_http_requests_in_flight{endpoint="files"}') == 0
+        labels = 'endpoint="a \\"quoted\\" name"'
+        assert value(text, f'filely_listing_entries_bucket{{{labels},le="10"}}') == 2
+        assert value(text, f'filely_listing_entries_bucket{{{labels},le="1000"}}') == 2
+        assert value(text, f'filely_listing_entries_bucket{{{labels},le="+Inf"}}') == 3
+        assert value(text, f'filely_listing_entries_sum{{{labels}}}') == 5015
+        assert value(text, f'filely_listing_entries_count{{{labels}}}') == 3
+
+    @fork
+    @pytest.mark.file_ops
+    def test_shards_merged_and_archived(self, tmp_path):
+        """Test that live shards are summed and those of exited processes archived"""
+        directory = str(tmp_path)
+        metrics = Metrics(directory)
+        metrics.inc('filely_listing_rescans_total', 1)
+        metrics.inc('filely_http_requests_in_flight', 1, endpoint='files')
+
+        context = multiprocessing.get_context('fork')
+        ready, done = context.Event(), context.Event()
+        process = context.Process(target=worker, args=(directory, ready, done))
+        process.start()
+        try:
+            assert ready.wait(10)
+            totals = metrics.collect()
+            assert totals[('filely_listing_rescans_total', ())] == 3
+            assert totals[('filely_http_requests_in_flight', (('endpoint', 'files'),))] == 4
+            assert totals[('filely_listing_entries', (('endpoint', 'files'),))][2] == 1
+        finally:
+            done.set()
+            process.join(10)
+
+        totals = metrics.collect()
+        assert totals[('filely_listing_rescans_total', ())] == 3
+        assert totals[('filely_http_requests_in_flight', (('endpoint', 'files'),))] == 1
+        assert totals[('filely_listing_entries', (('endpoint', 'files'),))][2] == 1
+        assert os.path.exists(os.path.join(directory, ARCHIVE_NAME))
+        shards = [name for name in os.listdir(directory) if name.endswith('.json') and name != ARCHIVE_NAME]
+        assert len(shards) == 1
+
+        metrics.inc('filely_listing_rescans_total')
+        assert metrics.collect()[('filely_listing_rescans_total', ())] == 4
+
+
+class TestMetricsEndpoint:
+    """Test the /metrics endpoint"""
+
+    @pytest.mark.file_ops
+    def test_requests_counted(self, client, workspace):
+        """Test that served requests show up in the scraped metrics"""
+        text = client.get('/metrics').get_data(as_text=True)
+        sent_before = value(text, 'filely_http_response_bytes_total{endpoint="api_list_files"}') or 0
+        in_flight = value(text, 'filely_http_requests_in_flight{endpoint="api_list_files"}') or 0
+        response = client.get(f'/api/files/{workspace}')
+        response.close()
+
+        scrape = client.get('/metrics')
+        assert scrape.mimetype == 'text/plain'
+        text = scrape.get_data(as_text=True)
+        sent = value(text, 'filely_http_response_bytes_total{endpoint="api_list_files"}')
+        assert sent - sent_before == len(response.data)
+        assert value(text, 'filely_http_request_duration_seconds_count'
+                           '{endpoint="api_list_files",method="GET",status="200"}') >= 1
+        assert value(text, 'filely_http_requests_in_flight{endpoint="api_list_files"}') == in_flight
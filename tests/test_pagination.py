@@ -0,0 +1,100 @@
+import pytest
+from listing import InvalidCursor, Listing, encode_cursor, sort_key
+from .test_utils import upload_test_file
+
+
+def make_item(name, size=0, mtime=0, folder=False):
+    if folder:
+        return {'name': name, 'type': 'folder', 'size': size, 'mtime': mtime, 'path': name}
+    return {'name': name, 'type': 'file', 'size': size, 'mtime': mtime, 'category': 'text', 'path': name}
+
+
+class TestListingPages:
+    """Test cursor pagination over an in-memory listing"""
+
+    @pytest.fixture
+    def listing(self):
+        items = [make_item(f'file{i:02}.txt', size=i % 4, mtime=i) for i in range(25)]
+        items += [make_item(f'folder{i}', folder=True) for i in range(3)]
+        return Listing(items)
+
+    def _walk(self, listing, sort, order, limit=4):
+        names, cursor = [], None
+        while True:
+            items, cursor = listing.page(sort, order, cursor, limit)
+            names += [item['name'] for item in items]
+            if cursor is None:
+                return names
+
+    @pytest.mark.folder_ops
+    @pytest.mark.parametrize('sort', ['name', 'size', 'mtime', 'type'])
+    @pytest.mark.parametrize('order', ['asc', 'desc'])
+    def test_pages_cover_listing(self, listing, sort, order):
+        """Test that following cursors visits every item once, folders first"""
+        names = self._walk(listing, sort, order)
+        assert sorted(names) == sorted(item['name'] for item in listing)
+        assert names[:3] == sorted(names[:3], reverse=order == 'desc')
+        assert all(name.startswith('folder') for name in names[:3])
+        assert names == [item['name'] for item in listing.sorted_view(sort, order)[0]]
+
+    @pytest.mark.folder_ops
+    def test_cursor_of_other_sort(self, listing):
+        """Test that a cursor issued for one sort is refused for another"""
+        cursor = listing.page('name', 'asc', None, 5)[1]
+        with pytest.raises(InvalidCursor):
+            listing.page('size', 'asc', cursor, 5)
+
+    @pytest.mark.folder_ops
+    def test_cursor_after_removal(self, listing):
+        """Test that a cursor still works once the item it points at is gone"""
+        items, cursor = listing.page('name', 'asc', None, 5)
+        remaining = Listing([item for item in listing if item['name'] != items[-1]['name']])
+        next_items, _ = remaining.page('name', 'asc', cursor, 2)
+        assert [item['name'] for item in next_items] == ['file02.txt', 'file03.txt']
+        assert cursor == encode_cursor(sort_key(items[-1]))
+
+
+class TestListingApi:
+    """Test the paginated /api/files listing"""
+
+    def _walk(self, client, folder, **params):
+        names, cursor = [], None
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            data = client.get(f'/api/files/{folder}', query_string=query).get_json()
+            names += [item['name'] for item in data['items']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                return names, data
+
+    @pytest.mark.folder_ops
+    def test_pages(self, client, workspace):
+        """Test that the pages of a folder list each item once, in order"""
+        for i in range(7):
+            upload_test_file(client, workspace, f'file{i}.txt', b'x' * (7 - i))
+        client.post('/create_folder', data={'current_path': workspace, 'new_folder_name': 'sub'})
+
+        names, data = self._walk(client, workspace, limit=3)
+        assert names == ['sub'] + [f'file{i}.txt' for i in range(7)]
+        assert (data['total'], data['folder_count'], data['file_count']) == (8, 1, 7)
+
+        names, _ = self._walk(client, workspace, limit=2, sort='size', order='desc')
+        assert names == ['sub'] + [f'file{i}.txt' for i in range(7)]
+
+    @pytest.mark.folder_ops
+    def test_html_rows(self, client, workspace):
+        """Test that format=html also returns the rendered rows"""
+        upload_test_file(client, workspace, 'report.txt', b'report')
+        data = client.get(f'/api/files/{workspace}?format=html').get_json()
+        assert 'report.txt' in data['html']
+
+    @pytest.mark.folder_ops
+    def test_invalid_requests(self, client, workspace):
+        """Test the errors of the listing API"""
+        assert client.get(f'/api/files/{workspace}?sort=owner').status_code == 400
+        assert client.get(f'/api/files/{workspace}?order=up').status_code == 400
+        assert client.get(f'/api/files/{workspace}?limit=ten').status_code == 400
+        response = client.get(f'/api/files/{workspace}?cursor=not-a-cursor')
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Malformed cursor'
+        assert client.get(f'/api/files/{workspace}/missing').status_code == 404
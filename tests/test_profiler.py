@@ -0,0 +1,124 @@
+import marshal
+import os
+import pstats
+import time
+import pytest
+from profiler import ProfilerError, RequestProfiler
+
+
+def busy():
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        pass
+
+
+class TestRequestProfiler:
+    """Test the settings and profiles of the request profiler"""
+
+    @pytest.fixture
+    def profiler(self, tmp_path):
+        return RequestProfiler(str(tmp_path / 'profiles'), check_interval=0)
+
+    @pytest.mark.file_ops
+    def test_settings_shared(self, profiler):
+        """Test that settings changed by one process apply to the others"""
+        other = RequestProfiler(profiler.directory, check_interval=0)
+        assert other.settings()['enabled'] is False
+        profiler.update(enabled=True, sample_rate=1, path_prefix='/api/', endpoint='')
+        settings = other.settings()
+        assert (settings['enabled'], settings['sample_rate'], settings['path_prefix'], settings['endpoint']) == (
+            True, 1, '/api/', None)
+
+        assert other.should_profile('/api/files', lambda: 'api_list_files') == 'api_list_files'
+        assert other.should_profile('/files', lambda: 'files') is None
+        other.update(endpoint='files')
+        assert profiler.should_profile('/api/files', lambda: 'api_list_files') is None
+
+    @pytest.mark.file_ops
+    @pytest.mark.parametrize('changes', [
+        {'enabled': 'yes'}, {'sample_rate': 2}, {'sample_rate': True}, {'interval_ms': 0},
+        {'endpoint': 3}, {'generation': 5}, {'colour': 'red'}])
+    def test_invalid_settings(self, profiler, changes):
+        """Test that invalid settings are refused and nothing is written"""
+        with pytest.raises(ProfilerError):
+            profiler.update(**changes)
+        assert not os.path.exists(profiler.directory)
+
+    @pytest.mark.file_ops
+    def test_profiles(self, profiler):
+        """Test that a profiled call ends up in the pstats and the sampled stacks"""
+        profiler.update(enabled=True, sample_rate=1, interval_ms=1)
+        profile = profiler.begin('GET files')
+        busy()
+        profiler.end(profile)
+        assert profiler.profiled_requests == 1
+
+        stats = marshal.loads(profiler.pstats_dump())
+        assert any(function == 'busy' for _, _, function in stats)
+        stacks = profiler.collapsed_stacks()
+        assert stacks.startswith('GET files;')
+        assert 'busy (test_profiler.py:' in stacks
+
+        settings = profiler.clear()
+        assert settings['generation'] == 1
+        assert profiler.profiled_requests == 0
+        assert marshal.loads(profiler.pstats_dump()) == {}
+        assert profiler.collapsed_stacks() == ''
+
+
+class TestProfilerApi:
+    """Test the admin endpoints of the profiler"""
+
+    @pytest.fixture
+    def profiler(self):
+        from app import profiler
+        profiler.clear()
+        yield profiler
+        profiler.update(enabled=False, sample_rate=0.01, endpoint=None, path_prefix=None)
+        profiler.clear()
+
+    @pytest.mark.file_ops
+    def test_admin_only(self, login_credentials, monkeypatch):
+        """Test that only admin users or the admin token reach the profiler"""
+        from app import app
+        client = app.test_client()
+        assert client.get('/admin/profiler').status_code == 403
+        assert client.get('/admin/profiler', headers={'X-Admin-Token': ''}).status_code == 403
+
+        monkeypatch.setitem(app.config, 'ADMIN_TOKEN', 'secret-token')
+        assert client.get('/admin/profiler', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+        assert client.get('/admin/profiler', headers={'X-Admin-Token': 'secret-token'}).status_code == 200
+
+        client.post('/login', data=login_credentials)
+        assert client.get('/admin/profiler').status_code == 200
+
+    @pytest.mark.file_ops
+    def test_profile_requests(self, client, workspace, profiler, tmp_path):
+        """Test enabling the profiler, downloading its profiles and clearing them"""
+        response = client.post('/admin/profiler', json={'enabled': True, 'sample_rate': 1,
+                                                        'endpoint': 'api_list_files'})
+        assert response.get_json()['settings']['enabled'] is True
+
+        client.get(f'/api/files/{workspace}').close()
+        client.get('/healthz').close()
+        assert client.get('/admin/profiler').get_json()['profiled_requests'] == 1
+
+        response = client.get('/admin/profiler/profile.pstats')
+        assert response.mimetype == 'application/octet-stream'
+        (tmp_path / 'filely.pstats').write_bytes(response.data)
+        stats = pstats.Stats(str(tmp_path / 'filely.pstats'))
+        assert any(function == 'api_list_files' for _, _, function in stats.stats)
+        assert client.get('/admin/profiler/profile.collapsed').mimetype == 'text/plain'
+
+        data = client.delete('/admin/profiler').get_json()
+        assert data['profiled_requests'] == 0
+        assert marshal.loads(client.get('/admin/profiler/profile.pstats').data) == {}
+
+    @pytest.mark.file_ops
+    def test_invalid_settings(self, client, profiler):
+        """Test the errors of the settings endpoint"""
+        response = client.post('/admin/profiler', json={'endpoint': 'no_such_view'})
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Unknown endpoint: no_such_view'
+        assert client.post('/admin/profiler', json=[1]).status_code == 400
+        assert client.post('/admin/profiler', json={'sample_rate': -1}).status_code == 400
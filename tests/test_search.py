@@ -0,0 +1,63 @@
+import pytest
+import time
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from .test_utils import take_full_page_screenshot
+
+
+class TestSearch:
+    """Test filename search functionality"""
+
+    def _get_unique_name(self, base_name):
+        """Generate a unique name for test files/folders to avoid conflicts"""
+        import uuid
+        return f"{base_name}_{uuid.uuid4().hex[:8]}"
+
+    @pytest.mark.search
+    def test_search_finds_new_folder(self, browser, login_credentials, slow_actions):
+        """Test that a newly created folder shows up in search results"""
+        print("Testing filename search...")
+
+        # Login first
+        browser.get('http://localhost:5000/login')
+        time.sleep(slow_actions['page_load'])
+
+        browser.find_element(By.NAME, 'username').send_keys(login_credentials['username'])
+        time.sleep(slow_actions['input'])
+        browser.find_element(By.NAME, 'password').send_keys(login_credentials['password'])
+        time.sleep(slow_actions['input'])
+        browser.find_element(By.XPATH, '//button[@type="submit"]').click()
+        time.sleep(slow_actions['click'])
+
+        WebDriverWait(browser, 10).until(EC.url_contains('/files'))
+        time.sleep(slow_actions['page_load'])
+
+        # Create a folder to search for
+        browser.find_element(By.ID, 'createFolderBtn').click()
+        time.sleep(slow_actions['click'])
+
+        folder_name = self._get_unique_name('SearchTest')
+        browser.find_element(By.ID, 'newFolderName').send_keys(folder_name)
+        time.sleep(slow_actions['input'])
+        browser.find_element(By.ID, 'folderSaveBtn').click()
+        time.sleep(slow_actions['action'])
+
+        # Search for it
+        search_input = browser.find_element(By.ID, 'searchInput')
+        search_input.send_keys(folder_name)
+        time.sleep(slow_actions['action'])
+
+        result = WebDriverWait(browser, 10).until(
+            EC.visibility_of_element_located((By.XPATH, f'//a[contains(@class, "search-result") and contains(., "{folder_name}")]'))
+        )
+        assert result is not None
+
+        # Open the result
+        result.click()
+        time.sleep(slow_actions['action'])
+        assert folder_name in browser.current_url
+
+        time.sleep(2)  # Wait before taking screenshot
+        take_full_page_screenshot(browser, 'test_search_finds_new_folder')
+        print("Filename search test completed")
@@ -0,0 +1,107 @@
+import pytest
+from search_index import TrigramIndex
+from .test_utils import upload_test_file
+
+PATHS = [
+    ('reports', True),
+    ('reports/budget.xlsx', False),
+    ('reports/budget-2023.pdf', False),
+    ('reports/archive/old_budget.pdf', False),
+    ('photos/Budget.jpg', False),
+    ('notes.txt', False)
+]
+
+
+@pytest.fixture
+def index():
+    index = TrigramIndex()
+    for path, is_folder in PATHS:
+        index.add(path, is_folder)
+    return index
+
+
+def paths(result):
+    return [item['path'] for item in result[1]]
+
+
+class TestTrigramIndex:
+    """Test the in-memory trigram index of paths"""
+
+    @pytest.mark.file_ops
+    def test_ranking(self, index):
+        """Test that exact names come first, then prefixes, then shorter paths"""
+        total, results = index.search('budget')
+        assert total == 4
+        assert [item['path'] for item in results] == [
+            'photos/Budget.jpg', 'reports/budget.xlsx', 'reports/budget-2023.pdf', 'reports/archive/old_budget.pdf']
+        assert results[0] == {'path': 'photos/Budget.jpg', 'name': 'Budget.jpg', 'parent': 'photos', 'type': 'file'}
+
+    @pytest.mark.file_ops
+    def test_filters_and_pages(self, index):
+        """Test extension filters, short queries and offset/limit"""
+        assert paths(index.search('budget', extension='.PDF')) == [
+            'reports/budget-2023.pdf', 'reports/archive/old_budget.pdf']
+        assert paths(index.search('', extension='txt')) == ['notes.txt']
+        assert index.search('re')[0] == 4
+        assert index.search('rep')[1][0] == {'path': 'reports', 'name': 'reports', 'parent': '', 'type': 'folder'}
+        assert paths(index.search('budget', offset=1, limit=2)) == ['reports/budget.xlsx', 'reports/budget-2023.pdf']
+        assert index.search('nothing') == (0, [])
+
+    @pytest.mark.file_ops
+    def test_remove(self, index):
+        """Test that removed paths, alone or by folder, are no longer found"""
+        index.remove('photos/Budget.jpg')
+        assert index.search('budget')[0] == 3
+        index.remove_tree('reports')
+        assert index.search('budget') == (0, [])
+        assert len(index) == 1
+
+    @pytest.mark.file_ops
+    def test_compact(self):
+        """Test that compaction after many removals keeps the live paths only"""
+        index = TrigramIndex()
+        for i in range(3000):
+            index.add(f'folder/file{i}.txt')
+        index.remove_tree('folder')
+        index.add('folder/kept.txt')
+        assert index.dead == 0
+        assert len(index.paths) == 1
+        assert paths(index.search('file')) == []
+        assert paths(index.search('kept')) == ['folder/kept.txt']
+
+    @pytest.mark.file_ops
+    def test_sync_and_persist(self, index, tmp_path):
+        """Test that sync makes the index match a listing and save/load round trips"""
+        index.sync([('notes.txt', False), ('new/notes.md', False), ('new', True)])
+        assert sorted(paths(index.search('notes'))) == ['new/notes.md', 'notes.txt']
+        assert index.search('budget') == (0, [])
+
+        index.save(str(tmp_path / 'search.pickle'))
+        loaded = TrigramIndex.load(str(tmp_path / 'search.pickle'))
+        assert sorted(loaded.ids) == ['new', 'new/notes.md', 'notes.txt']
+        assert paths(loaded.search('notes')) == paths(index.search('notes'))
+        assert TrigramIndex.load(str(tmp_path / 'missing.pickle')) is None
+
+
+class TestSearchApi:
+    """Test the filename search API"""
+
+    @pytest.mark.file_ops
+    def test_search_api(self, client, workspace):
+        """Test that uploaded files are found, filtered and paginated"""
+        for name in ('invoice_march.pdf', 'invoice_april.pdf', 'invoice_notes.txt'):
+            upload_test_file(client, workspace, name, b'data')
+
+        data = client.get(f'/api/search?q={workspace}/invoice').get_json()
+        assert data['total'] == 3
+        data = client.get(f'/api/search?q={workspace}/invoice&ext=pdf&limit=1').get_json()
+        assert data['total'] == 2
+        assert len(data['results']) == 1
+        assert data['next_offset'] == 1
+        assert data['results'][0]['parent'] == workspace
+
+    @pytest.mark.file_ops
+    def test_invalid_queries(self, client):
+        """Test the errors of the search API"""
+        assert client.get('/api/search').status_code == 400
+        assert client.get('/api/search?q=abc&offset=x').status_code == 400
@@ -0,0 +1,95 @@
+import os
+import runpy
+import pytest
+
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+class TestGunicornConfig:
+    """Test the production server settings"""
+
+    @pytest.mark.smoke
+    def test_settings(self, monkeypatch):
+        """Test that workers, threads and binding come from the environment"""
+        monkeypatch.setenv('FILELY_WORKERS', '3')
+        monkeypatch.setenv('FILELY_THREADS', '4')
+        monkeypatch.setenv('FILELY_BIND', '127.0.0.1:8000')
+        config = runpy.run_path(GUNICORN_CONF)
+        assert (config['workers'], config['threads'], config['bind']) == (3, 4, '127.0.0.1:8000')
+        assert config['worker_class'] == 'gthread'
+        assert config['preload_app'] is False
+
+    @pytest.mark.smoke
+    def test_server_id(self, monkeypatch):
+        """Test that each server start gets a new name for its workers"""
+        monkeypatch.delenv('FILELY_SERVER_ID', raising=False)
+        config = runpy.run_path(GUNICORN_CONF)
+        config['on_starting'](None)
+        first = os.environ['FILELY_SERVER_ID']
+        config['on_starting'](None)
+        assert os.environ['FILELY_SERVER_ID'] != first
+
+
+class TestStartup:
+    """Test reconciling the indexes once per server start"""
+
+    @pytest.fixture
+    def reconciles(self, monkeypatch):
+        """Count reconciles, keeping the server's marker as it was"""
+        import app
+        marker_path = os.path.join(app.STATE_DIR, 'reconciled')
+        with open(marker_path) as f:
+            marker = f.read()
+        calls = []
+        monkeypatch.setattr(app.metadata_index, 'reconcile', lambda: calls.append(1))
+        monkeypatch.setattr(app.fulltext_index, 'sync', lambda files: None)
+        yield calls
+        with open(marker_path, 'w') as f:
+            f.write(marker)
+
+    @pytest.mark.smoke
+    def test_once_per_server_id(self, reconciles, monkeypatch):
+        """Test that workers of one server start reconcile once, a new start again"""
+        from app import reconcile_on_startup
+        monkeypatch.setenv('FILELY_SERVER_ID', 'server-one')
+        reconcile_on_startup()
+        reconcile_on_startup()
+        assert len(reconciles) == 1
+
+        monkeypatch.setenv('FILELY_SERVER_ID', 'server-two')
+        reconcile_on_startup()
+        assert len(reconciles) == 2
+
+    @pytest.mark.smoke
+    def test_unnamed_server(self, reconciles, monkeypatch):
+        """Test that without a server name each process start reconciles"""
+        from app import reconcile_on_startup
+        monkeypatch.delenv('FILELY_SERVER_ID', raising=False)
+        reconcile_on_startup()
+        reconcile_on_startup()
+        assert len(reconciles) == 2
+
+
+class TestHealth:
+    """Test the liveness and readiness endpoints"""
+
+    @pytest.mark.smoke
+    def test_healthz(self, client):
+        """Test that liveness answers with the worker's pid"""
+        response = client.get('/healthz')
+        assert response.status_code == 200
+        assert response.get_json() == {'status': 'ok', 'pid': os.getpid()}
+
+    @pytest.mark.smoke
+    def test_readyz(self, client, monkeypatch):
+        """Test that readiness waits for the warm-up"""
+        import app
+        monkeypatch.setattr(app, 'worker_ready', False)
+        response = client.get('/readyz')
+        assert response.status_code == 503
+        assert response.get_json()['checks'] == {'warmed_up': False, 'uploads': True, 'metadata_index': True}
+
+        app.warm_up()
+        response = client.get('/readyz')
+        assert response.status_code == 200
+        assert response.get_json()['ready'] is True
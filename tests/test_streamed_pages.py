@@ -0,0 +1,89 @@
+import re
+import pytest
+from listing import ChunkedRows, decode_cursor, sort_key
+from .test_utils import upload_test_file
+
+
+class TestChunkedRows:
+    """Test reading the rows of a page chunk by chunk"""
+
+    @pytest.fixture
+    def items(self):
+        return [{'name': f'file{i:02}.txt', 'type': 'file', 'size': i, 'mtime': i} for i in range(10)]
+
+    def _rows(self, items, calls, **kwargs):
+        def fetch(after, limit):
+            calls.append((after, limit))
+            remaining = [item for item in items if after is None or sort_key(item) > after]
+            return remaining[:limit]
+        return ChunkedRows(fetch, **kwargs)
+
+    @pytest.mark.folder_ops
+    def test_chunks(self, items):
+        """Test that rows come in chunks up to the limit, then a cursor to the rest"""
+        calls = []
+        rows = self._rows(items, calls, limit=7, chunk_size=3)
+        chunks = list(rows)
+        assert [[item['name'] for item in chunk] for chunk in chunks] == [
+            ['file00.txt', 'file01.txt', 'file02.txt'],
+            ['file03.txt', 'file04.txt', 'file05.txt'],
+            ['file06.txt']]
+        assert [limit for _, limit in calls] == [4, 4, 2]
+        assert decode_cursor(rows.next_cursor) == sort_key(items[6])
+
+    @pytest.mark.folder_ops
+    def test_last_page(self, items):
+        """Test that a page reaching the end of the listing has no cursor"""
+        calls = []
+        rows = self._rows(items, calls, limit=20, chunk_size=4)
+        assert sum(len(chunk) for chunk in rows) == 10
+        assert rows.next_cursor is None
+        assert len(calls) == 3
+
+        rows = self._rows(items, [], limit=10, chunk_size=5)
+        assert sum(len(chunk) for chunk in rows) == 10
+        assert rows.next_cursor is None
+        assert list(self._rows([], [], limit=5)) == []
+
+
+class TestStreamedPage:
+    """Test folder pages sent while their rows are rendered"""
+
+    @pytest.mark.folder_ops
+    def test_page_sent_in_pieces(self, client, workspace, monkeypatch):
+        """Test that the head and each chunk of rows are sent separately"""
+        from app import app
+        monkeypatch.setitem(app.config, 'STREAMED_LISTING_CHUNK_SIZE', 2)
+        for i in range(5):
+            upload_test_file(client, workspace, f'file{i}.txt', b'x')
+
+        response = client.get(f'/files/{workspace}')
+        assert response.status_code == 200
+        assert response.is_streamed
+        pieces = [piece for piece in response.response if piece]
+        assert len(pieces) >= 4
+        assert 'item-row' not in pieces[0].decode()
+        html = b''.join(pieces).decode()
+        assert [f'file{i}.txt' for i in range(5)] == re.findall(r'value="[^"]*/(file\d\.txt)"', html)
+
+    @pytest.mark.folder_ops
+    def test_page_limit(self, client, workspace, monkeypatch):
+        """Test that a streamed page stops at its size and links the next rows"""
+        from app import app
+        monkeypatch.setitem(app.config, 'STREAMED_LISTING_PAGE_SIZE', 3)
+        for i in range(5):
+            upload_test_file(client, workspace, f'file{i}.txt', b'x')
+
+        html = client.get(f'/files/{workspace}').get_data(as_text=True)
+        assert 'file2.txt' in html and 'file3.txt' not in html
+        cursor = re.search(r'data-next-cursor="([^"]*)"', html).group(1)
+        data = client.get(f'/api/files/{workspace}', query_string={'cursor': cursor}).get_json()
+        assert [item['name'] for item in data['items']] == ['file3.txt', 'file4.txt']
+
+    @pytest.mark.folder_ops
+    def test_flashed_messages(self, client, workspace):
+        """Test that messages flashed before a streamed page are shown once"""
+        response = client.get(f'/delete_item/{workspace}/missing.txt')
+        assert response.status_code == 302
+        assert 'Item not found!' in client.get(f'/files/{workspace}').get_data(as_text=True)
+        assert 'Item not found!' not in client.get(f'/files/{workspace}').get_data(as_text=True)
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import pytest
+from .test_utils import upload_test_file
+
+CONTENT = os.urandom(1024 * 1024 + 17)
+
+
+class TestStreamingUploads:
+    """Test form uploads written straight to disk while they are parsed"""
+
+    @pytest.fixture
+    def incoming(self):
+        from app import app
+        directory = app.config['STREAMING_UPLOAD_DIR']
+        before = set(os.listdir(directory)) if os.path.isdir(directory) else set()
+        yield directory
+        assert set(os.listdir(directory)) <= before, 'a streamed part was left behind'
+
+    def _stats(self, client):
+        return client.get('/api/uploads/stats').get_json()
+
+    @pytest.mark.file_ops
+    def test_streamed_upload(self, client, workspace, incoming):
+        """Test that a streamed upload is written once and hashed on the way"""
+        from app import metadata_index
+        before = self._stats(client)
+        assert before['streaming'] is True
+
+        upload_test_file(client, workspace, 'large.zip', CONTENT)
+        with open(os.path.join('uploads', workspace, 'large.zip'), 'rb') as f:
+            assert f.read() == CONTENT
+
+        after = self._stats(client)
+        assert after['files'] == before['files'] + 1
+        assert after['bytes_received'] - before['bytes_received'] == len(CONTENT)
+        assert after['bytes_written'] - before['bytes_written'] == len(CONTENT)
+        row = metadata_index.get(f'{workspace}/large.zip')
+        assert row['content_hash'] == hashlib.sha256(CONTENT).hexdigest()
+
+    @pytest.mark.file_ops
+    def test_refused_part_removed(self, client, workspace, incoming):
+        """Test that a part that is not saved does not stay in the incoming folder"""
+        response = upload_test_file(client, workspace, 'program.exe', CONTENT)
+        assert response.status_code == 302
+        assert not os.path.exists(os.path.join('uploads', workspace, 'program.exe'))
+
+    @pytest.mark.file_ops
+    def test_spooled_upload(self, client, workspace, monkeypatch):
+        """Test that without streaming a large part is written twice"""
+        from app import app
+        monkeypatch.setitem(app.config, 'STREAMING_UPLOADS', False)
+        before = self._stats(client)
+
+        upload_test_file(client, workspace, 'large.zip', CONTENT)
+        with open(os.path.join('uploads', workspace, 'large.zip'), 'rb') as f:
+            assert f.read() == CONTENT
+
+        after = self._stats(client)
+        assert after['streaming'] is False
+        assert after['bytes_written'] - before['bytes_written'] == 2 * len(CONTENT)
@@ -0,0 +1,65 @@
+import os
+import pytest
+from .test_utils import upload_test_file
+
+LINES = [f'line {number}' for number in range(10)]
+
+
+class TestTextViewer:
+    """Test the text viewer page and its lines API"""
+
+    @pytest.fixture
+    def text_path(self, client, workspace):
+        upload_test_file(client, workspace, 'lines.txt', '\n'.join(LINES).encode() + b'\n')
+        return f'{workspace}/lines.txt'
+
+    @pytest.mark.preview
+    def test_viewer_page(self, client, text_path):
+        """Test that the viewer page opens for a text file"""
+        response = client.get(f'/view/{text_path}')
+        assert response.status_code == 200
+        assert b'viewerLines' in response.get_data()
+
+    @pytest.mark.preview
+    def test_read_lines(self, client, text_path):
+        """Test reading windows of lines from the start, the middle and the end"""
+        text = client.get(f'/api/text/{text_path}').get_json()
+        assert text['line_count'] == 10
+        assert text['start'] == 0
+        assert text['lines'] == LINES
+
+        text = client.get(f'/api/text/{text_path}?start=4&limit=3').get_json()
+        assert text['start'] == 4
+        assert text['lines'] == LINES[4:7]
+
+        text = client.get(f'/api/text/{text_path}?tail&limit=2').get_json()
+        assert text['start'] == 8
+        assert text['lines'] == LINES[8:]
+
+    @pytest.mark.preview
+    def test_invalid_requests(self, client, workspace, text_path):
+        """Test the errors of the lines API and the viewer page"""
+        assert client.get(f'/api/text/{text_path}?start=abc').status_code == 400
+        assert client.get(f'/api/text/{workspace}/missing.txt').status_code == 404
+        assert client.get(f'/api/text/{workspace}').status_code == 404
+        assert client.get(f'/view/{workspace}/missing.txt').status_code == 302
+
+    @pytest.mark.preview
+    @pytest.mark.parametrize('file_path', ['../app.py', '..%2Fapp.py', 'articles/../../app.py',
+                                           '.filely/metadata.sqlite3'])
+    def test_files_outside_uploads(self, client, file_path):
+        """Test that files outside uploads or internal state are never shown"""
+        response = client.get(f'/api/text/{file_path}')
+        assert response.status_code == 404
+        assert b'import' not in response.get_data()
+        assert client.get(f'/view/{file_path}').status_code == 302
+
+    @pytest.mark.preview
+    def test_file_through_symlink(self, client, workspace, tmp_path):
+        """Test that a symlink leading out of uploads is not followed"""
+        (tmp_path / 'secret.txt').write_bytes(b'secret\n')
+        os.symlink(tmp_path / 'secret.txt', os.path.join('uploads', workspace, 'secret.txt'))
+
+        response = client.get(f'/api/text/{workspace}/secret.txt')
+        assert response.status_code == 404
+        assert 'lines' not in response.get_json()
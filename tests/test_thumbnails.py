@@ -0,0 +1,51 @@
+import io
+import os
+import time
+import pytest
+from .test_utils import upload_test_file
+
+
+def png_bytes(size=(64, 48)):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TestThumbnails:
+    """Test the thumbnails of uploaded images"""
+
+    @pytest.fixture(autouse=True)
+    def pillow(self):
+        pytest.importorskip('PIL')
+
+    @pytest.mark.preview
+    def test_thumbnail_of_upload(self, client, workspace):
+        """Test that an uploaded image gets a thumbnail queued, then served"""
+        from app import thumbnail_cache
+        upload_test_file(client, workspace, 'photo.png', png_bytes())
+        source_path = os.path.join('uploads', workspace, 'photo.png')
+        cache_path = thumbnail_cache.cache_path(thumbnail_cache.key(source_path, os.stat(source_path)))
+        for _ in range(100):
+            if os.path.exists(cache_path):
+                break
+            time.sleep(0.1)
+        assert os.path.exists(cache_path)
+
+        response = client.get(f'/thumbnail/{workspace}/photo.png')
+        assert response.status_code == 200
+        assert response.mimetype == 'image/jpeg'
+        assert response.get_data()[:2] == b'\xff\xd8'
+        response.close()
+
+    @pytest.mark.preview
+    def test_file_removed_before_rendering(self, client, workspace):
+        """Test that a file gone before its thumbnail is rendered is skipped"""
+        from app import thumbnail_cache
+        source_path = os.path.join('uploads', workspace, 'gone.png')
+        assert thumbnail_cache.generate(source_path) is None
+        thumbnail_cache.enqueue(source_path)
+
+        upload_test_file(client, workspace, 'photo.png', png_bytes())
+        assert client.get(f'/thumbnail/{workspace}/photo.png').status_code == 200
+        assert client.get(f'/thumbnail/{workspace}/gone.png').status_code == 404
@@ -0,0 +1,167 @@
+import os
+import time
+import pytest
+from .test_utils import upload_test_file
+
+
+class TestTransfers:
+    """Test copying and moving items with the transfer API"""
+
+    def _names(self, client, folder):
+        return sorted(item['name'] for item in client.get(f'/api/files/{folder}').get_json()['items'])
+
+    def _read(self, *parts):
+        with open(os.path.join('uploads', *parts), 'rb') as f:
+            return f.read()
+
+    @pytest.mark.file_ops
+    def test_copy_file(self, client, workspace):
+        """Test that a copy is made and its transfer reported"""
+        upload_test_file(client, workspace, 'a.txt', b'hello')
+        upload_test_file(client, f'{workspace}/target', 'other.txt', b'x')
+
+        response = client.post('/api/copy', json={'path': f'{workspace}/a.txt', 'destination': f'{workspace}/target'})
+        assert response.status_code == 201
+        transfer = response.get_json()
+        assert transfer['status'] == 'done'
+        assert transfer['source'] == f'{workspace}/a.txt'
+        assert transfer['target'] == f'{workspace}/target/a.txt'
+        assert transfer['copied_bytes'] == 5
+
+        status = client.get(transfer['url']).get_json()
+        assert status['id'] == transfer['id']
+        assert status['status'] == 'done'
+        assert self._read(workspace, 'a.txt') == self._read(workspace, 'target', 'a.txt') == b'hello'
+        assert self._names(client, f'{workspace}/target') == ['a.txt', 'other.txt']
+
+    @pytest.mark.folder_ops
+    def test_copy_folder_with_new_name(self, client, workspace):
+        """Test that a folder is copied with its content under a new name"""
+        upload_test_file(client, f'{workspace}/src/sub', 'deep.txt', b'deep')
+
+        response = client.post('/api/copy', json={'path': f'{workspace}/src', 'destination': workspace,
+                                                  'name': 'copy'})
+        assert response.status_code == 201
+        assert response.get_json()['total_files'] == 1
+        assert self._read(workspace, 'copy', 'sub', 'deep.txt') == b'deep'
+        assert self._names(client, workspace) == ['copy', 'src']
+
+    @pytest.mark.file_ops
+    def test_move_file(self, client, workspace):
+        """Test that a move on the same device is a rename"""
+        upload_test_file(client, workspace, 'a.txt', b'hello')
+        upload_test_file(client, f'{workspace}/target', 'other.txt', b'x')
+
+        response = client.post('/api/move', json={'path': f'{workspace}/a.txt', 'destination': f'{workspace}/target'})
+        assert response.status_code == 201
+        transfer = response.get_json()
+        assert transfer['status'] == 'done'
+        assert transfer['methods'] == {'rename': 1}
+        assert self._names(client, workspace) == ['target']
+        assert self._names(client, f'{workspace}/target') == ['a.txt', 'other.txt']
+
+    @pytest.mark.file_ops
+    def test_background_copy(self, client, workspace, monkeypatch):
+        """Test that a large copy continues in the background and reports its progress"""
+        from app import app
+        monkeypatch.setitem(app.config, 'TRANSFER_SYNC_MAX_BYTES', 0)
+        upload_test_file(client, workspace, 'a.txt', b'hello')
+
+        response = client.post('/api/copy', json={'path': f'{workspace}/a.txt', 'destination': workspace,
+                                                  'name': 'b.txt'})
+        assert response.status_code == 202
+        url = response.get_json()['url']
+        for _ in range(50):
+            status = client.get(url).get_json()
+            if status['status'] != 'running':
+                break
+            time.sleep(0.1)
+        assert status['status'] == 'done'
+        assert status['copied_bytes'] == status['total_bytes'] == 5
+        assert self._read(workspace, 'b.txt') == b'hello'
+
+    @pytest.mark.folder_ops
+    def test_unindexed_folder(self, client, workspace, monkeypatch):
+        """Test that a folder unknown to the index is counted, and copied in the background when large"""
+        from app import app
+        monkeypatch.setitem(app.config, 'TRANSFER_SYNC_MAX_FILES', 2)
+        for name, count in (('small', 2), ('large', 3)):
+            os.makedirs(os.path.join('uploads', workspace, name))
+            for i in range(count):
+                with open(os.path.join('uploads', workspace, name, f'f{i}.txt'), 'wb') as f:
+                    f.write(b'12345')
+
+        response = client.post('/api/copy', json={'path': f'{workspace}/small', 'destination': workspace,
+                                                  'name': 'small_copy'})
+        assert response.status_code == 201
+        assert response.get_json()['total_bytes'] == 10
+        assert response.get_json()['total_files'] == 2
+
+        response = client.post('/api/copy', json={'path': f'{workspace}/large', 'destination': workspace,
+                                                  'name': 'large_copy'})
+        assert response.status_code == 202
+        assert response.get_json()['total_files'] is None
+        url = response.get_json()['url']
+        for _ in range(50):
+            status = client.get(url).get_json()
+            if status['status'] != 'running':
+                break
+            time.sleep(0.1)
+        assert status['status'] == 'done'
+        assert status['copied_files'] == 3
+        assert sorted(os.listdir(os.path.join('uploads', workspace, 'large_copy'))) == ['f0.txt', 'f1.txt', 'f2.txt']
+
+    @pytest.mark.file_ops
+    def test_transfer_errors(self, client, workspace):
+        """Test the errors of copies and moves"""
+        upload_test_file(client, workspace, 'a.txt', b'hello')
+        upload_test_file(client, f'{workspace}/target', 'a.txt', b'other')
+
+        def status(kind, **body):
+            return client.post(f'/api/{kind}', json=body).status_code
+
+        assert status('copy', path=f'{workspace}/a.txt', destination=f'{workspace}/target') == 409
+        assert status('move', path=f'{workspace}/a.txt', destination=f'{workspace}/target') == 409
+        assert status('copy', path=f'{workspace}/missing.txt', destination=workspace) == 404
+        assert status('copy', path=f'{workspace}/a.txt', destination=f'{workspace}/missing') == 404
+        assert status('move', path=f'{workspace}/target', destination=f'{workspace}/target') == 400
+        assert status('copy', path=f'{workspace}/a.txt', destination=workspace, name='../') == 400
+        assert self._read(workspace, 'target', 'a.txt') == b'other'
+
+    @pytest.mark.file_ops
+    @pytest.mark.parametrize('body', [
+        {'path': '../requirements.txt', 'destination': ''},
+        {'path': 'articles', 'destination': '..'},
+        {'path': 'articles', 'destination': '.filely'},
+        {'path': '.filely', 'destination': ''},
+    ])
+    def test_transfer_outside_uploads(self, client, body):
+        """Test that nothing is copied from or to outside uploads or internal state"""
+        response = client.post('/api/copy', json=body)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Invalid path!'
+        assert not os.path.exists('articles')
+
+    @pytest.mark.file_ops
+    @pytest.mark.parametrize('transfer_id', ['0' * 32, 'not-a-transfer'])
+    def test_unknown_transfer(self, client, transfer_id):
+        """Test that the status of an unknown transfer gets 404"""
+        assert client.get(f'/api/transfers/{transfer_id}').status_code == 404
+
+    @pytest.mark.file_ops
+    @pytest.mark.parametrize('kind', ['move', 'copy'])
+    def test_target_created_meanwhile(self, tmp_path, kind):
+        """Test that a transfer never replaces a target created after it started"""
+        from transfers import TransferStore
+
+        (tmp_path / 'source.txt').write_bytes(b'source')
+        store = TransferStore(str(tmp_path / 'store'))
+        transfer = store.create(kind, str(tmp_path / 'source.txt'), str(tmp_path / 'target.txt'), 6, 1)
+        (tmp_path / 'target.txt').write_bytes(b'target')
+
+        transfer = store.run(transfer)
+        assert transfer['status'] == 'failed'
+        assert transfer['error'] == 'An item with that name already exists!'
+        assert (tmp_path / 'source.txt').read_bytes() == b'source'
+        assert (tmp_path / 'target.txt').read_bytes() == b'target'
+        assert sorted(os.listdir(tmp_path / 'store')) == [f"{transfer['id']}.json"]
@@ -0,0 +1,80 @@
+import os
+import pytest
+from .test_utils import upload_test_file
+
+
+class TestTrash:
+    """Test the trash API: deleted items can be listed and restored"""
+
+    def _trashed(self, client, original_path):
+        """Return the trash entry of the item deleted from original_path"""
+        items = client.get('/api/trash').get_json()['items']
+        return [item for item in items if item['original_path'] == original_path][-1]
+
+    def _names(self, client, folder):
+        return [item['name'] for item in client.get(f'/api/files/{folder}').get_json()['items']]
+
+    @pytest.mark.file_ops
+    def test_deleted_item_is_listed(self, client, workspace):
+        """Test that a deleted file waits in the trash"""
+        upload_test_file(client, workspace, 'note.txt', b'note')
+        client.get(f'/delete_item/{workspace}/note.txt')
+
+        assert not os.path.exists(os.path.join('uploads', workspace, 'note.txt'))
+        item = self._trashed(client, f'{workspace}/note.txt')
+        assert item['name'] == 'note.txt'
+        assert item['is_dir'] is False
+        assert item['size'] == 4
+        assert item['purge_after'] > item['deleted_at']
+        assert item['status'] == 'pending'
+        assert 'retention' in client.get('/api/trash').get_json()
+
+    @pytest.mark.file_ops
+    def test_restore(self, client, workspace):
+        """Test that a restored file is back in its folder and listing"""
+        upload_test_file(client, workspace, 'note.txt', b'note')
+        client.get(f'/delete_item/{workspace}/note.txt')
+        assert 'note.txt' not in self._names(client, workspace)
+
+        item = self._trashed(client, f'{workspace}/note.txt')
+        response = client.post(f"/api/trash/{item['id']}/restore")
+        assert response.status_code == 200
+        assert response.get_json() == {'path': f'{workspace}/note.txt', 'restored': True}
+
+        assert 'note.txt' in self._names(client, workspace)
+        response = client.get(f'/download/{workspace}/note.txt')
+        assert response.get_data() == b'note'
+        response.close()
+        assert item['id'] not in [entry['id'] for entry in client.get('/api/trash').get_json()['items']]
+
+    @pytest.mark.folder_ops
+    def test_restore_into_deleted_folder(self, client, workspace):
+        """Test that restoring recreates the folders the item was in"""
+        upload_test_file(client, f'{workspace}/sub', 'note.txt', b'note')
+        client.get(f'/delete_item/{workspace}/sub/note.txt')
+        client.get(f'/delete_item/{workspace}/sub')
+
+        item = self._trashed(client, f'{workspace}/sub/note.txt')
+        assert client.post(f"/api/trash/{item['id']}/restore").status_code == 200
+        assert 'sub' in self._names(client, workspace)
+        assert 'note.txt' in self._names(client, f'{workspace}/sub')
+
+    @pytest.mark.file_ops
+    def test_restore_over_existing_item(self, client, workspace):
+        """Test that restoring never replaces an item of the same name"""
+        upload_test_file(client, workspace, 'note.txt', b'old')
+        client.get(f'/delete_item/{workspace}/note.txt')
+        upload_test_file(client, workspace, 'note.txt', b'new')
+
+        item = self._trashed(client, f'{workspace}/note.txt')
+        response = client.post(f"/api/trash/{item['id']}/restore")
+        assert response.status_code == 409
+        with open(os.path.join('uploads', workspace, 'note.txt'), 'rb') as f:
+            assert f.read() == b'new'
+
+    @pytest.mark.file_ops
+    @pytest.mark.parametrize('item_id', ['0123456789abcdef', 'not-an-id', '..'])
+    def test_restore_unknown_item(self, client, item_id):
+        """Test that restoring an item missing from the trash gets 404"""
+        response = client.post(f'/api/trash/{item_id}/restore')
+        assert response.status_code == 404
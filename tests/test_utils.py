@@ -137,3 +137,9 @@ def _take_full_page_screenshot_manual(driver, screenshot_path, test_name):
 
 def get_test_file_path(filename):
     return os.path.join('test_data', filename)
+
+
+def upload_test_file(client, folder, filename, content):
+    """Upload content as filename into folder through the upload form of /files"""
+    return client.post(f'/files/{folder}', data={'files': (io.BytesIO(content), filename)},
+                       content_type='multipart/form-data')
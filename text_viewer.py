@@ -0,0 +1,146 @@
+import codecs
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+import fsops
+
+BLOCK_SIZE = 64 * 1024  # bytes per entry of a line index, bounds the scan for a line
+# Byte order marks, longest first so UTF-32 is not taken for UTF-16
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be')
+)
+
+
+def detect_encoding(block):
+    """Return (encoding, BOM length) of a file from its first block
+
+    A byte order mark decides, otherwise the block is UTF-8 if it decodes
+    as such (a sequence cut at the end of the block is fine) and Latin-1,
+    which decodes anything, if it does not.
+    """
+    for bom, encoding in BOMS:
+        if block.startswith(bom):
+            return encoding, len(bom)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(block, final=False)
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        return 'latin-1', 0
+
+
+class LineIndex:
+    """Sparse line index of a text file
+
+    Rather than the offset of every line, it keeps the number of newlines
+    before each BLOCK_SIZE block of the file: a few bytes per 64KB. Finding
+    where a line starts is a binary search for its block plus a scan of
+    that block, so any window of lines, the tail included, is read in time
+    independent of the file size.
+
+    Newlines of UTF-16 and UTF-32 files are counted as their encoded byte
+    sequence, which can in rare cases match across two characters.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with fsops.open(path, 'rb') as f:
+            self.encoding, self.data_start = detect_encoding(f.read(BLOCK_SIZE))
+            self.newline = '\n'.encode(self.encoding)
+            self.size = os.fstat(f.fileno()).st_size
+            # counts[i] is the number of newlines before byte i * BLOCK_SIZE
+            self.counts = array('Q', [0])
+            ends_with_newline = False
+            if self.size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    total = 0
+                    for start in range(0, self.size, BLOCK_SIZE):
+                        total += mm[start:start + BLOCK_SIZE].count(self.newline)
+                        self.counts.append(total)
+                    ends_with_newline = mm[-len(self.newline):] == self.newline
+        self.line_count = self.counts[-1]
+        if self.size > self.data_start and not ends_with_newline:
+            self.line_count += 1  # a last line without newline
+
+    def _line_start(self, mm, line):
+        """Byte offset where line (0-based) starts"""
+        if line == 0:
+            return self.data_start
+        # The block holding the newline that ends the line before
+        block = bisect_left(self.counts, line) - 1
+        position = block * BLOCK_SIZE
+        for _ in range(line - self.counts[block]):
+            newline_at = mm.find(self.newline, position)
+            if newline_at == -1:
+                return len(mm)  # the file was cut since it was indexed
+            position = newline_at + len(self.newline)
+        return position
+
+    def read(self, start, count, max_line_bytes=16384):
+        """Return up to count lines from line start on, decoded
+
+        Lines longer than max_line_bytes are cut, the second element of the
+        result lists their numbers.
+        """
+        lines = []
+        truncated = []
+        end = min(start + count, self.line_count)
+        if start >= end:
+            return lines, truncated
+        with fsops.open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = min(len(mm), self.size)  # the file may have changed since it was indexed
+            position = self._line_start(mm, start)
+            for line in range(start, end):
+                newline_at = mm.find(self.newline, position, min(position + max_line_bytes + len(self.newline), size))
+                if newline_at == -1:
+                    line_end = min(position + max_line_bytes, size)
+                    if line_end < size:
+                        truncated.append(line)
+                    lines.append(mm[position:line_end].decode(self.encoding, errors='replace'))
+                    if line + 1 < end:
+                        position = self._line_start(mm, line + 1)
+                else:
+                    lines.append(mm[position:newline_at].decode(self.encoding, errors='replace').rstrip('\r'))
+                    position = newline_at + len(self.newline)
+        return lines, truncated
+
+
+class LineIndexCache:
+    """Bounded LRU of line indexes keyed by file path
+
+    An entry is valid while the file keeps its inode, size and mtime.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def validator(stat_result):
+        return (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+
+    def get(self, path):
+        """Return the line index of path, building it if needed"""
+        key = os.path.normpath(path)
+        validator = self.validator(fsops.stat(path))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == validator:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        index = LineIndex(path)
+        with self._lock:
+            self._entries[key] = (validator, index)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
@@ -0,0 +1,216 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails are disabled without Pillow
+    Image = None
+
+THUMBNAIL_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+THUMBNAIL_SUFFIX = '.jpg'
+
+
+def render_thumbnail(source_path, target_path, max_size):
+    """Write a JPEG thumbnail of source_path fitting max_size, runs in a pool process"""
+    with Image.open(source_path) as image:
+        image.draft('RGB', (max_size, max_size))  # JPEG: decode at reduced scale
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        temp_path = f'{target_path}.{os.getpid()}.tmp'
+        image.save(temp_path, 'JPEG', quality=80, optimize=True)
+    os.replace(temp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+class ThumbnailCache:
+    """Thumbnails of uploaded images, rendered by a process pool
+
+    Thumbnails are stored under directory as <ab>/<key>.jpg, where the key
+    hashes the file's path, mtime and size, so a changed or renamed file
+    gets a new thumbnail and stale ones simply stop being used. Their mtime
+    is bumped on use and the least recently used ones are evicted once the
+    cache grows past max_bytes.
+
+    The pool is created on first use with the spawn start method, which is
+    safe in a multithreaded server. Thumbnails of new uploads are queued
+    with enqueue() and submitted by a background thread, so the request
+    that created the file does not wait on it.
+    """
+
+    def __init__(self, directory, max_bytes, max_size=256, workers=2):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = {}
+        self._total_bytes = None
+        self._queue = queue.Queue()
+        self._queue_pid = None
+
+    @property
+    def available(self):
+        return Image is not None
+
+    @staticmethod
+    def supports(filename):
+        return '.' in filename and filename.rsplit('.', 1)[1].lower() in THUMBNAIL_EXTENSIONS
+
+    def key(self, path, stat):
+        """Cache key of a file from its path and stat result"""
+        return hashlib.sha1(f'{path}\0{stat.st_mtime_ns}\0{stat.st_size}'.encode()).hexdigest()
+
+    def cache_path(self, key):
+        return os.path.join(self.directory, key[:2], key + THUMBNAIL_SUFFIX)
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _submit(self, source_path, key):
+        """Start rendering key unless it is already in progress, returns its future"""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            target_path = self.cache_path(key)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            try:
+                future = self._get_pool().submit(render_thumbnail, source_path, target_path, self.max_size)
+            except BrokenProcessPool:
+                # A worker died (e.g. on a corrupt image), start a fresh pool
+                self._pool.shutdown(wait=False)
+                self._pool = None
+                future = self._get_pool().submit(render_thumbnail, source_path, target_path, self.max_size)
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._finished(key, f))
+        return future
+
+    def _finished(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+        if future.exception() is None:
+            self._add_bytes(future.result())
+
+    def enqueue(self, source_path):
+        """Have generate() called for source_path by this process's queue thread"""
+        if not self.available or not self.supports(source_path):
+            return
+        if self._queue_pid != os.getpid():
+            with self._lock:
+                if self._queue_pid != os.getpid():
+                    self._queue = queue.Queue()
+                    threading.Thread(target=self._run_queue, name='thumbnail-queue', daemon=True).start()
+                    self._queue_pid = os.getpid()
+        self._queue.put(source_path)
+
+    def _run_queue(self):
+        while True:
+            source_path = self._queue.get()
+            try:
+                self.generate(source_path)
+            except Exception:
+                pass  # rendered on demand by get() then
+
+    def generate(self, source_path):
+        """Render the thumbnail of source_path in the background if missing
+
+        Returns the future of the rendering, None if there is nothing to
+        render or the file is gone.
+        """
+        if not self.available or not self.supports(source_path):
+            return None
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return None
+        key = self.key(source_path, stat)
+        if os.path.exists(self.cache_path(key)):
+            return None
+        return self._submit(source_path, key)
+
+    def get(self, source_path, timeout=30):
+        """Return (thumbnail path, key) for source_path, rendering it if needed
+
+        Returns None when the image cannot be thumbnailed.
+        """
+        stat = os.stat(source_path)
+        key = self.key(source_path, stat)
+        path = self.cache_path(key)
+        try:
+            os.utime(path)
+            return path, key
+        except FileNotFoundError:
+            pass
+        try:
+            self._submit(source_path, key).result(timeout)
+        except Exception:
+            return None
+        return path, key
+
+    def _add_bytes(self, size):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._total_bytes += size
+            if self._total_bytes <= self.max_bytes:
+                return
+        self.evict()
+
+    def _scan(self):
+        """Yield (path, size, mtime) of every cached thumbnail"""
+        try:
+            buckets = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for bucket in buckets:
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(THUMBNAIL_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def evict(self):
+        """Delete least recently used thumbnails until the cache is at 90% of max_bytes"""
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._total_bytes = total
+
+    def stats(self):
+        entries = list(self._scan())
+        return {
+            'available': self.available,
+            'thumbnails': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'pending': len(self._pending)
+        }
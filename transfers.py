@@ -0,0 +1,302 @@
+import ctypes
+import errno
+import json
+import os
+import re
+import secrets
+import shutil
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+TRANSFER_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+COPY_CHUNK_SIZE = 16 * 1024 * 1024  # bytes per copy_file_range/sendfile call, progress is reported in between
+# Errors meaning a copy method is not available for this pair of files
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF}
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1  # from linux/fs.h
+
+try:
+    _renameat2 = ctypes.CDLL(None, use_errno=True).renameat2  # glibc 2.28+
+except (OSError, AttributeError, TypeError):
+    _renameat2 = None
+
+
+class TransferError(Exception):
+    """A copy or move that cannot be carried out"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _clone(src_fd, dst_fd):
+    """Share the source's blocks with a reflink (btrfs, XFS, ...), True if done"""
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRNOS:
+            return False
+        raise
+
+
+def rename_noreplace(src, dst):
+    """Rename src to dst, raising FileExistsError rather than replacing dst
+
+    Atomic with renameat2(RENAME_NOREPLACE) on Linux. Elsewhere a file is
+    hard linked to dst and then unlinked, which fails just as atomically
+    when dst exists; a folder, or a file on a filesystem without hard
+    links, is only renamed after checking that dst does not exist.
+    """
+    if _renameat2 is not None:
+        if _renameat2(AT_FDCWD, os.fsencode(src), AT_FDCWD, os.fsencode(dst), RENAME_NOREPLACE) == 0:
+            return
+        error = ctypes.get_errno()
+        if error not in (errno.ENOSYS, errno.EINVAL):
+            raise OSError(error, os.strerror(error), src, None, dst)
+    if not os.path.isdir(src) or os.path.islink(src):
+        try:
+            os.link(src, dst, follow_symlinks=False)
+        except OSError as e:
+            if e.errno not in (errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP):
+                raise
+        else:
+            os.remove(src)
+            return
+    if os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+    os.rename(src, dst)
+
+
+def _copy_chunks(copy_chunk, size, progress):
+    """Call copy_chunk(offset, count) until size bytes are copied"""
+    offset = 0
+    while offset < size:
+        copied = copy_chunk(offset, min(COPY_CHUNK_SIZE, size - offset))
+        if copied == 0:
+            break  # the file shrank meanwhile
+        offset += copied
+        progress(copied)
+    return offset
+
+
+def copy_file(src, dst, progress=lambda nbytes: None):
+    """Copy a file without moving its data through user space if possible
+
+    Tries a reflink clone, then os.copy_file_range, then os.sendfile and
+    only then falls back to reading and writing. progress(nbytes) is called
+    as data is copied. Returns the name of the method that was used.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(src_fd).st_size
+
+        if _clone(src_fd, dst_fd):
+            progress(size)
+            method = 'clone'
+        else:
+            methods = []
+            if hasattr(os, 'copy_file_range'):
+                methods.append(('copy_file_range', lambda offset, count: os.copy_file_range(
+                    src_fd, dst_fd, count, offset, offset)))
+            if hasattr(os, 'sendfile'):
+                methods.append(('sendfile', lambda offset, count: os.sendfile(dst_fd, src_fd, offset, count)))
+            method = None
+            for name, copy_chunk in methods:
+                try:
+                    _copy_chunks(copy_chunk, size, progress)
+                    method = name
+                    break
+                except OSError as e:
+                    # Only give up on a method that failed before copying anything
+                    if e.errno not in UNSUPPORTED_ERRNOS or os.fstat(dst_fd).st_size:
+                        raise
+            if method is None:
+                while True:
+                    chunk = fsrc.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    fdst.write(chunk)
+                    progress(len(chunk))
+                method = 'read'
+    shutil.copystat(src, dst)
+    return method
+
+
+class TransferStore:
+    """Server-side copies and moves, with their progress kept on disk
+
+    Each transfer keeps in the store directory, which lives on the same
+    filesystem as the uploads tree:
+
+    - <id>.json:     what is copied where, its status and progress
+    - <id>.partial:  the copy being made, renamed into place once complete
+
+    so a half-done copy never shows up in the tree and any worker process
+    can report on a transfer another one runs.
+    """
+
+    def __init__(self, directory, save_interval=0.5, retention=24 * 3600, stale_after=600):
+        self.directory = directory
+        self.save_interval = save_interval
+        self.retention = retention
+        self.stale_after = stale_after
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, transfer_id, suffix):
+        if not TRANSFER_ID_RE.match(transfer_id):
+            raise TransferError('Transfer not found!', 404)
+        return os.path.join(self.directory, transfer_id + suffix)
+
+    def _save(self, transfer):
+        transfer['updated_at'] = time.time()
+        temp_path = self._path(transfer['id'], '.json.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(transfer, f)
+        os.replace(temp_path, self._path(transfer['id'], '.json'))
+
+    def create(self, kind, source, target, total_bytes, total_files):
+        """Register a copy or move of source (a disk path) to target"""
+        self.expire()
+        transfer = {
+            'id': secrets.token_hex(16),
+            'kind': kind,
+            'source': source,
+            'target': target,
+            'status': 'running',
+            'total_bytes': total_bytes,
+            'total_files': total_files,
+            'copied_bytes': 0,
+            'copied_files': 0,
+            'methods': {},
+            'error': None,
+            'started_at': time.time(),
+            'finished_at': None
+        }
+        self._save(transfer)
+        return transfer
+
+    def get(self, transfer_id):
+        try:
+            with open(self._path(transfer_id, '.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise TransferError('Transfer not found!', 404)
+
+    def expire(self):
+        """Forget finished transfers past retention and fail the abandoned ones"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                transfer = self.get(name[:-len('.json')])
+            except TransferError:
+                continue
+            if transfer['status'] == 'running' and now - transfer['updated_at'] > self.stale_after:
+                # Its process went away in the middle of the copy
+                self._remove_partial(transfer['id'])
+                self._finish(transfer, 'Transfer was interrupted!')
+            elif transfer['status'] != 'running' and now - transfer['finished_at'] > self.retention:
+                os.remove(self._path(transfer['id'], '.json'))
+
+    def _remove_partial(self, transfer_id):
+        partial = self._path(transfer_id, '.partial')
+        if os.path.isdir(partial) and not os.path.islink(partial):
+            shutil.rmtree(partial, ignore_errors=True)
+        elif os.path.lexists(partial):
+            os.remove(partial)
+
+    def _finish(self, transfer, error=None):
+        transfer['status'] = 'failed' if error else 'done'
+        transfer['error'] = error
+        transfer['finished_at'] = time.time()
+        self._save(transfer)
+
+    def run(self, transfer, link=False):
+        """Carry out a transfer, returns it with its final status
+
+        A copy is made under <id>.partial and renamed to the target. A move
+        is a rename, or a copy followed by removing the source when they
+        are on different devices. Neither replaces a target created since
+        the transfer was started. With link, files are copied as hard links
+        to the same inode, for trees whose files are never rewritten in place.
+        """
+        source, target = transfer['source'], transfer['target']
+        try:
+            if transfer['kind'] == 'move':
+                try:
+                    rename_noreplace(source, target)
+                    transfer['copied_bytes'] = transfer['total_bytes']
+                    transfer['copied_files'] = transfer['total_files']
+                    transfer['methods'] = {'rename': transfer['total_files']}
+                    self._finish(transfer)
+                    return transfer
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+
+            partial = self._path(transfer['id'], '.partial')
+            self._copy(transfer, source, partial, link)
+            rename_noreplace(partial, target)
+            if transfer['kind'] == 'move':
+                if os.path.isdir(source) and not os.path.islink(source):
+                    shutil.rmtree(source)
+                else:
+                    os.remove(source)
+            self._finish(transfer)
+        except FileExistsError:
+            self._remove_partial(transfer['id'])
+            self._finish(transfer, 'An item with that name already exists!')
+        except OSError as e:
+            self._remove_partial(transfer['id'])
+            self._finish(transfer, f'Error copying item: {e.strerror or e}')
+        return transfer
+
+    def _copy(self, transfer, source, destination, link):
+        last_save = time.monotonic()
+
+        def progress(nbytes=0, files=0):
+            nonlocal last_save
+            transfer['copied_bytes'] += nbytes
+            transfer['copied_files'] += files
+            if time.monotonic() - last_save >= self.save_interval:
+                last_save = time.monotonic()
+                self._save(transfer)
+
+        def copy_one(src, dst):
+            if link:
+                try:
+                    os.link(src, dst)
+                    method = 'link'
+                    progress(os.path.getsize(src))
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+                        raise
+                    method = copy_file(src, dst, progress)
+            else:
+                method = copy_file(src, dst, progress)
+            transfer['methods'][method] = transfer['methods'].get(method, 0) + 1
+            progress(files=1)
+
+        if not os.path.isdir(source):
+            return copy_one(source, destination)
+        for dirpath, dirnames, filenames in os.walk(source):
+            target_dir = os.path.join(destination, os.path.relpath(dirpath, source))
+            os.makedirs(target_dir, exist_ok=True)
+            for name in filenames:
+                src = os.path.join(dirpath, name)
+                if os.path.islink(src):
+                    os.symlink(os.readlink(src), os.path.join(target_dir, name))
+                else:
+                    copy_one(src, os.path.join(target_dir, name))
+            for name in dirnames:
+                if os.path.islink(os.path.join(dirpath, name)):
+                    os.symlink(os.readlink(os.path.join(dirpath, name)), os.path.join(target_dir, name))
@@ -0,0 +1,175 @@
+import json
+import os
+import secrets
+import time
+
+import fsops
+
+PURGING_SUFFIX = '.purging'
+
+
+class TrashError(Exception):
+    """A trash operation that cannot be carried out"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Trash:
+    """Deleted items waiting to be purged in the background
+
+    Deleting is a single rename of the item into directory, which must be
+    on the same filesystem as uploads. Each item gets an id and keeps:
+
+    - <id>/<name>:  the item itself
+    - <id>.json:    where it came from, when, its size and purge progress
+    - <id>.hashes:  content hashes to release once purged (dedup storage)
+
+    Items can be restored until retention seconds have passed. The purger
+    then claims an item by renaming <id> to <id>.purging, which makes a
+    concurrent restore fail cleanly, and unlinks its files at no more than
+    rate files per second so the disk stays responsive for requests.
+    """
+
+    def __init__(self, directory, retention=3600, rate=2000, on_purged=None):
+        self.directory = directory
+        self.retention = retention
+        self.rate = rate
+        self.on_purged = on_purged
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, item_id, suffix=''):
+        if not item_id.isalnum():
+            raise TrashError('Item not found in trash!', 404)
+        return os.path.join(self.directory, item_id + suffix)
+
+    def _write_info(self, info):
+        temp_path = self._path(info['id'], '.json.tmp')
+        with fsops.open(temp_path, 'w') as f:
+            json.dump(info, f)
+        fsops.replace(temp_path, self._path(info['id'], '.json'))
+
+    def move_in(self, disk_path, original_path, size=0, file_count=0, content_hashes=()):
+        """Move disk_path into the trash and return its entry"""
+        item_id = secrets.token_hex(8)
+        name = os.path.basename(disk_path)
+        fsops.mkdir(self._path(item_id))
+        if content_hashes:
+            with fsops.open(self._path(item_id, '.hashes'), 'w') as f:
+                f.write('\n'.join(content_hashes))
+        info = {
+            'id': item_id,
+            'name': name,
+            'original_path': original_path,
+            'is_dir': fsops.isdir(disk_path),
+            'size': size,
+            'file_count': file_count,
+            'deleted_at': time.time(),
+            'purged_files': 0
+        }
+        self._write_info(info)
+        try:
+            fsops.rename(disk_path, os.path.join(self._path(item_id), name))
+        except OSError:
+            fsops.rmdir(self._path(item_id))
+            self._forget(item_id)
+            raise
+        return info
+
+    def get(self, item_id):
+        try:
+            with fsops.open(self._path(item_id, '.json')) as f:
+                info = json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise TrashError('Item not found in trash!', 404)
+        info['purge_after'] = info['deleted_at'] + self.retention
+        info['status'] = 'purging' if fsops.exists(self._path(item_id, PURGING_SUFFIX)) else 'pending'
+        return info
+
+    def entries(self):
+        """Every item in the trash, oldest first"""
+        items = []
+        for name in fsops.listdir(self.directory):
+            if name.endswith('.json'):
+                try:
+                    items.append(self.get(name[:-len('.json')]))
+                except TrashError:
+                    pass  # purged meanwhile
+        return sorted(items, key=lambda info: info['deleted_at'])
+
+    def restore(self, item_id, target_path):
+        """Move an item back to target_path"""
+        info = self.get(item_id)
+        if fsops.exists(target_path):
+            raise TrashError('An item with this name already exists!', 409)
+        fsops.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            fsops.rename(os.path.join(self._path(item_id), info['name']), target_path)
+        except FileNotFoundError:
+            raise TrashError('Item is already being purged!', 409)
+        fsops.rmdir(self._path(item_id))
+        self._forget(item_id)
+        return info
+
+    def _forget(self, item_id):
+        for suffix in ('.json', '.hashes'):
+            try:
+                fsops.remove(self._path(item_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def purge(self, info):
+        """Delete an item for good, at no more than rate files per second"""
+        item_id = info['id']
+        claimed = self._path(item_id, PURGING_SUFFIX)
+        try:
+            os.rename(self._path(item_id), claimed)
+        except FileNotFoundError:
+            if not os.path.isdir(claimed):
+                return self._forget(item_id)  # restored meanwhile
+
+        started = time.monotonic()
+        last_report = started
+        purged = 0
+        for dirpath, dirnames, filenames in os.walk(claimed, topdown=False):
+            for name in filenames:
+                try:
+                    os.remove(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    pass
+                purged += 1
+                ahead = purged / self.rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+                if time.monotonic() - last_report >= 1:
+                    last_report = time.monotonic()
+                    info['purged_files'] = purged
+                    self._write_info(info)
+            for name in dirnames:
+                path = os.path.join(dirpath, name)
+                if os.path.islink(path):
+                    os.remove(path)
+                else:
+                    os.rmdir(path)
+        os.rmdir(claimed)
+
+        if self.on_purged is not None:
+            try:
+                with open(self._path(item_id, '.hashes')) as f:
+                    content_hashes = f.read().split()
+            except FileNotFoundError:
+                content_hashes = []
+            self.on_purged(content_hashes)
+        self._forget(item_id)
+
+    def run_forever(self, poll_interval=5):
+        """Purge items past their retention, for the background purger thread"""
+        while True:
+            for info in self.entries():
+                if info['status'] == 'purging' or info['purge_after'] <= time.time():
+                    try:
+                        self.purge(info)
+                    except OSError:
+                        pass  # retried on the next pass
+            time.sleep(poll_interval)
@@ -0,0 +1,88 @@
+import io
+import os
+import zipfile
+
+from metadata_index import INTERNAL_DIR_NAME
+
+# Formats that are already compressed and are stored as they are
+STORED_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'mp3', 'mp4', 'zip', 'rar', 'docx', 'xlsx', 'pptx'
+}
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Write-only, unseekable sink that zipfile writes to and the response drains"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_folder_files(folder):
+    """Yield (disk path, archive name, is_dir) below folder in a stable order
+
+    Folders without any entries are yielded so they survive in the archive.
+    """
+    base = os.path.basename(os.path.normpath(folder))
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = sorted(d for d in dirnames if d != INTERNAL_DIR_NAME)
+        relative = os.path.relpath(dirpath, folder)
+        prefix = base if relative == '.' else os.path.join(base, relative)
+        if not dirnames and not filenames:
+            yield dirpath, prefix.replace(os.sep, '/') + '/', True
+        for name in sorted(filenames):
+            yield os.path.join(dirpath, name), os.path.join(prefix, name).replace(os.sep, '/'), False
+
+
+def _write_archive(buffer, folder):
+    """Write the archive of folder to buffer, pausing whenever it holds new data"""
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for path, arcname, is_dir in iter_folder_files(folder):
+            try:
+                info = zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=False)
+                if is_dir:
+                    archive.writestr(info, b'')
+                    yield
+                    continue
+                f = open(path, 'rb')
+            except OSError:
+                continue  # removed while the archive was being built
+            with f:
+                extension = os.path.splitext(path)[1].lower().lstrip('.')
+                info.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                with archive.open(info, 'w') as member:
+                    for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                        member.write(chunk)
+                        yield
+            yield
+
+
+def stream_zip(folder):
+    """Yield a zip archive of folder chunk by chunk
+
+    The archive is written to an unseekable buffer, so zipfile emits data
+    descriptors after each member instead of seeking back, and the buffer is
+    drained after every chunk: memory stays bounded by one read chunk and
+    nothing is written to disk. Members are declared with their size, so
+    zipfile switches to ZIP64 for large ones (and for the central
+    directory) by itself.
+    """
+    buffer = _StreamBuffer()
+    for _ in _write_archive(buffer, folder):
+        data = buffer.drain()
+        if data:
+            yield data
+    yield buffer.drain()